@@ -0,0 +1,214 @@
+# benchmarks dotgit's actions end-to-end on generated home directories and
+# repos. every action is run through dotgit.__main__.main the same way it is
+# run from the command line. run from the root of the repo with
+#
+#   python3 benchmarks/actions.py [-s 1000,10000] [-m plain,hard] [-r 3]
+#                                 [-o results.json] [-c old.json]
+#
+# the results can be saved as JSON (-o) and compared with the results of an
+# earlier run (-c) to find regressions between versions. the encrypt mode
+# (-m encrypt) needs gpg to be installed and is a lot slower since every file
+# goes through gpg, so it isn't run by default. it uses a temporary gpg home
+# directory, so your own gpg setup is left alone
+
+import os
+import sys
+import json
+import shutil
+import contextlib
+import getpass
+import logging
+import argparse
+import platform
+import subprocess
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dotgit.__main__ import main as dotgit  # noqa: E402
+import dotgit.info as info  # noqa: E402
+
+MODES = ['plain', 'hard', 'hardlink', 'encrypt']
+# the actions in the order they are run, each one starts from the state left
+# behind by the previous one. the first update moves all the files into the
+# repo while the second one finds nothing to do
+ACTIONS = ['update', 'update-noop', 'diff', 'commit', 'clean', 'restore']
+
+PASSWORD = 'benchmark'
+
+
+# writes a filelist with files spread over categories, with every file in a
+# couple of categories, and a few groups of categories
+def write_filelist(fname, files, categories=10, plugin=None):
+    suffix = f'|{plugin}' if plugin else ''
+    with open(fname, 'w') as f:
+        f.write('common=' + ','.join(f'cat{i}' for i in range(0, categories,
+                                                              3)) + '\n')
+        f.write('other=' + ','.join(f'cat{i}' for i in range(1, categories,
+                                                             3)) + '\n')
+        for i in range(files):
+            cats = {f'cat{i % categories}', f'cat{(i * 7) % categories}'}
+            f.write(f'dir{i % 50}/sub{i % 7}/file{i}:{",".join(sorted(cats))}'
+                    f'{suffix}\n')
+
+
+# creates the files of the filelist in the home directory
+def write_home(home, files):
+    for i in range(files):
+        path = os.path.join(home, f'dir{i % 50}', f'sub{i % 7}', f'file{i}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(f'file {i}\n' * (i % 64 + 1))
+
+
+# silences the output of dotgit and the commands it runs
+@contextlib.contextmanager
+def quiet():
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    os.close(devnull)
+    try:
+        with open(os.devnull, 'w') as f, contextlib.redirect_stdout(f):
+            yield
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        os.close(saved[0])
+        os.close(saved[1])
+
+
+# points gpg at an empty home directory inside tmp while the benchmark runs,
+# so that it doesn't use (or change) the user's ~/.gnupg
+@contextlib.contextmanager
+def gnupg_home(tmp):
+    path = os.path.join(tmp, 'gnupg')
+    os.makedirs(path, mode=0o700)
+    saved = os.environ.get('GNUPGHOME')
+    os.environ['GNUPGHOME'] = path
+    try:
+        yield
+    finally:
+        # stop the agent that gpg started for the directory before it is
+        # deleted
+        if shutil.which('gpgconf') is not None:
+            subprocess.run(['gpgconf', '--kill', 'gpg-agent'],
+                           stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL)
+        if saved is None:
+            del os.environ['GNUPGHOME']
+        else:
+            os.environ['GNUPGHOME'] = saved
+
+
+def run(args, repo, home):
+    start = timeit.default_timer()
+    with quiet():
+        status = dotgit(args=args, cwd=repo, home=home)
+    if status != 0:
+        raise RuntimeError(f'dotgit {" ".join(args)} failed')
+    return timeit.default_timer() - start
+
+
+# runs all the actions on a generated home directory with files files and
+# returns how long each one took
+def bench(files, mode):
+    flags = {'hard': ['--hard'],
+             'hardlink': ['--link-mode=hard']}.get(mode, [])
+    plugin = 'encrypt' if mode == 'encrypt' else None
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.ExitStack() as stack:
+        if mode == 'encrypt':
+            stack.enter_context(gnupg_home(tmp))
+        home, repo = os.path.join(tmp, 'home'), os.path.join(tmp, 'repo')
+        os.makedirs(home)
+        os.makedirs(repo)
+
+        run(['init'], repo, home)
+        write_filelist(os.path.join(repo, 'filelist'), files, plugin=plugin)
+        write_home(home, files)
+
+        for action in ACTIONS:
+            args = flags + [action.split('-')[0], 'common', 'other']
+            if action == 'commit':
+                args = ['commit']
+            results[action] = run(args, repo, home)
+
+    return results
+
+
+def compare(results, fname):
+    with open(fname, 'r') as f:
+        old = {(r['files'], r['mode'], r['action']): r['seconds'] for r in
+               json.load(f)['results']}
+
+    print(f'\ncompared to {fname}:')
+    for r in results:
+        key = (r['files'], r['mode'], r['action'])
+        if key in old and old[key] > 0:
+            change = (r['seconds'] - old[key]) / old[key] * 100
+            print(f'{r["files"]:>8} {r["mode"]:>8} {r["action"]:>12} '
+                  f'{change:+7.1f}%')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', '-s', default='1000,10000',
+                        help='comma-separated numbers of files to benchmark '
+                        'with (default: %(default)s)')
+    parser.add_argument('--modes', '-m', default='plain,hard',
+                        help='comma-separated modes to benchmark, out of '
+                        f'{",".join(MODES)} (default: %(default)s)')
+    parser.add_argument('--repeat', '-r', type=int, default=1,
+                        help='run every benchmark this many times and keep '
+                        'the fastest time (default: %(default)s)')
+    parser.add_argument('--output', '-o', help='save the results as JSON')
+    parser.add_argument('--compare', '-c', help='compare the results with '
+                        'the results saved in a JSON file')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    modes = args.modes.split(',')
+    if any(mode not in MODES for mode in modes):
+        parser.error(f'modes must be one of {",".join(MODES)}')
+    if 'encrypt' in modes and shutil.which('gpg') is None:
+        print('gpg not found, skipping the encrypt mode')
+        modes.remove('encrypt')
+
+    # the encrypt plugin asks for the password and the commit needs a git
+    # identity
+    getpass.getpass = lambda prompt='': PASSWORD
+    for var in ['GIT_AUTHOR', 'GIT_COMMITTER']:
+        os.environ.setdefault(f'{var}_NAME', 'dotgit benchmark')
+        os.environ.setdefault(f'{var}_EMAIL', 'benchmark@dotgit')
+    logging.disable(logging.WARNING)
+
+    results = []
+    print(f'{"files":>8} {"mode":>8} {"action":>12} {"seconds":>9}')
+    for files in sizes:
+        for mode in modes:
+            runs = [bench(files, mode) for _ in range(args.repeat)]
+            for action in ACTIONS:
+                seconds = min(r[action] for r in runs)
+                print(f'{files:>8} {mode:>8} {action:>12} {seconds:>9.3f}')
+                results.append({'files': files, 'mode': mode,
+                                'action': action, 'seconds': seconds})
+
+    if args.compare:
+        compare(results, args.compare)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'version': info.__version__,
+                       'python': platform.python_version(),
+                       'machine': platform.machine(),
+                       'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+# benchmarks parsing the filelist and Filelist.activate on large generated
+# filelists. run from the root of the repo with
+#
+#   python3 benchmarks/activate.py [entries]
+
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from dotgit.flists import Filelist  # noqa: E402
+
+
+def write_filelist(fname, entries, categories=20):
+    with open(fname, 'w') as f:
+        f.write('group=' + ','.join(f'cat{i}' for i in range(0, categories,
+                                                             2)) + '\n')
+        for i in range(entries):
+            # spread the files over a couple of categories each
+            cats = {f'cat{i % categories}', f'cat{(i * 7) % categories}'}
+            f.write(f'dir{i % 100}/file{i}:{",".join(sorted(cats))}\n')
+
+
+def main():
+    entries = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fname = os.path.join(tmp, 'filelist')
+        write_filelist(fname, entries)
+
+        start = timeit.default_timer()
+        flist = Filelist(fname)
+        print(f'parsed {entries} entries in '
+              f'{timeit.default_timer() - start:.3f}s')
+
+        cache = os.path.join(tmp, 'cache')
+        Filelist(fname, cache=cache)
+        start = timeit.default_timer()
+        Filelist(fname, cache=cache)
+        print(f'loaded cached filelist in '
+              f'{timeit.default_timer() - start:.3f}s')
+
+        for categories in [['cat0'], ['cat0', 'cat1', 'cat2'], ['group']]:
+            runs = 10
+            duration = timeit.timeit(lambda: flist.activate(categories),
+                                     number=runs) / runs
+            active = len(flist.activate(categories))
+            print(f'activate({categories}): {active} files in '
+                  f'{duration * 1000:.1f}ms')
+
+
+if __name__ == '__main__':
+    main()
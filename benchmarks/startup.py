@@ -0,0 +1,75 @@
+# benchmarks how long dotgit takes to start up, which is what trivial runs
+# (e.g. --version or from shell hooks) mostly consist of. every run is done in
+# a fresh interpreter. run from the root of the repo with
+#
+#   python3 benchmarks/startup.py [runs] [--max-ms MS]
+#
+# with --max-ms the script exits with an error if the median import time of
+# dotgit is above MS milliseconds, so that it can guard against startup
+# regressions (e.g. a heavy module that is imported up front again)
+
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+import timeit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def run(args):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    return subprocess.run([sys.executable] + args, env=env, check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+# returns the cumulative import time (in microseconds) of every module that
+# was imported when importing dotgit, as reported by python -X importtime
+def import_times():
+    proc = run(['-X', 'importtime', '-c', 'import dotgit.__main__'])
+
+    times = {}
+    for line in proc.stderr.decode().splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('runs', type=int, nargs='?', default=20)
+    parser.add_argument('--max-ms', type=float,
+                        help='fail if the median import time of dotgit is '
+                        'above this many milliseconds')
+    args = parser.parse_args()
+
+    imports, walls, modules = [], [], {}
+    for _ in range(args.runs):
+        times = import_times()
+        imports.append(times['dotgit.__main__'] / 1000)
+        for name, cumulative in times.items():
+            modules.setdefault(name, []).append(cumulative / 1000)
+
+        start = timeit.default_timer()
+        run(['-m', 'dotgit', '--version'])
+        walls.append((timeit.default_timer() - start) * 1000)
+
+    median = statistics.median(imports)
+    print(f'import dotgit.__main__: {median:.1f}ms (median of {args.runs})')
+    print(f'dotgit --version: {statistics.median(walls):.1f}ms')
+
+    print('\nslowest imports (cumulative):')
+    slowest = sorted(modules.items(), key=lambda m: -statistics.median(m[1]))
+    for name, times in slowest[1:11]:
+        print(f'  {statistics.median(times):6.1f}ms {name}')
+
+    if args.max_ms is not None and median > args.max_ms:
+        print(f'\nimport time is above {args.max_ms}ms')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,18 +12,20 @@ if __name__ == '__main__':
     mod = os.path.dirname(os.path.realpath(__file__))
     site.addsitedir(os.path.dirname(mod))
 
+# only the modules needed to parse the arguments are imported up front. the
+# rest are imported by the actions that need them so that trivial runs (e.g.
+# --version, --help or from shell hooks) start quickly
 from dotgit.args import Arguments
-from dotgit.enums import Actions
+from dotgit.enums import Actions, LinkMode, Recover
 from dotgit.checks import safety_checks
-from dotgit.flists import Filelist
-from dotgit.git import Git
-from dotgit.calc_ops import CalcOps
-from dotgit.plugins.plain import PlainPlugin
-from dotgit.plugins.encrypt import EncryptPlugin
+from dotgit.profiling import Profiler, phase
+from dotgit.tracing import Tracer, span
 import dotgit.info as info
 
 
 def init_repo(repo_dir, flist):
+    from dotgit.git import Git
+
     git = Git(repo_dir)
     if not os.path.isdir(os.path.join(repo_dir, '.git')):
         logging.info('creating git repo')
@@ -37,12 +39,140 @@ def init_repo(repo_dir, flist):
         logging.info('creating empty filelist')
         open(flist, 'w').close()
         git.add(os.path.basename(flist))
+
+        # the machine-local files dotgit keeps in .plugins (caches, the
+        # index and the journal) are ignored from the start, otherwise
+        # writing them for the first time shows up as a change to the repo
+        from dotgit.index import gitignore
+        plugins_data_dir = os.path.join(repo_dir, '.plugins')
+        os.makedirs(plugins_data_dir, exist_ok=True)
+        for name in ['index', 'touched', 'filelist', 'globs', 'journal',
+                     'trash']:
+            gitignore(os.path.join(plugins_data_dir, name))
+        git.add(os.path.join('.plugins', '.gitignore'))
         changed = True
     else:
         logging.warning('existing filelist, not recreating')
 
     if changed:
-        git.commit()
+        git.commit(git.gen_commit_message(ignore=['.plugins/']))
+
+
+# parses the filelist (re-using the cached parsed filelist if it didn't
+# change), expands its glob and directory entries and activates the
+# categories. returns the active filelist along with the manifest of all the
+# files in the filelist (used for cleaning the repo)
+def read_filelist(flist_fname, plugins_data_dir, home, dotfiles, args):
+    from dotgit.flists import Filelist
+    from dotgit.globs import GlobCache
+
+    filelist = Filelist(flist_fname,
+                        cache=os.path.join(plugins_data_dir, 'filelist'))
+    globs = GlobCache(os.path.join(plugins_data_dir, 'globs'))
+    filelist.expand(home, dotfiles, globs)
+    if not args.dry_run:
+        globs.save()
+
+    manifest = filelist.manifest()
+    return filelist.activate(args.categories), manifest
+
+
+# calculates and applies the file operations for action on the files in the
+# active filelist. the repo is also cleaned unless manifest is None. the
+# operations are recorded in journal if it is given. raises a RuntimeError if
+# the operations could not be calculated
+def apply_ops(action, filelist, manifest, home, plugins, plugin_dirs,
+              conflicts, args, journal=None):
+    from dotgit.calc_ops import CalcOps, plan_many
+    import dotgit.fastcopy as fastcopy
+
+    calcs = {}
+    for plugin in plugins:
+        # filter out filelist paths that use current plugin
+        flist = {path: filelist[path]['categories'] for path in filelist if
+                 filelist[path]['plugin'] == plugin}
+        if not flist:
+            continue
+        logging.debug(f'active filelist for plugin {plugin}: {flist}')
+
+        plugin_dir = plugin_dirs[plugin]
+        calcs[plugin] = (CalcOps(plugin_dir, home, plugins[plugin],
+                                 conflicts), flist)
+
+    # every plugin's ops are planned before any of them are applied, so that
+    # stopping because of a conflict doesn't leave some of the plugins' files
+    # changed
+    with phase('plan'):
+        if action == Actions.CLEAN:
+            ops = [calc_ops.clean(flist) for calc_ops, flist in
+                   calcs.values()]
+        else:
+            name = 'sync_file' if action == Actions.UPDATE else 'restore_file'
+            ops = plan_many([(calc_ops, flist, getattr(calc_ops, name)) for
+                             calc_ops, flist in calcs.values()])
+
+    clean_ops = []
+    for (plugin, (calc_ops, flist)), fops in zip(calcs.items(), ops):
+        with phase(f'apply ({plugin})'):
+            fops.apply(args.dry_run, args.jobs, journal)
+
+        if manifest is not None:
+            with phase(f'clean repo ({plugin})'):
+                clean_ops.append(calc_ops.clean_repo(manifest[plugin]))
+                plugins[plugin].clean_data(manifest[plugin])
+        elif not args.dry_run:
+            # the data is otherwise saved when it is cleaned, it has to match
+            # the files in the repo before the changes are committed
+            plugins[plugin].save_data()
+
+    # execute cleaning ops after everything else
+    with phase('apply (clean repo)'):
+        for clean_op in clean_ops:
+            clean_op.apply(args.dry_run, args.jobs, journal)
+
+    fastcopy.log_summary()
+
+
+# sets up the plugins with the settings that were saved along with a plan
+def use_settings(plugins, settings):
+    plugins['plain'].hard = settings['hard']
+    # plans from before the hardlink mode don't have the setting
+    plugins['plain'].hardlink = settings.get('hardlink', False)
+
+
+# returns the files that need to be watched for the watch action, mapped to
+# their filelist paths. the filelist itself is mapped to its own path
+def watch_targets(filelist, home, plugin_dirs, flist_fname):
+    targets = {flist_fname: flist_fname}
+    for path in filelist:
+        targets[os.path.join(home, path)] = path
+        plugin_dir = plugin_dirs[filelist[path]['plugin']]
+        for category in filelist[path]['categories']:
+            targets[os.path.join(plugin_dir, category, path)] = path
+    return targets
+
+
+# stages the changes in the repo and commits them. returns False if there
+# were no changes to commit
+def commit_changes(git, index):
+    # only stage the paths that dotgit changed (along with changes to tracked
+    # files, which only needs git's index to be checked) instead of scanning
+    # the whole repo for untracked files. if the journal of changed paths is
+    # incomplete fall back to staging everything
+    touched = index.touched_paths()
+    if touched is None:
+        git.add()
+    else:
+        git.add_paths(touched + ['filelist', '.plugins'])
+        git.add_tracked()
+
+    if not git.staged():
+        return False
+
+    message = git.gen_commit_message(ignore=['.plugins/'])
+    git.commit(message or 'Updated plugin data')
+    index.clear_touched()
+    return True
 
 
 def main(args=None, cwd=os.getcwd(), home=info.home):
@@ -54,6 +184,33 @@ def main(args=None, cwd=os.getcwd(), home=info.home):
     logging.basicConfig(format='%(message)s ', level=args.verbose_level)
     logging.debug(f'ran with arguments {args}')
 
+    profiler = Profiler() if args.profile else None
+    tracer = Tracer() if args.trace is not None else None
+    if profiler is None and tracer is None:
+        return run(args, cwd, home)
+
+    for p in [profiler, tracer]:
+        if p is not None:
+            p.install()
+    try:
+        with span(args.action.value, 'dotgit'):
+            return run(args, cwd, home)
+    finally:
+        if tracer is not None:
+            tracer.uninstall()
+            with open(os.path.join(cwd, args.trace), 'w') as f:
+                f.write(tracer.json())
+
+        if profiler is not None:
+            profiler.uninstall()
+            if args.profile_json is None:
+                print(profiler.table(), file=sys.stderr)
+            else:
+                with open(os.path.join(cwd, args.profile_json), 'w') as f:
+                    f.write(profiler.json())
+
+
+def run(args, cwd, home):
     repo = cwd
     flist_fname = os.path.join(repo, 'filelist')
 
@@ -67,89 +224,240 @@ def main(args=None, cwd=os.getcwd(), home=info.home):
         init_repo(repo, flist_fname)
         return 0
 
-    # parse filelist
-    filelist = Filelist(flist_fname)
-    # generate manifest for later cleaning
-    manifest = filelist.manifest()
-    # activate categories on filelist
+    from dotgit.git import Git
+    from dotgit.calc_ops import CalcOps, plan_many
+    from dotgit.conflicts import ConflictResolver
+    from dotgit.index import Index
+    from dotgit.plugins.plain import PlainPlugin
+    from dotgit.plugins.encrypt import EncryptPlugin
+    from dotgit.journal import Journal
+
+    # set the dotfiles repo
+    dotfiles = os.path.join(repo, 'dotfiles')
+    logging.debug(f'dotfiles path is {dotfiles}')
+
+    plugins_data_dir = os.path.join(repo, '.plugins')
     try:
-        filelist = filelist.activate(args.categories)
+        with phase('filelist'):
+            filelist, manifest = read_filelist(flist_fname, plugins_data_dir,
+                                               home, dotfiles, args)
     except RuntimeError:
         return 1
 
-    # set up git interface
-    git = Git(repo)
+    # set up git interface. dotgit doesn't change the repo behind git's back
+    # while the git commands are run so the repo's status can be cached
+    git = Git(repo, cache=True)
 
-    # set the dotfiles repo
-    dotfiles = os.path.join(repo, 'dotfiles')
-    logging.debug(f'dotfiles path is {dotfiles}')
+    # load the index which is used to skip files that have not changed since
+    # the last run
+    index = Index(os.path.join(plugins_data_dir, 'index'), root=repo)
 
     # init plugins
-    plugins_data_dir = os.path.join(repo, '.plugins')
     plugins = {
         'plain': PlainPlugin(
             data_dir=os.path.join(plugins_data_dir, 'plain'),
             repo_dir=os.path.join(dotfiles, 'plain'),
-            hard=args.hard_mode),
+            index=index,
+            hard=args.hard_mode,
+            hardlink=args.link_mode == LinkMode.HARD),
         'encrypt': EncryptPlugin(
             data_dir=os.path.join(plugins_data_dir, 'encrypt'),
-            repo_dir=os.path.join(dotfiles, 'encrypt'))
+            repo_dir=os.path.join(dotfiles, 'encrypt'),
+            index=index)
     }
 
     plugin_dirs = {plugin: os.path.join(dotfiles, plugin) for plugin in
                    plugins}
 
-    if args.action in [Actions.UPDATE, Actions.RESTORE, Actions.CLEAN]:
-        clean_ops = []
+    # decides what to do when there are conflicting versions of a file
+    conflicts = ConflictResolver(args.conflict)
+
+    # the settings that change how the plugins work, these are saved along
+    # with plans and journals
+    settings = {'hard': args.hard_mode,
+                'hardlink': args.link_mode == LinkMode.HARD}
+
+    # the file operations are journaled so that they can be recovered if
+    # they are interrupted. no more changes can be made until an interrupted
+    # run is recovered
+    journal = Journal(plugins_data_dir, home, repo, plugins, index, settings)
+    if journal.exists() and args.action in [
+            Actions.UPDATE, Actions.RESTORE, Actions.CLEAN, Actions.WATCH,
+            Actions.APPLY]:
+        logging.error('an earlier run of dotgit was interrupted, '
+                      f'{journal.hint}')
+        return 1
 
-        # calculate and apply file operations
+    if args.action in [Actions.UPDATE, Actions.RESTORE, Actions.CLEAN]:
+        try:
+            apply_ops(args.action, filelist, manifest, home, plugins,
+                      plugin_dirs, conflicts, args, journal)
+        except RuntimeError:
+            return 1
+
+        if not args.dry_run:
+            with phase('save index'):
+                index.save()
+
+    elif args.action == Actions.WATCH:
+        from dotgit.watch import Watcher
+
+        try:
+            watcher = Watcher(watch_targets(filelist, home, plugin_dirs,
+                                            flist_fname))
+        except RuntimeError:
+            return 1
+        logging.info('watching for changes, press Ctrl-C to stop')
+
+        # None means that all the files need to be updated
+        changed = None
+        try:
+            while True:
+                if changed is None:
+                    active, active_manifest = filelist, manifest
+                else:
+                    # the repo only needs to be cleaned when files are
+                    # removed from the filelist
+                    active = {p: filelist[p] for p in changed if p in
+                              filelist}
+                    active_manifest = None
+                    logging.info(f'changes detected: {sorted(active)}')
+
+                try:
+                    apply_ops(Actions.UPDATE, active, active_manifest, home,
+                              plugins, plugin_dirs, conflicts, args, journal)
+                except RuntimeError:
+                    logging.warning('unable to update all the files, '
+                                    'waiting for more changes')
+
+                if not args.dry_run:
+                    index.save()
+                    if args.auto_commit and commit_changes(git, index):
+                        logging.info('committed changes')
+
+                changed = watcher.wait()
+                if changed is not None and flist_fname in changed:
+                    logging.info('filelist changed, reloading')
+                    try:
+                        filelist, manifest = read_filelist(
+                            flist_fname, plugins_data_dir, home, dotfiles,
+                            args)
+                    except RuntimeError:
+                        logging.warning('unable to read filelist, keeping '
+                                        'the previous one')
+                    watcher.update(watch_targets(filelist, home, plugin_dirs,
+                                                 flist_fname))
+                    changed = None
+        except KeyboardInterrupt:
+            logging.info('stopped watching for changes')
+        finally:
+            watcher.close()
+
+    elif args.action == Actions.PLAN:
+        from dotgit.plan import Plan
+
+        # plan the restore so that it can be applied later, possibly on other
+        # machines
+        plan = Plan(home, repo, plugins, index)
+        plans = []
         for plugin in plugins:
-            # filter out filelist paths that use current plugin
             flist = {path: filelist[path]['categories'] for path in filelist if
                      filelist[path]['plugin'] == plugin}
             if not flist:
                 continue
-            logging.debug(f'active filelist for plugin {plugin}: {flist}')
-
-            plugin_dir = plugin_dirs[plugin]
-            calc_ops = CalcOps(plugin_dir, home, plugins[plugin])
 
-            if args.action == Actions.UPDATE:
-                calc_ops.update(flist).apply(args.dry_run)
-                calc_ops.restore(flist).apply(args.dry_run)
-            elif args.action == Actions.RESTORE:
-                calc_ops.restore(flist).apply(args.dry_run)
-            elif args.action == Actions.CLEAN:
-                calc_ops.clean(flist).apply(args.dry_run)
+            calc_ops = CalcOps(plugin_dirs[plugin], home, plugins[plugin],
+                               conflicts)
+            plans.append((calc_ops, flist, calc_ops.restore_file))
 
-            clean_ops.append(calc_ops.clean_repo(manifest[plugin]))
-            plugins[plugin].clean_data(manifest[plugin])
+        try:
+            with phase('plan'):
+                for fops in plan_many(plans):
+                    plan.add(fops)
+        except RuntimeError:
+            return 1
 
-        # execute cleaning ops after everything else
-        for clean_op in clean_ops:
-            clean_op.apply(args.dry_run)
+        content = plan.dump(**settings)
+        if args.output is None:
+            print(content)
+        else:
+            with open(os.path.join(cwd, args.output), 'w') as f:
+                f.write(content)
+        index.save()
+
+    elif args.action == Actions.APPLY:
+        from dotgit.plan import Plan
+        import dotgit.fastcopy as fastcopy
+
+        plan = Plan(home, repo, plugins, index)
+        try:
+            with open(os.path.join(cwd, args.plan_file), 'r') as f:
+                settings = plan.load(f.read())
+            use_settings(plugins, settings)
+            fops = plan.fileops()
+        except OSError as e:
+            logging.error(f'unable to read plan file: {e}')
+            return 1
+        except RuntimeError:
+            return 1
+
+        journal.settings = settings
+        with phase('apply'):
+            fops.apply(args.dry_run, args.jobs, journal)
+        fastcopy.log_summary()
+        if not args.dry_run:
+            index.save()
+
+    elif args.action == Actions.RECOVER:
+        if not journal.exists():
+            logging.warning('no interrupted run found, nothing to recover')
+            return 0
+
+        try:
+            use_settings(plugins, journal.load())
+        except (OSError, ValueError, RuntimeError):
+            logging.error('unable to read the journal of the interrupted run')
+            return 1
+
+        if args.dry_run:
+            logging.info(f'{len(journal.done)} of the '
+                         f'{len(journal.plan.ops)} changes of the interrupted '
+                         'run are done')
+            return 0
+
+        with phase(f'recover ({args.recover.value})'):
+            if args.recover == Recover.ROLLBACK:
+                journal.rollback()
+            else:
+                journal.resume()
+        for plugin in plugins.values():
+            plugin.save_data()
+        index.save()
 
     elif args.action in [Actions.DIFF, Actions.COMMIT]:
         # calculate and apply git operations
         if args.action == Actions.DIFF:
-            print('\n'.join(git.diff(ignore=['.plugins/'])))
+            with phase('git'):
+                print('\n'.join(git.diff(ignore=['.plugins/'])))
 
             for plugin in plugins:
                 calc_ops = CalcOps(plugin_dirs[plugin], home, plugins[plugin])
-                diff = calc_ops.diff(args.categories)
+                with phase(f'diff ({plugin})'):
+                    diff = calc_ops.diff(args.categories)
 
                 if diff:
                     print(f'\n{plugin}-plugin updates not yet in repo:')
                     print('\n'.join(diff))
 
+            index.save()
+
         elif args.action == Actions.COMMIT:
-            if not git.has_changes():
+            with phase('git'):
+                committed = commit_changes(git, index)
+            if not committed:
                 logging.warning('no changes detected in repo, not creating '
                                 'commit')
                 return 0
-            git.add()
-            msg = git.gen_commit_message(ignore=['.plugins/'])
-            git.commit(msg)
 
             if git.has_remote():
                 ans = input('remote for repo detected, push to remote? [Yn] ')
@@ -158,6 +466,8 @@ def main(args=None, cwd=os.getcwd(), home=info.home):
                     git.push()
                     logging.info('successfully pushed to git remote')
 
+        logging.info(git.summary())
+
     elif args.action == Actions.PASSWD:
         logging.debug('attempting to change encryption password')
         repo = os.path.join(dotfiles, 'encrypt')
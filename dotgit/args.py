@@ -1,15 +1,37 @@
 import logging
 import argparse
 
-from dotgit.enums import Actions
+from dotgit.enums import Actions, Conflict, LinkMode, Recover
 import dotgit.info as info
 
 HELP = {
     'verbose': 'increase verbosity level',
     'dry-run': 'do not actually execute any file operations',
-    'hard-mode': 'copy files instead of symlinking them',
+    'hard-mode': 'copy files instead of symlinking them (the same as '
+                 '--link-mode=copy)',
+    'link-mode': 'how to link the files in the home directory to the repo: '
+                 'symlink them (symlink), copy them (copy) or hardlink them '
+                 '(hard) (default: symlink)',
+    'jobs': 'number of file operations to execute in parallel (default: '
+            '%(default)s)',
+    'conflict': 'how to resolve conflicting versions of a file: ask about '
+                'each conflict (ask), ask about all the conflicts at once '
+                '(batch), use the newest version (newest), use the version '
+                'in the repo (repo) or in the home directory (home), skip '
+                'the file (skip) or stop (fail) (default: %(default)s)',
+    'auto-commit': 'commit the changes made by the watch action',
+    'profile': 'print how long each phase of the run took along with counts '
+               'of the expensive calls that were made',
+    'profile-json': 'write the profile to this file as JSON instead of '
+                    'printing it (implies --profile)',
+    'trace': 'write a trace of the run to FILE in the Chrome trace event '
+             'format, which can be viewed with chrome://tracing or Perfetto',
+    'output': 'file to write the plan to for the plan action (default: '
+              'stdout)',
     'action': 'action to take on active categories',
-    'category': 'categories to activate. (default: %(default)s)'
+    'category': 'categories to activate, the plan file to apply for the '
+                'apply action, or either rollback or resume for the recover '
+                'action. (default: %(default)s)'
 }
 
 EPILOG = 'See full the documentation at https://dotgit.readthedocs.io/'
@@ -31,16 +53,61 @@ class Arguments:
                             help=HELP['dry-run'])
         parser.add_argument('--hard', action='store_true',
                             help=HELP['hard-mode'])
+        parser.add_argument('--link-mode', choices=[m.value for m in LinkMode],
+                            help=HELP['link-mode'])
+        parser.add_argument('--jobs', '-j', type=int, default=1,
+                            help=HELP['jobs'])
+        parser.add_argument('--conflict', default=Conflict.ASK.value,
+                            choices=[c.value for c in Conflict],
+                            help=HELP['conflict'])
+        parser.add_argument('--auto-commit', action='store_true',
+                            help=HELP['auto-commit'])
+        parser.add_argument('--profile', action='store_true',
+                            help=HELP['profile'])
+        parser.add_argument('--profile-json', metavar='FILE',
+                            help=HELP['profile-json'])
+        parser.add_argument('--trace', metavar='FILE', help=HELP['trace'])
+        parser.add_argument('--output', '-o', help=HELP['output'])
 
         parser.add_argument('action', choices=[a.value for a in Actions],
                             help=HELP['action'])
+        default_categories = ['common', info.get_hostname()]
         parser.add_argument('category', nargs='*',
-                            default=['common', info.hostname],
+                            default=default_categories,
                             help=HELP['category'])
 
         # parse args
         args = parser.parse_args(args)
 
+        if args.jobs < 1:
+            parser.error('--jobs must be at least 1')
+
+        # --hard is the same as --link-mode=copy
+        if args.link_mode is None:
+            args.link_mode = (LinkMode.COPY if args.hard else
+                              LinkMode.SYMLINK).value
+        elif args.hard and args.link_mode != LinkMode.COPY.value:
+            parser.error('--hard can only be used with --link-mode=copy')
+
+        # the apply action takes the plan file instead of categories
+        self.plan_file = None
+        if args.action == Actions.APPLY.value:
+            if args.category is default_categories or len(args.category) != 1:
+                parser.error('apply needs exactly one plan file')
+            self.plan_file = args.category[0]
+            args.category = default_categories
+
+        # the recover action takes how to recover instead of categories
+        self.recover = None
+        if args.action == Actions.RECOVER.value:
+            modes = [r.value for r in Recover]
+            given = ([] if args.category is default_categories else
+                     args.category)
+            if len(given) != 1 or given[0] not in modes:
+                parser.error(f'recover needs one of {", ".join(modes)}')
+            self.recover = Recover(given[0])
+            args.category = default_categories
+
         # extract settings
         if args.verbose:
             args.verbose = min(args.verbose, 2)
@@ -50,7 +117,17 @@ class Arguments:
             self.verbose_level = logging.WARNING
 
         self.dry_run = args.dry_run
-        self.hard_mode = args.hard
+        self.link_mode = LinkMode(args.link_mode)
+        # in both the copy and hardlink modes the files in the home directory
+        # are regular files rather than symlinks
+        self.hard_mode = self.link_mode != LinkMode.SYMLINK
+        self.jobs = args.jobs
+        self.conflict = Conflict(args.conflict)
+        self.auto_commit = args.auto_commit
+        self.profile = args.profile or args.profile_json is not None
+        self.profile_json = args.profile_json
+        self.trace = args.trace
+        self.output = args.output
         self.action = Actions(args.action)
         self.categories = args.category
 
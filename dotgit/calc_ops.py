@@ -1,164 +1,282 @@
 import os
+import enum
 import logging
 
 from dotgit.file_ops import FileOps
+from dotgit.flists import Manifest
+from dotgit.conflicts import ConflictResolver, Deferred
+from dotgit.tracing import span
+
+
+# what CalcOps.update_file found out about the file in the restore path
+class Dest(enum.Enum):
+    # the file will be removed
+    REMOVED = enum.auto()
+    # the file is the same as the one in the repo
+    SAME = enum.auto()
+    # the file exists and is left alone
+    EXISTS = enum.auto()
+    # the file is a separate copy of the one in the repo and is replaced by
+    # a link to it (see Plugin.broken_link)
+    STALE = enum.auto()
+    # nothing is known about the file
+    UNKNOWN = enum.auto()
+
+
+# plans several sets of files at once, e.g. the files of every plugin. takes a
+# list of (calc_ops, files, plan) tuples, where plan is one of calc_ops'
+# *_file methods, and returns the FileOps for each of them. nothing is
+# applied, so a conflict that stops the run (or any other error) in one of
+# them leaves all the files untouched, and in batch mode the conflicts of all
+# of them are asked about at once
+def plan_many(plans):
+    results = [calc_ops.start(files) for calc_ops, files, plan in plans]
+    pending = [list(files) for calc_ops, files, plan in plans]
+
+    while any(pending):
+        for i, (calc_ops, files, plan) in enumerate(plans):
+            pending[i] = calc_ops.plan_paths(results[i], files, pending[i],
+                                             plan)
+
+        resolvers = []
+        for calc_ops, files, plan in plans:
+            if calc_ops.conflicts not in resolvers:
+                resolvers.append(calc_ops.conflicts)
+        for resolver in resolvers:
+            resolver.ask_pending()
+
+    return results
 
 
 class CalcOps:
-    def __init__(self, repo, restore_path, plugin):
+    def __init__(self, repo, restore_path, plugin, conflicts=None):
         self.repo = str(repo)
         self.restore_path = str(restore_path)
         self.plugin = plugin
+        self.conflicts = (ConflictResolver() if conflicts is None else
+                          conflicts)
+
+    # returns the (repo_file, ext_file) pair of each file's master and its
+    # location in the restore path
+    def pairs(self, files):
+        return [(os.path.join(self.repo, min(files[path]), path),
+                 os.path.join(self.restore_path, path)) for path in files]
+
+    # returns the FileOps that the ops for files are added to, and prepares
+    # the plugin for comparing the files
+    def start(self, files):
+        self.plugin.prefetch(self.pairs(files))
+        return FileOps(self.repo, self.plugin.index)
+
+    # runs plan(fops, path, categories) for every path in paths, adding the
+    # ops to fops. returns the paths with conflicts that were deferred (in
+    # batch mode), these need to be planned again once the conflicts are
+    # answered
+    def plan_paths(self, fops, files, paths, plan):
+        deferred = []
+        for path in paths:
+            start = len(fops.ops)
+            try:
+                with span(path, 'calc_ops', action=plan.__name__):
+                    plan(fops, path, files[path])
+            except Deferred:
+                # drop the ops that were already added for the file
+                del fops.ops[start:]
+                deferred.append(path)
+        return deferred
+
+    # runs plan(fops, path, categories) for every file and returns the
+    # resulting ops. files with conflicts that are deferred (in batch mode)
+    # are planned again once all the conflicts found so far are answered
+    def plan(self, files, plan):
+        return plan_many([(self, files, plan)])[0]
 
     def update(self, files):
-        fops = FileOps(self.repo)
-
-        for path in files:
-            categories = files[path]
-
-            master = min(categories)
-            slaves = [c for c in categories if c != master]
-
-            # checks if a candidate exists and also checks if the candidate is
-            # a link so that its resolved path can be used
-            original_path = {}
-
-            def check_cand(cand):
-                cand = os.path.join(cand, path)
-                if os.path.isfile(cand):
-                    if os.path.islink(cand):
-                        old = cand
-                        cand = os.path.realpath(cand)
-                        original_path[cand] = old
-                    return [cand]
-                return []
-
-            candidates = []
-            candidates += check_cand(self.restore_path)
-
-            # candidate not found in restore path, so check elsewhere
-            if not candidates:
-                for cand in [os.path.join(self.repo, c) for c in categories]:
-                    candidates += check_cand(cand)
-            else:
-                logging.debug(f'"{path}" found in restore path, so overriding '
-                              'any other candidates')
-
-            if not candidates:
-                logging.warning(f'unable to find any candidates for "{path}"')
-                continue
-
-            candidates = list(set(candidates))
-            if len(candidates) > 1:
-                print(f'multiple candidates found for {path}:\n')
-
-                for i, cand in enumerate(candidates):
-                    print(f'[{i}] {cand}')
-                print('[-1] cancel')
-
-                while True:
-                    try:
-                        choice = int(input('please select the version you '
-                                           'would like to use '
-                                           f'[0-{len(candidates)-1}]: '))
-                        choice = candidates[choice]
-                    except (ValueError, EOFError):
-                        print('invalid choice entered, please try again')
-                        continue
-                    break
-                source = choice
-
-                # if one of the candidates is not in the repo and it is not the
-                # source it should be deleted manually since it will not be
-                # deleted in the slave linking below, as the other candidates
-                # would be
-                restore_path = os.path.join(self.restore_path, path)
-                if restore_path in candidates and source != restore_path:
-                    fops.remove(restore_path)
+        return self.plan(files, self.update_file)
 
+    def restore(self, files):
+        return self.plan(files, self.restore_file)
+
+    # plans an update followed by a restore in a single pass. the result is
+    # the same as applying update's ops and then restore's ops, but what
+    # update found out about each file is re-used when restoring it instead of
+    # checking the file again
+    def sync(self, files):
+        return self.plan(files, self.sync_file)
+
+    def sync_file(self, fops, path, categories):
+        dest = self.update_file(fops, path, categories)
+        self.restore_file(fops, path, categories, dest)
+
+    # adds the ops to update path in the repo to fops. returns what is known
+    # about the file in the restore path once the ops are applied (see Dest),
+    # or None if nothing could be updated
+    def update_file(self, fops, path, categories):
+        master = min(categories)
+        slaves = [c for c in categories if c != master]
+
+        # checks if a candidate exists and also checks if the candidate is
+        # a link so that its resolved path can be used
+        original_path = {}
+
+        def check_cand(cand):
+            cand = os.path.join(cand, path)
+            if os.path.isfile(cand):
+                if os.path.islink(cand):
+                    old = cand
+                    cand = os.path.realpath(cand)
+                    original_path[cand] = old
+                return [cand]
+            return []
+
+        candidates = []
+        candidates += check_cand(self.restore_path)
+        restore_path = os.path.join(self.restore_path, path)
+        # the file in the restore path is left alone unless it is removed
+        # below
+        known = Dest.EXISTS if candidates else Dest.UNKNOWN
+
+        # candidate not found in restore path, so check elsewhere
+        if not candidates:
+            for cand in [os.path.join(self.repo, c) for c in categories]:
+                candidates += check_cand(cand)
+        else:
+            logging.debug(f'"{path}" found in restore path, so overriding '
+                          'any other candidates')
+
+        if not candidates:
+            logging.warning(f'unable to find any candidates for "{path}"')
+            return None
+
+        candidates = list(set(candidates))
+
+        # a file in the restore path that should be linked to the master but
+        # isn't is only linked again if nothing changed, otherwise it
+        # conflicts with the master instead of replacing it
+        master_path = os.path.join(self.repo, master, path)
+        if candidates == [restore_path] and self.plugin.broken_link(
+                master_path, restore_path):
+            if self.plugin.samecontent(master_path, restore_path):
+                logging.info(f'{restore_path} is a copy of the file in the '
+                             'repo, linking it again')
+                candidates = [master_path]
+                known = Dest.STALE
             else:
-                source = candidates.pop()
-
-            master = os.path.join(self.repo, master, path)
-            slaves = [os.path.join(self.repo, s, path) for s in slaves]
-
-            if source != master and not self.plugin.samefile(master, source):
-                if os.path.exists(master):
-                    fops.remove(master)
-                # check if source is in repo, if it is not apply the plugin
-                if source.startswith(self.repo + os.sep):
-                    # if the source is one of the slaves, move the source
-                    # otherwise just copy it because it might have changed into
-                    # a seperate category - cleanup will remove it if needed
-                    if source in slaves:
-                        fops.move(source, master)
-                    else:
-                        fops.copy(source, master)
+                candidates.append(master_path)
+
+        if len(candidates) > 1:
+            source = self.conflicts.choose(path, candidates, master_path,
+                                           restore_path)
+            if source is None:
+                return None
+
+            # if one of the candidates is not in the repo and it is not the
+            # source it should be deleted manually since it will not be
+            # deleted in the slave linking below, as the other candidates
+            # would be
+            if restore_path in candidates and source != restore_path:
+                fops.remove(restore_path)
+                known = Dest.REMOVED
+
+        else:
+            source = candidates.pop()
+
+        master = os.path.join(self.repo, master, path)
+        slaves = [os.path.join(self.repo, s, path) for s in slaves]
+
+        if source != master and not self.plugin.samefile(master, source):
+            if os.path.exists(master):
+                fops.remove(master)
+            # check if source is in repo, if it is not apply the plugin
+            if source.startswith(self.repo + os.sep):
+                # if the source is one of the slaves, move the source
+                # otherwise just copy it because it might have changed into
+                # a seperate category - cleanup will remove it if needed
+                if source in slaves:
+                    fops.move(source, master)
                 else:
-                    fops.plugin(self.plugin.apply, source, master)
-                    if source in original_path:
-                        fops.remove(original_path[source])
-                    else:
-                        fops.remove(source)
-
-            for slave in slaves:
-                if slave != source:
-                    if os.path.isfile(slave) or os.path.islink(slave):
-                        if os.path.realpath(slave) != master:
-                            fops.remove(slave)
-                        else:
-                            # already linked to master so just ignore
-                            continue
-                fops.link(master, slave)
-
-        return fops
-
-    def restore(self, files):
-        fops = FileOps(self.repo)
-
-        for path in files:
-            categories = files[path]
-            master = min(categories)
-            source = os.path.join(self.repo, master, path)
-
-            if not os.path.exists(source):
-                logging.debug(f'{source} not found in repo')
-                logging.warning(f'unable to find "{path}" in repo, skipping')
-                continue
-
-            dest = os.path.join(self.restore_path, path)
-
-            if os.path.exists(dest):
-                if self.plugin.samefile(source, dest):
-                    logging.debug(f'{dest} is the same file as in the repo, '
-                                  'skipping')
-                    continue
-
-                # check if the dest is already a symlink to the repo, if it is
-                # just remove it without asking
-                if os.path.realpath(dest).startswith(self.repo):
-                    logging.info(f'{dest} already linked to repo, replacing '
-                                 'with new file')
-                    fops.remove(dest)
+                    fops.copy(source, master)
+            else:
+                fops.plugin(self.plugin.apply, source, master)
+                if source in original_path:
+                    fops.remove(original_path[source])
                 else:
-                    a = input(f'{dest} already exists, replace? [Yn] ')
-                    a = 'y' if not a else a
-                    if a.lower() == 'y':
-                        fops.remove(dest)
+                    fops.remove(source)
+                if original_path.get(source, source) == restore_path:
+                    known = Dest.REMOVED
+        elif source == restore_path:
+            # the file in the restore path was just compared to the master
+            known = Dest.SAME
+
+        for slave in slaves:
+            if slave != source:
+                if os.path.isfile(slave) or os.path.islink(slave):
+                    if os.path.realpath(slave) != master:
+                        fops.remove(slave)
                     else:
+                        # already linked to master so just ignore
                         continue
-            # check if the destination is a dangling symlink, if it is just
-            # remove it
-            elif os.path.islink(dest):
+            fops.link(master, slave)
+
+        return known
+
+    # adds the ops to restore path from the repo to fops. known is what is
+    # already known about the file in the restore path (see Dest), if it is
+    # None the file is checked
+    def restore_file(self, fops, path, categories, known=None):
+        master = min(categories)
+        source = os.path.join(self.repo, master, path)
+
+        # update makes sure that the master exists
+        if known is None and not os.path.exists(source):
+            logging.debug(f'{source} not found in repo')
+            logging.warning(f'unable to find "{path}" in repo, skipping')
+            return
+
+        dest = os.path.join(self.restore_path, path)
+
+        if known == Dest.REMOVED:
+            # nothing to replace
+            pass
+        elif known == Dest.STALE:
+            fops.remove(dest)
+        elif known in [Dest.EXISTS, Dest.SAME] or os.path.exists(dest):
+            if known == Dest.SAME or self.plugin.samefile(source, dest):
+                logging.debug(f'{dest} is the same file as in the repo, '
+                              'skipping')
+                return
+
+            # check if the dest is already a symlink to the repo, if it is
+            # just remove it without asking
+            if os.path.realpath(dest).startswith(self.repo):
+                logging.info(f'{dest} already linked to repo, replacing '
+                             'with new file')
+                fops.remove(dest)
+            elif self.stale(source, dest):
+                logging.info(f'{dest} is a copy of the file in the repo, '
+                             'linking it again')
+                fops.remove(dest)
+            elif self.conflicts.replace(source, dest):
                 fops.remove(dest)
+            else:
+                return
+        # check if the destination is a dangling symlink, if it is just
+        # remove it
+        elif os.path.islink(dest):
+            fops.remove(dest)
 
-            fops.plugin(self.plugin.remove, source, dest)
+        fops.plugin(self.plugin.remove, source, dest)
 
-        return fops
+    # returns if ext_file is a copy of repo_file with the same content that
+    # should be linked to it again (see Plugin.broken_link)
+    def stale(self, repo_file, ext_file):
+        if not self.plugin.broken_link(repo_file, ext_file):
+            return False
+        return self.plugin.samecontent(repo_file, ext_file)
 
     # removes links from restore path that point to the repo
     def clean(self, files):
-        fops = FileOps(self.repo)
+        fops = FileOps(self.repo, self.plugin.index)
 
         for path in files:
             categories = files[path]
@@ -168,53 +286,63 @@ class CalcOps:
             restore_path = os.path.join(self.restore_path, path)
 
             if os.path.exists(repo_path) and os.path.exists(restore_path):
-                if self.plugin.samefile(repo_path, restore_path):
+                if self.plugin.samefile(repo_path, restore_path) or \
+                        self.stale(repo_path, restore_path):
                     fops.remove(restore_path)
 
         return fops
 
     # will go through the repo and search for files that should no longer be
-    # there. accepts a list of filenames that are allowed
+    # there. accepts a manifest (or any iterable) of filenames that are allowed
     def clean_repo(self, filenames):
-        fops = FileOps(self.repo)
+        fops = FileOps(self.repo, self.plugin.index)
 
         if not os.path.isdir(self.repo):
             return fops
 
-        for category in os.listdir(self.repo):
-            category_path = os.path.join(self.repo, category)
-
-            # remove empty category folders
-            if not os.listdir(category_path):
-                logging.info(f'{category} is empty, removing')
-                fops.remove(category)
-                continue
+        if not isinstance(filenames, Manifest):
+            filenames = Manifest(filenames)
 
-            for root, dirs, files in os.walk(category_path):
-                # remove empty directories
-                for dname in dirs:
-                    dname = os.path.join(root, dname)
-                    if not os.listdir(dname):
-                        dname = os.path.relpath(dname, self.repo)
-                        logging.info(f'{dname} is empty, removing')
-                        fops.remove(dname)
-
-                # remove files that are not in the manifest
-                for fname in files:
-                    fname = os.path.relpath(os.path.join(root, fname),
-                                            self.repo)
-                    if fname not in filenames:
-                        logging.info(f'{fname} is not in the manifest, '
-                                     'removing')
-                        fops.remove(fname)
+        for path in self.clean_dir(self.repo, '', filenames)[0]:
+            logging.info(f'{path} is not in the manifest, removing')
+            fops.remove(path)
 
         return fops
 
+    # walks the directory at path (rel relative to the repo) bottom-up and
+    # returns the paths below it that should be removed along with whether
+    # anything in it is kept. directories that would be empty after the
+    # removals are removed as a whole instead of file by file
+    def clean_dir(self, path, rel, filenames):
+        remove, kept = [], False
+
+        with os.scandir(path) as entries:
+            for entry in entries:
+                entry_rel = os.path.join(rel, entry.name)
+
+                if entry.is_dir(follow_symlinks=False):
+                    # don't descend into directories without any files in
+                    # the manifest
+                    if filenames.has_dir(entry_rel):
+                        sub_remove, sub_kept = self.clean_dir(
+                            entry.path, entry_rel, filenames)
+                        if sub_kept:
+                            remove += sub_remove
+                            kept = True
+                            continue
+                    remove.append(entry_rel)
+                elif entry_rel in filenames:
+                    kept = True
+                else:
+                    remove.append(entry_rel)
+
+        return remove, kept
+
     # goes through the filelist and finds files that have modifications that
     # are not yet in the repo e.g. changes to encrypted files. This should not
     # be used for any calculations, only for informational purposes
     def diff(self, categories):
-        diffs = []
+        pairs = []
         for category in categories:
             category_path = os.path.join(self.repo, category)
 
@@ -228,9 +356,14 @@ class CalcOps:
 
                     if not os.path.exists(restore_file):
                         continue
+                    pairs.append((category_file, restore_file))
 
-                    logging.debug(f'checking diff samefile for {restore_file}')
-                    if not self.plugin.samefile(category_file, restore_file):
-                        diffs.append(f'modified {restore_file}')
+        self.plugin.prefetch(pairs)
+
+        diffs = []
+        for category_file, restore_file in pairs:
+            logging.debug(f'checking diff samefile for {restore_file}')
+            if not self.plugin.samefile(category_file, restore_file):
+                diffs.append(f'modified {restore_file}')
 
         return diffs
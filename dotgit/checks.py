@@ -1,6 +1,6 @@
 import os
+import shutil
 import logging
-import subprocess
 
 
 def safety_checks(dir_name, home, init):
@@ -9,10 +9,8 @@ def safety_checks(dir_name, home, init):
         logging.error('dotgit should not be run inside home folder')
         return False
 
-    try:
-        subprocess.run(['git', '--version'], check=True,
-                       stdout=subprocess.PIPE)
-    except FileNotFoundError:
+    # look for git in the path instead of running it, which is a lot faster
+    if shutil.which('git') is None:
         logging.error('"git" command not found in path, needed for proper '
                       'dotgit operation')
         return False
@@ -0,0 +1,138 @@
+import os
+import logging
+
+from dotgit.enums import Conflict
+
+
+# raised when a conflict is found in batch mode that hasn't been answered yet.
+# the file should be planned again once ConflictResolver.ask_pending was called
+class Deferred(Exception):
+    pass
+
+
+# decides which version of a file to use when there are conflicting versions,
+# either by asking the user or by applying the policy
+class ConflictResolver:
+    def __init__(self, policy=Conflict.ASK):
+        self.policy = policy
+        # answers to the conflicts found in batch mode
+        self.answers = {}
+        # conflicts that still need to be answered in batch mode, (key,
+        # description, args) tuples
+        self.pending = []
+
+    @staticmethod
+    def mtime(path):
+        try:
+            return os.lstat(path).st_mtime_ns
+        except OSError:
+            return 0
+
+    # chooses one of the candidates for path (the versions of the file in the
+    # different categories). master is the path of the file in the master
+    # category and home is its path in the home directory. returns None if
+    # the file should be skipped
+    def choose(self, path, candidates, master, home):
+        description = (f'multiple candidates found for {path}: '
+                       f'{", ".join(candidates)}')
+
+        if self.policy == Conflict.BATCH:
+            return self.defer(('choose', path), description,
+                              (path, candidates, master, home))
+        if self.policy == Conflict.ASK:
+            return self.ask_choice(path, candidates)
+        if self.policy == Conflict.FAIL:
+            logging.error(description)
+            raise RuntimeError
+        if self.policy == Conflict.SKIP:
+            logging.warning(f'multiple candidates found for "{path}", '
+                            'skipping')
+            return None
+        if self.policy == Conflict.NEWEST:
+            return max(sorted(candidates), key=self.mtime)
+        if self.policy == Conflict.HOME and home in candidates:
+            return home
+
+        # prefer the version in the master category, otherwise the category
+        # that comes first
+        if master in candidates:
+            return master
+        return sorted(candidates)[0]
+
+    # returns True if dest (outside the repo) should be replaced by source
+    # (inside the repo)
+    def replace(self, source, dest):
+        if self.policy == Conflict.BATCH:
+            return self.defer(('replace', dest), f'{dest} already exists',
+                              (source, dest))
+        if self.policy == Conflict.ASK:
+            return self.ask_replace(dest)
+        if self.policy == Conflict.FAIL:
+            logging.error(f'{dest} already exists')
+            raise RuntimeError
+        if self.policy == Conflict.NEWEST:
+            return self.mtime(source) > self.mtime(dest)
+        return self.policy == Conflict.REPO
+
+    # returns the answer to a conflict in batch mode, or remembers the conflict
+    # until ask_pending is called
+    def defer(self, key, description, args):
+        if key in self.answers:
+            return self.answers[key]
+
+        if key not in [p[0] for p in self.pending]:
+            self.pending.append((key, description, args))
+        raise Deferred
+
+    # answers all the conflicts that were deferred in batch mode at once
+    def ask_pending(self):
+        if not self.pending:
+            return
+
+        print(f'{len(self.pending)} conflicts found:\n')
+        for i, (key, description, args) in enumerate(self.pending):
+            print(f'[{i}] {description}')
+
+        choices = [c.value for c in Conflict if c != Conflict.BATCH]
+        while True:
+            try:
+                a = input('resolve the conflicts using which policy? '
+                          f'[{"/".join(choices)}] ')
+            except EOFError:
+                logging.error('no policy chosen to resolve the conflicts')
+                raise RuntimeError
+            if a in choices:
+                break
+            print('invalid choice entered, please try again')
+
+        # answer the conflicts as if the chosen policy was used from the start
+        resolver = ConflictResolver(Conflict(a))
+        for key, description, args in self.pending:
+            self.answers[key] = getattr(resolver, key[0])(*args)
+        self.pending = []
+
+    @staticmethod
+    def ask_choice(path, candidates):
+        print(f'multiple candidates found for {path}:\n')
+
+        for i, cand in enumerate(candidates):
+            print(f'[{i}] {cand}')
+        print('[-1] cancel')
+
+        while True:
+            try:
+                choice = int(input('please select the version you would like '
+                                   f'to use [0-{len(candidates)-1}]: '))
+                choice = candidates[choice]
+            except (ValueError, EOFError):
+                print('invalid choice entered, please try again')
+                continue
+            break
+
+        return choice
+
+    @staticmethod
+    def ask_replace(dest):
+        a = input(f'{dest} already exists, replace? [Yn] ')
+        a = 'y' if not a else a
+        return a.lower() == 'y'
@@ -7,8 +7,40 @@ class Actions(enum.Enum):
     UPDATE = 'update'
     RESTORE = 'restore'
     CLEAN = 'clean'
+    WATCH = 'watch'
+
+    PLAN = 'plan'
+    APPLY = 'apply'
+    RECOVER = 'recover'
 
     DIFF = 'diff'
     COMMIT = 'commit'
 
     PASSWD = 'passwd'
+
+
+# how conflicts between files are resolved
+class Conflict(enum.Enum):
+    # ask for every conflict when it is found
+    ASK = 'ask'
+    # find all the conflicts first and then ask about them at once
+    BATCH = 'batch'
+
+    NEWEST = 'newest'
+    REPO = 'repo'
+    HOME = 'home'
+    SKIP = 'skip'
+    FAIL = 'fail'
+
+
+# how the files in the home directory are linked to the files in the repo
+class LinkMode(enum.Enum):
+    SYMLINK = 'symlink'
+    COPY = 'copy'
+    HARD = 'hard'
+
+
+# how the changes of an interrupted run are recovered
+class Recover(enum.Enum):
+    ROLLBACK = 'rollback'
+    RESUME = 'resume'
@@ -0,0 +1,145 @@
+import os
+import errno
+import shutil
+import logging
+import threading
+from collections import Counter
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# the ioctl that makes dest share source's data blocks (a "reflink"), see
+# ioctl_ficlone(2). supported by btrfs, XFS and a few others
+FICLONE = 0x40049409
+
+# the errors that mean that a way of copying isn't supported for the files,
+# rather than that the copy failed
+UNSUPPORTED = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL,
+               errno.ENOSYS, errno.EBADF, errno.EPERM}
+# the errors that mean that it isn't supported for any of the files on the
+# filesystems
+UNSUPPORTED_FS = {errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.ENOSYS}
+
+# how many files (and how many bytes) were copied in each way, see summary
+stats = Counter()
+lock = threading.Lock()
+
+# (method, source device, dest device) combinations that are known not to
+# work, so that they aren't tried again for every file
+unsupported = set()
+
+
+# handles an error from one of the ways of copying. returns if the error
+# means that the way of copying isn't supported, otherwise raises it
+def fallback(e, method, devs):
+    if e.errno not in UNSUPPORTED:
+        raise e
+    if e.errno in UNSUPPORTED_FS:
+        unsupported.add((method,) + devs)
+
+
+def record(method, size):
+    with lock:
+        stats[method] += 1
+        stats[f'{method} bytes'] += size
+
+
+# makes dest a reflink of source, returns False if reflinks aren't supported
+def reflink(fsrc, fdst, size, devs):
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except OSError as e:
+        fallback(e, 'reflink', devs)
+        return False
+    return True
+
+
+# copies source to dest in the kernel without passing the data through
+# dotgit, returns False if copy_file_range isn't supported for the files
+def copy_range(fsrc, fdst, size, devs):
+    if not hasattr(os, 'copy_file_range'):
+        return False
+
+    copied = 0
+    while copied < size:
+        try:
+            n = os.copy_file_range(fsrc.fileno(), fdst.fileno(),
+                                   size - copied)
+        except OSError as e:
+            # the regular copy can only take over if nothing was copied yet
+            if copied:
+                raise
+            fallback(e, 'copy_file_range', devs)
+            return False
+        if n == 0:
+            break
+        copied += n
+
+    # copy_file_range can stop before the end of the file (e.g. for files on
+    # some filesystems, or if the file shrank), in which case the rest is
+    # copied normally
+    if copied < size:
+        if not copied:
+            return False
+        fsrc.seek(copied)
+        fdst.seek(copied)
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+    return True
+
+
+# copies the contents of source to dest like shutil.copyfile, but tries to
+# avoid copying the data. first dest is made a reflink of source (which
+# shares the data until one of the files is changed, so it is near-instant and
+# uses no extra space), then the copy is done with copy_file_range (which
+# copies in the kernel and can use server-side copies on network
+# filesystems), and only then is the data copied normally. returns the method
+# that was used
+def copyfile(source, dest):
+    if os.path.exists(dest) and os.path.samefile(source, dest):
+        raise shutil.SameFileError(f'{source} and {dest} are the same file')
+
+    with open(source, 'rb') as fsrc, open(dest, 'wb') as fdst:
+        size = os.fstat(fsrc.fileno()).st_size
+        devs = (os.fstat(fsrc.fileno()).st_dev,
+                os.fstat(fdst.fileno()).st_dev)
+
+        for method, copy in [('reflink', reflink),
+                             ('copy_file_range', copy_range)]:
+            if (method,) + devs in unsupported:
+                continue
+            if copy(fsrc, fdst, size, devs):
+                record(method, size)
+                return method
+
+        shutil.copyfileobj(fsrc, fdst, 1 << 20)
+        record('copy', size)
+        return 'copy'
+
+
+# the same as copyfile, but also copies the file's permissions and timestamps
+# like shutil.copy2
+def copy2(source, dest):
+    if os.path.isdir(dest):
+        dest = os.path.join(dest, os.path.basename(source))
+    method = copyfile(source, dest)
+    shutil.copystat(source, dest)
+    return method
+
+
+# returns a summary of how the files were copied
+def summary():
+    methods = [m for m in ['reflink', 'copy_file_range', 'copy'] if stats[m]]
+    return ', '.join(f'{stats[m]} files ({stats[m + " bytes"]} bytes) using '
+                     f'{m}' for m in methods)
+
+
+# logs the summary of the copies made since the last summary
+def log_summary():
+    with lock:
+        if stats:
+            logging.info(f'copied {summary()}')
+        stats.clear()
@@ -1,8 +1,35 @@
 import os
+import errno
 import logging
 import enum
 import shutil
-import inspect
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import dotgit.tracing as tracing
+import dotgit.fastcopy as fastcopy
+
+
+# moves path to trash, which has to be done atomically so that it is always
+# clear whether path was moved or not. if trash is on another filesystem path
+# is first copied to a temporary path next to trash, which is renamed once
+# the copy is complete, and only then is path deleted
+def move_to_trash(path, trash):
+    try:
+        os.rename(path, trash)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+    part = trash + '.part'
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.copytree(path, part, symlinks=True)
+        os.rename(part, trash)
+        shutil.rmtree(path)
+    else:
+        shutil.copy2(path, part, follow_symlinks=False)
+        os.rename(part, trash)
+        os.remove(path)
 
 
 class Op(enum.Enum):
@@ -14,9 +41,10 @@ class Op(enum.Enum):
 
 
 class FileOps:
-    def __init__(self, wd):
+    def __init__(self, wd, index=None):
         self.wd = wd
         self.ops = []
+        self.index = index
 
     def clear(self):
         self.ops = []
@@ -58,40 +86,279 @@ class FileOps:
         self.check_dest_dir(dest)
         self.ops.append((plugin, (source, dest)))
 
-    def apply(self, dry_run=False):
-        for op in self.ops:
-            op, path = op
+    # resolves the paths of an op relative to the working directory
+    def resolve_op(self, op):
+        op, path = op
+        if type(path) is tuple:
+            return op, tuple(self.check_path(p) for p in path)
+        return op, self.check_path(path)
+
+    # executes a single (resolved) op, adding a span for it to the trace if
+    # tracing is enabled. if trash is given a removed path is moved there
+    # instead of being deleted
+    def run_op(self, op, path, trash=None):
+        if tracing.active is None:
+            return self.execute_op(op, path, trash)
+
+        if type(op) is Op:
+            name = op.name
+        else:
+            name = f'{type(op.__self__).__name__}.{op.__name__}'
+        source = path[0] if type(path) is tuple else None
+
+        with tracing.span(self.str_op(op, path), 'file_ops', op=name,
+                          path=path, bytes=tracing.size(source)):
+            self.execute_op(op, path, trash)
+
+    # executes op i of ops, recording its progress in the journal (see
+    # dotgit.journal) if there is one
+    def run_journaled(self, ops, i, journal):
+        op, path = ops[i]
+        if journal is None:
+            return self.run_op(op, path)
+
+        journal.record('start', i)
+        self.run_op(op, path, journal.trash(i) if op == Op.REMOVE else None)
+        journal.record('done', i)
+
+    # keeps the index up to date with the changes that an op is about to make.
+    # paths are forgotten before they are replaced so that stale entries are
+    # never used
+    def invalidate(self, op, path):
+        if self.index is None:
+            return
 
-            if type(path) is tuple:
-                src, dest = path
-                src, dest = self.check_path(src), self.check_path(dest)
-                logging.info(self.str_op(op, (src, dest)))
+        if op == Op.REMOVE:
+            self.index.forget(path)
+            self.index.touch(path)
+        elif op != Op.MKDIR:
+            src, dest = path
+            self.index.forget(dest)
+            self.index.touch(dest)
+            if op == Op.MOVE:
+                self.index.touch(src)
+
+    def execute_op(self, op, path, trash=None):
+        if type(path) is tuple:
+            src, dest = path
+
+        self.invalidate(op, path)
+
+        if op == Op.LINK:
+            src = os.path.relpath(src, os.path.join(self.wd,
+                                                    os.path.dirname(dest)))
+            os.symlink(src, dest)
+        elif op == Op.COPY:
+            fastcopy.copyfile(src, dest)
+            if self.index is not None:
+                self.index.copy(src, dest)
+        elif op == Op.MOVE:
+            os.rename(src, dest)
+            if self.index is not None:
+                self.index.move(src, dest)
+        elif op == Op.REMOVE:
+            if trash is not None:
+                move_to_trash(path, trash)
+            elif os.path.isdir(path):
+                shutil.rmtree(path)
             else:
-                path = self.check_path(path)
-                logging.info(self.str_op(op, path))
+                os.remove(path)
+        elif op == Op.MKDIR:
+            os.makedirs(path, exist_ok=True)
+        elif callable(op):
+            op(src, dest)
+
+    # returns the callable that applies a plugin op to a list of (source, dest)
+    # pairs at once (see Plugin.batch), or None if the op has to be applied
+    # one at a time
+    @staticmethod
+    def batch_of(op):
+        if type(op) is Op:
+            return None
+        batch = getattr(getattr(op, '__self__', None), 'batch', None)
+        return None if batch is None else batch(op)
+
+    # splits the (resolved) ops into groups of op indices that are executed
+    # together. consecutive runs of the same plugin op are grouped if the
+    # plugin can apply them in a batch and they don't depend on each other
+    def batches(self, ops):
+        groups = []
+        deps = None
+
+        for i, (op, path) in enumerate(ops):
+            if groups and op == ops[groups[-1][0]][0]:
+                if self.batch_of(op) is not None:
+                    if deps is None:
+                        deps = self.dependencies(ops)
+                    if not deps[i].intersection(groups[-1]):
+                        groups[-1].append(i)
+                        continue
+            groups.append([i])
+
+        return groups
+
+    # executes a group of ops (see batches), recording its progress in the
+    # journal if there is one. a group of plugin ops is handed to the plugin in
+    # one batch
+    def run_batch(self, ops, group, journal):
+        if len(group) == 1:
+            return self.run_journaled(ops, group[0], journal)
+
+        op = ops[group[0]][0]
+        paths = [ops[i][1] for i in group]
+
+        if journal is not None:
+            for i in group:
+                journal.record('start', i)
 
+        for path in paths:
+            self.invalidate(op, path)
+        name = f'{type(op.__self__).__name__}.{op.__name__}'
+        with tracing.span(f'{name} ({len(paths)} files)', 'file_ops', op=name,
+                          paths=paths):
+            self.batch_of(op)(paths)
+
+        if journal is not None:
+            for i in group:
+                journal.record('done', i)
+
+    # returns the paths an op reads and the paths it writes
+    @staticmethod
+    def op_paths(op, path):
+        if op in [Op.REMOVE, Op.MKDIR]:
+            return [], [path]
+
+        src, dest = path
+        if op == Op.MOVE:
+            return [], [src, dest]
+        return [src], [dest]
+
+    # builds a dependency graph of the (resolved) ops. two ops depend on each
+    # other if they touch the same path (or a path inside the other's path)
+    # and at least one of them writes to it, in which case the op that comes
+    # later in the plan has to wait for the earlier one. returns a list with
+    # the set of ops each op depends on
+    def dependencies(self, ops):
+        readers, writers, below = {}, {}, {}
+        deps = []
+
+        for i, (op, path) in enumerate(ops):
+            dep = set()
+            reads, writes = self.op_paths(op, path)
+            touched = [(p, False) for p in reads] + [(p, True) for p in writes]
+
+            for p, write in touched:
+                ancestors = []
+                parent = os.path.dirname(p)
+                while parent and parent not in ancestors[-1:]:
+                    ancestors.append(parent)
+                    parent = os.path.dirname(parent)
+
+                # ops on the same path or on one of its parent directories
+                for a in [p] + ancestors:
+                    dep.update(writers.get(a, []))
+                    if write:
+                        dep.update(readers.get(a, []))
+
+                # ops on paths inside this path
+                for j, other_write in below.get(p, []):
+                    if write or other_write:
+                        dep.add(j)
+
+                (writers if write else readers).setdefault(p, []).append(i)
+                for a in ancestors:
+                    below.setdefault(a, []).append((i, write))
+
+            dep.discard(i)
+            deps.append(dep)
+
+        return deps
+
+    # executes the ops on a pool of jobs threads, only starting an op once all
+    # the ops it depends on are done. ops are logged in plan order as they
+    # complete
+    def apply_parallel(self, ops, jobs, journal=None):
+        deps = self.dependencies(ops)
+        waiting = [len(dep) for dep in deps]
+        dependents = [[] for _ in ops]
+        for i, dep in enumerate(deps):
+            for j in dep:
+                dependents[j].append(i)
+
+        done = [False] * len(ops)
+        logged = 0
+        error = None
+
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            running = {}
+
+            def submit(i):
+                running[pool.submit(self.run_journaled, ops, i,
+                                    journal)] = i
+
+            for i in range(len(ops)):
+                if not waiting[i]:
+                    submit(i)
+
+            while running:
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    exc = future.exception()
+                    if exc is not None:
+                        # report the failure of the earliest op in the plan
+                        if error is None or i < error[0]:
+                            error = (i, exc)
+                        continue
+
+                    done[i] = True
+                    # don't start any new ops once something has failed
+                    if error is not None:
+                        continue
+                    for j in dependents[i]:
+                        waiting[j] -= 1
+                        if not waiting[j]:
+                            submit(j)
+
+                while logged < len(ops) and done[logged]:
+                    logging.info(self.str_op(*ops[logged]))
+                    logged += 1
+
+        if error is not None:
+            logging.error(f'failed to {self.str_op(*ops[error[0]])}')
+            raise error[1]
+
+    # executes the ops. if a journal (see dotgit.journal) is given the ops
+    # are written to it first so that they can be recovered if they are
+    # interrupted
+    def apply(self, dry_run=False, jobs=1, journal=None):
+        ops = [self.resolve_op(op) for op in self.ops]
+
+        if dry_run or not ops:
+            journal = None
+        if journal is not None:
+            journal.begin(self)
+
+        try:
             if dry_run:
-                continue
-
-            if op == Op.LINK:
-                src = os.path.relpath(src, os.path.join(self.wd,
-                                                        os.path.dirname(dest)))
-                os.symlink(src, dest)
-            elif op == Op.COPY:
-                shutil.copyfile(src, dest)
-            elif op == Op.MOVE:
-                os.rename(src, dest)
-            elif op == Op.REMOVE:
-                if os.path.isdir(path):
-                    shutil.rmtree(path)
-                else:
-                    os.remove(path)
-            elif op == Op.MKDIR:
-                if not os.path.isdir(path):
-                    os.makedirs(path)
-            elif callable(op):
-                op(src, dest)
+                for op in ops:
+                    logging.info(self.str_op(*op))
+            elif jobs <= 1:
+                for group in self.batches(ops):
+                    for i in group:
+                        logging.info(self.str_op(*ops[i]))
+                    self.run_batch(ops, group, journal)
+            else:
+                self.apply_parallel(ops, jobs, journal)
+        except BaseException:
+            if journal is not None:
+                journal.close()
+                logging.error('the changes were interrupted, '
+                              f'{journal.hint}')
+            raise
 
+        if journal is not None:
+            journal.commit()
         self.clear()
 
     def append(self, other):
@@ -107,7 +374,7 @@ class FileOps:
         if type(op) is Op:
             op = op.name
         else:
-            op = dict(inspect.getmembers(op))['__self__'].strify(op)
+            op = op.__self__.strify(op)
 
         if type(path) is tuple:
             path = [strip_wd(p) for p in path]
@@ -1,15 +1,88 @@
+import gc
+import heapq
 import logging
+import marshal
 import os
 import re
+import sys
+from operator import itemgetter
 
 import dotgit.info as info
+from dotgit.fsutil import write_atomic
+from dotgit.hashing import hash_file, DEFAULT
+from dotgit.index import gitignore
+from dotgit.globs import is_pattern, unescape, GlobCache
 
 
+# a set of repo paths (category/path) that also keeps a trie of the directories
+# they live in, so that it can quickly be checked whether any of the paths lie
+# below a directory
+class Manifest(set):
+    def __init__(self, paths=(), trie=None):
+        # a known trie can be passed in along with its paths, e.g. when
+        # loading a cached manifest
+        if trie is not None:
+            super().__init__(paths)
+            self.trie = trie
+            return
+
+        super().__init__()
+        self.trie = {}
+        for path in paths:
+            self.add(path)
+
+    @staticmethod
+    def split(path):
+        return [p for p in path.split(os.sep) if p and p != '.']
+
+    def add(self, path):
+        super().add(path)
+
+        node = self.trie
+        for part in self.split(path)[:-1]:
+            node = node.setdefault(part, {})
+
+    # returns True if any of the paths in the manifest lie below directory
+    def has_dir(self, directory):
+        node = self.trie
+        for part in self.split(directory):
+            node = node.get(part)
+            if node is None:
+                return False
+        return True
+
+
+# parses the filelist. if cache is given the parsed filelist is stored in the
+# cache file and re-used until the filelist changes
 class Filelist:
-    def __init__(self, fname):
+    # bump this when the layout of the cache (or how the filelist is parsed)
+    # changes
+    cache_version = 3
+    # marshal's format can change between python versions, so the cache is
+    # only used by the python version that wrote it
+    python_version = list(sys.version_info[:2]) + [marshal.version]
+
+    def __init__(self, fname, cache=None):
         self.groups = {}
         self.files = {}
+        # inverted index of category -> [(position, path, instance index)]
+        # so that activating categories doesn't need to go through all the
+        # files
+        self.categories = {}
+        # glob and directory entries, (position, pattern, instance). these are
+        # only turned into files once they are expanded
+        self.patterns = []
+        self.manifests = None
+
+        if cache is not None and self.load_cache(fname, cache):
+            return
+
+        self.parse(fname)
 
+        if cache is not None:
+            self.save_cache(fname, cache)
+
+    def parse(self, fname):
         logging.debug(f'parsing filelist in {fname}')
 
         with open(fname, 'r') as f:
@@ -23,8 +96,8 @@ class Filelist:
                 if '=' in line:
                     group, categories = line.split('=')
                     categories = categories.split(',')
-                    if group == info.hostname:
-                        categories.append(info.hostname)
+                    if group == info.get_hostname():
+                        categories.append(info.get_hostname())
                     self.groups[group] = categories
                 # file
                 else:
@@ -39,37 +112,176 @@ class Filelist:
                     if len(split) >= 3:
                         plugin = split[2]
 
-                    if path not in self.files:
-                        self.files[path] = []
-                    self.files[path].append({
+                    instance = {
                         'categories': categories,
                         'plugin': plugin
-                    })
+                    }
+
+                    if is_pattern(path):
+                        self.patterns.append((len(self.files), path,
+                                              instance))
+                        continue
+                    path = unescape(path)
+
+                    if path not in self.files:
+                        self.files[path] = []
+                    self.files[path].append(instance)
+
+                    posting = (len(self.files), path,
+                               len(self.files[path]) - 1)
+                    for category in categories:
+                        self.categories.setdefault(category, []).append(
+                            posting)
+
+    # loads the parsed filelist from the cache, returns False if the cache
+    # can't be used. the cache is trusted if the filelist's size and mtime
+    # didn't change, otherwise the filelist's hash is compared
+    def load_cache(self, fname, cache):
+        try:
+            with open(cache, 'rb') as f:
+                content = f.read()
+            # loading creates a lot of containers which would otherwise
+            # trigger the garbage collector over and over again
+            gc.disable()
+            try:
+                data = marshal.loads(content)
+            finally:
+                gc.enable()
+            cache_mtime = os.stat(cache).st_mtime_ns
+            st = os.stat(fname)
+        except (OSError, EOFError, ValueError, TypeError):
+            return False
+
+        if not isinstance(data, dict) or data.get('version') != \
+                self.cache_version:
+            return False
+        if data.get('hostname') != info.get_hostname():
+            return False
+        if data.get('python') != self.python_version:
+            return False
+
+        stamp = [st.st_size, st.st_mtime_ns]
+        # a filelist that was modified in the same timestamp tick as the cache
+        # was written can't be trusted (see Index.load)
+        if data['stat'] != stamp or st.st_mtime_ns >= cache_mtime:
+            if hash_file(fname, DEFAULT) != data['hash']:
+                return False
+            # the filelist was touched but not changed
+            data['stat'] = stamp
+            self.write_cache(cache, data)
+
+        logging.debug(f'loaded cached filelist from {cache}')
+        self.groups = data['groups']
+        self.files = data['files']
+        self.categories = data['categories']
+        self.patterns = data['patterns']
+        self.manifests = {plugin: Manifest(paths, trie) for plugin, (paths,
+                          trie) in data['manifests'].items()}
+        return True
+
+    def save_cache(self, fname, cache):
+        st = os.stat(fname)
+        manifests = self.manifest()
+        self.write_cache(cache, {
+            'version': self.cache_version,
+            'hostname': info.get_hostname(),
+            'python': self.python_version,
+            'stat': [st.st_size, st.st_mtime_ns],
+            'hash': hash_file(fname, DEFAULT),
+            'groups': self.groups,
+            'files': self.files,
+            'categories': self.categories,
+            'patterns': self.patterns,
+            'manifests': {plugin: (set(manifest), manifest.trie) for plugin,
+                          manifest in manifests.items()},
+        })
+
+    @staticmethod
+    def write_cache(cache, data):
+        dirname = os.path.dirname(cache)
+        try:
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            write_atomic(cache, marshal.dumps(data))
+        except OSError as e:
+            logging.warning(f'unable to write filelist cache {cache}: {e}')
+            return
+        gitignore(cache)
+
+    # expands the glob and directory entries to the files they match in the
+    # home directory and in the repo. repo is the dotfiles directory that
+    # contains each plugin's repo. files that are listed explicitly take
+    # precedence over the files matched by a pattern
+    def expand(self, home, repo, cache=None):
+        if not self.patterns:
+            return
+        cache = GlobCache() if cache is None else cache
+
+        explicit = set(self.files)
+        changed = set()
+
+        for position, pattern, instance in self.patterns:
+            categories = [c for cat in instance['categories'] for c in
+                          self.groups.get(cat, [cat])]
+            roots = [home] + [os.path.join(repo, instance['plugin'], c) for c
+                              in categories]
+
+            paths = set()
+            for root in roots:
+                paths.update(cache.expand(root, pattern))
+            logging.debug(f'{pattern} matched {len(paths)} files')
+
+            for path in sorted(paths - explicit):
+                if path not in self.files:
+                    self.files[path] = []
+                # every pattern can only add a file once
+                elif any(i is instance for i in self.files[path]):
+                    continue
+                self.files[path].append(instance)
+
+                posting = (position, path, len(self.files[path]) - 1)
+                for category in instance['categories']:
+                    self.categories.setdefault(category, []).append(posting)
+                    changed.add(category)
+
+        # keep the posting lists in filelist order
+        for category in changed:
+            self.categories[category].sort(key=itemgetter(0))
+        self.manifests = None
 
     def activate(self, categories):
         # expand groups
         categories = [self.groups.get(c, [c]) for c in categories]
         # flatten category list
-        categories = [c for cat in categories for c in cat]
+        categories = set(c for cat in categories for c in cat)
 
-        files = {}
-        for path in self.files:
-            for group in self.files[path]:
-                cat_list = group['categories']
-                if set(categories) & set(cat_list):
-                    if path in files:
-                        logging.error('multiple category lists active for '
-                                      f'{path}: {files[path]["categories"]} '
-                                      f'and {cat_list}')
-                        raise RuntimeError
-                    else:
-                        files[path] = group
+        # the posting lists are in filelist order, so merging them keeps the
+        # order of the filelist
+        postings = heapq.merge(*(self.categories.get(c, []) for c in
+                                 categories), key=itemgetter(0))
+
+        files, active = {}, {}
+        for position, path, instance in postings:
+            if path in files:
+                # the same instance can be activated by multiple of its
+                # categories
+                if active[path] == instance:
+                    continue
+                logging.error('multiple category lists active for '
+                              f'{path}: {files[path]["categories"]} and '
+                              f'{self.files[path][instance]["categories"]}')
+                raise RuntimeError
+            files[path] = self.files[path][instance]
+            active[path] = instance
 
         return files
 
-    # generates a list of all the filenames in each plugin for later use when
-    # cleaning the repo
+    # generates a manifest of all the filenames in each plugin for later use
+    # when cleaning the repo
     def manifest(self):
+        if self.manifests is not None:
+            return self.manifests
+
         manifest = {}
 
         for path in self.files:
@@ -82,9 +294,10 @@ class Filelist:
                         categories = [category]
 
                     if plugin not in manifest:
-                        manifest[plugin] = []
+                        manifest[plugin] = Manifest()
 
                     for category in categories:
-                        manifest[plugin].append(os.path.join(category, path))
+                        manifest[plugin].add(os.path.join(category, path))
 
+        self.manifests = manifest
         return manifest
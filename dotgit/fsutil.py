@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+
+# writes content to fname by writing it to a temporary file and renaming it, so
+# that fname is never left half-written
+def write_atomic(fname, content):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(fname))
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(content, bytes) else 'w') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, fname)
+    except:  # noqa: E722
+        os.remove(tmp)
+        raise
@@ -1,8 +1,12 @@
 import os
+import re
 import subprocess
 import shlex
 import logging
 import enum
+import time
+
+import dotgit.tracing as tracing
 
 
 class FileState(enum.Enum):
@@ -12,64 +16,280 @@ class FileState(enum.Enum):
     RENAMED = 'R'
     COPIED = 'C'
     UPDATED = 'U'
+    TYPECHANGED = 'T'
     UNTRACKED = '?'
 
 
+STATUS_CMD = ['git', 'status', '--porcelain=v2', '-z', '--untracked-files=all']
+
+# the git versions that added --pathspec-from-file to the commands
+PATHSPEC_FROM_FILE = {'add': (2, 25)}
+
+version = None
+
+
+# returns the installed git's version as a tuple of ints, e.g. (2, 25, 1).
+# git is only run the first time
+def get_version():
+    global version
+    if version is None:
+        out = subprocess.run(['git', '--version'], stdout=subprocess.PIPE,
+                             check=True).stdout.decode()
+        # e.g. "git version 2.24.3 (Apple Git-128)"
+        match = re.search(r'(\d+)\.(\d+)(?:\.(\d+))?', out)
+        if match is None:
+            logging.warning(f'unable to parse git version "{out.strip()}"')
+            version = (0, 0, 0)
+        else:
+            version = tuple(int(n or 0) for n in match.groups())
+        logging.debug(f'git version {version}')
+    return version
+
+
+# splits paths into lists that are short enough to be passed on the command
+# line
+def chunks(paths, size=1 << 14):
+    chunk, length = [], 0
+    for path in paths:
+        if chunk and length + len(path) > size:
+            yield chunk
+            chunk, length = [], 0
+        chunk.append(path)
+        length += len(path) + 1
+    if chunk:
+        yield chunk
+
+
 class Git:
-    def __init__(self, repo_dir):
+    # if cache is True the repo's status is only read once and then re-used
+    # until a git command that changes it (add, reset, commit) is run. only
+    # use this if nothing else changes the repo while the instance is in use
+    def __init__(self, repo_dir, cache=False):
         if not os.path.isdir(repo_dir):
             raise FileNotFoundError
 
         self.repo_dir = repo_dir
+        self.cache = cache
+        self.cached_status = None
+        # a (cmd, seconds) entry for every git command that was run
+        self.calls = []
+
+    # records that cmd was run, starting at start. size is the size of its
+    # output if known
+    def record_call(self, cmd, start, size=None):
+        duration = time.perf_counter() - start
+        self.calls.append((cmd, duration))
+        tracing.event(' '.join(cmd[:2]), 'git', start, cmd=cmd, bytes=size)
+        return duration
+
+    # returns a summary of the git commands that were run and how long they
+    # took
+    def summary(self):
+        total = sum(duration for cmd, duration in self.calls)
+        lines = [f'ran {len(self.calls)} git commands in {total:.3f}s']
+        for cmd, duration in self.calls:
+            lines.append(f'  {duration:.3f}s {" ".join(cmd)}')
+        return '\n'.join(lines)
 
-    def run(self, cmd):
+    def run(self, cmd, input=None):
         if not type(cmd) is list:
             cmd = shlex.split(cmd)
         logging.info(f'running git command {cmd}')
+        start = time.perf_counter()
         try:
             proc = subprocess.run(cmd, cwd=self.repo_dir,
+                                  input=None if input is None else
+                                  input.encode(errors='surrogateescape'),
                                   stdout=subprocess.PIPE, check=True)
         except subprocess.CalledProcessError as e:
+            self.record_call(cmd, start, len(e.stdout))
             logging.error(e.stdout.decode())
             logging.error(f'git command {cmd} failed with exit code '
                           f'{e.returncode}\n')
             raise
-        logging.debug(f'git command {cmd} succeeded')
+        duration = self.record_call(cmd, start, len(proc.stdout))
+        logging.debug(f'git command {cmd} succeeded in {duration:.3f}s')
         return proc.stdout.decode()
 
+    # runs cmd and yields the NUL-separated records of its output as they are
+    # read, without waiting for the command to finish
+    def stream(self, cmd):
+        if not type(cmd) is list:
+            cmd = shlex.split(cmd)
+        logging.info(f'running git command {cmd}')
+
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=self.repo_dir, stdout=subprocess.PIPE)
+        finished = False
+        size = 0
+        try:
+            buf = b''
+            while True:
+                chunk = proc.stdout.read1(1 << 16)
+                if not chunk:
+                    break
+                size += len(chunk)
+                *records, buf = (buf + chunk).split(b'\0')
+                for record in records:
+                    yield record.decode(errors='surrogateescape')
+            finished = True
+        finally:
+            # stop the command if the caller stopped reading early
+            if not finished:
+                proc.kill()
+            proc.stdout.close()
+            returncode = proc.wait()
+            duration = self.record_call(cmd, start, size)
+
+        if returncode:
+            logging.error(f'git command {cmd} failed with exit code '
+                          f'{returncode}\n')
+            raise subprocess.CalledProcessError(returncode, cmd)
+        logging.debug(f'git command {cmd} succeeded in {duration:.3f}s')
+
+    # parses the records of "git status --porcelain=v2 -z" and yields an
+    # (index_state, worktree_state, path, original_path) tuple for every
+    # changed path. original_path is only set for renames and copies
+    @staticmethod
+    def parse_status(records):
+        records = iter(records)
+        for record in records:
+            kind = record[:1]
+            orig = None
+
+            if kind == '1':
+                state, path = record.split(' ', 8)[1::7]
+            elif kind == '2':
+                state, path = record.split(' ', 9)[1::8]
+                orig = next(records)
+            elif kind == 'u':
+                state, path = record.split(' ', 10)[1::9]
+            elif kind == '?':
+                state, path = '??', record[2:]
+            else:
+                # headers and ignored files
+                continue
+
+            yield state[0], state[1], path, orig
+
+    # returns the parsed status entries of the repo, using the cached entries
+    # if caching is enabled
+    def status_entries(self):
+        if not self.cache:
+            return self.parse_status(self.stream(STATUS_CMD))
+        if self.cached_status is None:
+            self.cached_status = list(self.parse_status(
+                self.stream(STATUS_CMD)))
+        return self.cached_status
+
     def init(self):
         self.run('git init')
+        self.cached_status = None
 
     def reset(self, fname=None):
         self.run('git reset' if fname is None else f'git reset {fname}')
+        self.cached_status = None
 
     def add(self, fname=None):
         self.run('git add --all' if fname is None else f'git add {fname}')
+        self.cached_status = None
+
+    # stages the given paths (relative to the repo) without scanning the rest
+    # of the worktree. paths that don't exist are skipped since git refuses
+    # pathspecs that don't match any files, use add_tracked to stage the
+    # deletion of tracked files
+    def add_paths(self, paths):
+        specs = set(p for p in paths
+                    if os.path.lexists(os.path.join(self.repo_dir, p)))
+
+        # git add fails on pathspecs that match ignored files
+        specs -= self.ignored(specs)
+        if not specs:
+            return
+
+        self.run_paths(['git', 'add', '--all'], sorted(specs))
+        self.cached_status = None
+
+    # runs cmd on the given paths. the paths are read from stdin if the
+    # installed git supports it, otherwise they are passed on the command
+    # line, split over as many commands as needed
+    def run_paths(self, cmd, paths):
+        if get_version() >= PATHSPEC_FROM_FILE[cmd[1]]:
+            self.run(cmd + ['--pathspec-from-file=-', '--pathspec-file-nul'],
+                     input='\0'.join(paths))
+        else:
+            for chunk in chunks(paths):
+                self.run(cmd + ['--'] + chunk)
+
+    # returns the set of the given paths that are ignored by git
+    def ignored(self, paths):
+        if not paths:
+            return set()
+
+        cmd = ['git', 'check-ignore', '-z', '--stdin']
+        logging.info(f'running git command {cmd}')
+        start = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=self.repo_dir,
+                              input='\0'.join(paths).encode(
+                                  errors='surrogateescape'),
+                              stdout=subprocess.PIPE)
+        self.record_call(cmd, start)
+        # check-ignore exits with 1 if none of the paths are ignored
+        if proc.returncode not in [0, 1]:
+            logging.error(f'git command {cmd} failed with exit code '
+                          f'{proc.returncode}\n')
+            raise subprocess.CalledProcessError(proc.returncode, cmd)
+        return set(p for p in proc.stdout.decode(
+            errors='surrogateescape').split('\0') if p)
+
+    # stages the changes to files that are already tracked
+    def add_tracked(self):
+        self.run('git add --update')
+        self.cached_status = None
+
+    # returns the changes that are staged for the next commit. unlike status
+    # this only compares git's index to the last commit and does not scan the
+    # worktree
+    def staged(self):
+        staged = []
+        records = self.stream(['git', 'diff', '--cached', '--name-status',
+                               '-z', '-M'])
+        for state in records:
+            path = next(records)
+            if state[0] in 'RC':
+                path = f'{path} -> {next(records)}'
+            staged.append((FileState(state[0]), path))
+        return sorted(staged, key=lambda s: s[1])
 
     def commit(self, message=None):
         if message is None:
             message = self.gen_commit_message()
-        return self.run(['git', 'commit', '-m', message])
+        out = self.run(['git', 'commit', '-m', message])
+        self.cached_status = None
+        return out
 
     def status(self, staged=True):
-        out = self.run('git status --porcelain').strip()
         status = []
-        for line in out.split('\n'):
-            state, path = line[:2], line[3:]
-            stage, work = state
-            status.append((FileState(stage if staged else work), path))
+        for entry in self.status_entries():
+            index, work, path, orig = entry
+            state = index if staged else work
+            # unchanged on the requested side
+            if state == '.':
+                continue
+            if orig is not None and state in 'RC':
+                path = f'{orig} -> {path}'
+            status.append((FileState(state), path))
         return sorted(status, key=lambda s: s[1])
 
     def has_changes(self):
-        return bool(self.run('git status -s --porcelain').strip())
+        for entry in self.status_entries():
+            return True
+        return False
 
     def gen_commit_message(self, ignore=[]):
         mods = []
-        for stat in self.status():
+        for stat in self.staged():
             state, path = stat
-            # skip all untracked files since they will not be committed
-            if state == FileState.UNTRACKED:
-                continue
             if any((path.startswith(p) for p in ignore)):
                 logging.debug(f'ignoring {path} from commit message')
                 continue
@@ -88,17 +308,38 @@ class Git:
     def push(self):
         self.run('git push')
 
+    # lists the changes that would be committed if all the changes in the repo
+    # were added. this only reads the repo's status and does not touch git's
+    # index
     def diff(self, ignore=[]):
-        if not self.has_changes():
-            return ['no changes']
+        status = []
+
+        for entry in self.status_entries():
+            index, work, path, orig = entry
+
+            if index == '?':
+                state = FileState.ADDED
+            elif work == 'D':
+                # a staged file that has since been deleted won't be
+                # committed at all
+                if index == 'A':
+                    continue
+                state = FileState.DELETED
+                path = path if orig is None else orig
+            elif index in 'RC':
+                state = FileState(index)
+                path = f'{orig} -> {path}'
+            else:
+                state = FileState(index if index != '.' else work)
 
-        self.add()
-        status = self.status()
-        self.reset()
+            status.append((state, path))
+
+        if not status:
+            return ['no changes']
 
         diff = []
 
-        for path in status:
+        for path in sorted(status, key=lambda s: s[1]):
             # ignore the paths specified in ignore
             if any((path[1].startswith(i) for i in ignore)):
                 continue
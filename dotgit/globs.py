@@ -0,0 +1,200 @@
+import os
+import re
+import json
+import logging
+
+from dotgit.fsutil import write_atomic
+from dotgit.index import gitignore
+
+
+# the wildcards that make a filelist path a glob pattern, unless they are
+# escaped with a \ (so that files with these characters in their names can
+# still be listed). a ] can be escaped as well
+WILDCARD = re.compile(r'(?<!\\)[*?[]')
+ESCAPED = re.compile(r'\\([*?[\]])')
+
+
+# returns True if the filelist path is a glob pattern or a directory (ending in
+# a /) instead of a single file
+def is_pattern(path):
+    return path.endswith('/') or WILDCARD.search(path) is not None
+
+
+# returns the filename of a filelist path that isn't a pattern, without the
+# escapes in front of its wildcard characters
+def unescape(path):
+    return ESCAPED.sub(r'\1', path)
+
+
+# compiles a filelist pattern into a regex that matches relative file paths.
+# "*" and "?" don't match across directories, "**" matches any number of
+# directories and a directory entry (ending in a /) matches everything below it
+def compile_pattern(pattern):
+    if pattern.endswith('/'):
+        pattern += '**'
+
+    regex = ''
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+            continue
+        if pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+            continue
+
+        if ESCAPED.match(pattern, i):
+            regex += re.escape(pattern[i + 1])
+            i += 2
+            continue
+
+        if c == '*':
+            regex += '[^/]*'
+        elif c == '?':
+            regex += '[^/]'
+        elif c == '[':
+            end = pattern.find(']', i + 2)
+            if end == -1:
+                regex += re.escape(c)
+            else:
+                chars = pattern[i + 1:end]
+                if chars.startswith('!'):
+                    chars = '^' + chars[1:]
+                regex += f'[{chars}]'
+                i = end
+        else:
+            regex += re.escape(c)
+        i += 1
+
+    return re.compile(regex + r'\Z')
+
+
+# returns the directory part of the pattern in front of the first component
+# with a wildcard, which is where a search for the pattern has to start
+def pattern_base(pattern):
+    parts = pattern.split('/')
+    base = []
+    for part in parts[:-1]:
+        if is_pattern(part):
+            break
+        base.append(unescape(part))
+    return '/'.join(base)
+
+
+# returns how many directories below the pattern's base a search for it has
+# to descend, or None if there is no limit
+def pattern_depth(pattern):
+    if pattern.endswith('/') or '**' in pattern:
+        return None
+    base = pattern_base(pattern)
+    return len(pattern.split('/')) - len(base.split('/') if base else []) - 1
+
+
+# walks the directory tree at root/base (up to depth directories deep) with a
+# single scandir traversal and returns the files below it (relative to root)
+# along with the mtime of every directory that was visited (None if it doesn't
+# exist). symlinks to files are included but symlinked directories are not
+# descended into
+def scan(root, base, depth=None):
+    files, dirs = [], {}
+
+    stack = [(base, 0)]
+    while stack:
+        rel, level = stack.pop()
+        path = os.path.join(root, rel)
+        try:
+            dirs[rel] = os.stat(path).st_mtime_ns
+        except OSError:
+            dirs[rel] = None
+            continue
+        try:
+            entries = list(os.scandir(path))
+        except OSError:
+            continue
+
+        for entry in entries:
+            entry_rel = os.path.join(rel, entry.name) if rel else entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if depth is None or level < depth:
+                        stack.append((entry_rel, level + 1))
+                elif entry.is_file():
+                    files.append(entry_rel)
+            except OSError:
+                continue
+
+    return files, dirs
+
+
+# expands filelist patterns to the files they match. the result of each
+# expansion is stored along with the mtimes of the directories that were
+# searched, and re-used until one of the directories changes (which happens
+# when files are added to or removed from it). if fname is None the cache is
+# kept in memory only
+class GlobCache:
+    def __init__(self, fname=None):
+        self.fname = fname
+        self.entries = {}
+        self.dirty = False
+
+        if fname is not None and os.path.isfile(fname):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.fname, 'r') as f:
+                entries = json.load(f)
+        except ValueError:
+            logging.warning(f'corrupt glob cache {self.fname}, ignoring')
+            return
+
+        # directories that were modified in the same timestamp tick as the
+        # cache was written can't be trusted (see Index.load)
+        stamp = os.stat(self.fname).st_mtime_ns
+        self.entries = {key: entry for key, entry in entries.items() if
+                        all(mtime is None or mtime < stamp for mtime in
+                            entry[0].values())}
+
+    def save(self):
+        if self.fname is None or not self.dirty:
+            return
+
+        dirname = os.path.dirname(self.fname)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        write_atomic(self.fname, json.dumps(self.entries))
+        gitignore(self.fname)
+        self.dirty = False
+
+    # returns True if none of the directories changed since they were scanned
+    @staticmethod
+    def valid(root, dirs):
+        for rel, mtime in dirs.items():
+            try:
+                if os.stat(os.path.join(root, rel)).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                if mtime is not None:
+                    return False
+        return True
+
+    # returns the sorted paths (relative to root) of the files that match
+    # pattern
+    def expand(self, root, pattern):
+        base, depth = pattern_base(pattern), pattern_depth(pattern)
+        # patterns with the same base and depth share a single scan
+        key = f'{os.path.join(root, base)}:{depth}'
+
+        entry = self.entries.get(key)
+        if entry is None or not self.valid(root, entry[0]):
+            logging.debug(f'scanning {key} for filelist patterns')
+            files, dirs = scan(root, base, depth)
+            entry = [dirs, files]
+            self.entries[key] = entry
+            self.dirty = True
+
+        regex = compile_pattern(pattern)
+        return sorted(f for f in entry[1] if regex.match(f))
@@ -0,0 +1,53 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# hashes made by older versions of dotgit are sha256 hashes without an
+# algorithm tag
+LEGACY = 'sha256'
+# the (faster) algorithm used for new repos
+DEFAULT = 'blake2b'
+
+# files are read in large chunks to keep the per-call overhead low
+CHUNK_SIZE = 1 << 20
+
+
+# adds the algorithm tag to a hex digest. sha256 hashes are left untagged so
+# that they stay compatible with the hashes stored by older versions
+def tag(algorithm, hexdigest):
+    if algorithm == LEGACY:
+        return hexdigest
+    return f'{algorithm}:{hexdigest}'
+
+
+# returns the algorithm that was used to make a (tagged) digest
+def algorithm_of(digest):
+    if ':' in digest:
+        return digest.split(':', 1)[0]
+    return LEGACY
+
+
+# calculates the hash of the file at path and returns its tagged hex digest
+def hash_file(path, algorithm=LEGACY):
+    h = hashlib.new(algorithm)
+
+    with open(path, 'rb') as f:
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            size = f.readinto(buf)
+            if not size:
+                break
+            # hashlib releases the GIL for large updates so this can run in
+            # parallel with other threads
+            h.update(view[:size])
+
+    return tag(algorithm, h.hexdigest())
+
+
+# hashes multiple files in parallel and returns their digests in the same order
+# as the paths
+def hash_files(paths, algorithm=LEGACY, workers=None):
+    workers = workers if workers else (os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda p: hash_file(p, algorithm), paths))
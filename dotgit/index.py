@@ -0,0 +1,222 @@
+import os
+import json
+import logging
+import threading
+
+from dotgit.fsutil import write_atomic
+from dotgit.hashing import hash_file, hash_files, algorithm_of, DEFAULT
+
+
+# makes sure that fname is ignored by git by listing it in the .gitignore file
+# in the same directory. used for machine-local files that live in the repo
+def gitignore(fname):
+    dirname, basename = os.path.split(fname)
+    ignore_file = os.path.join(dirname, '.gitignore')
+
+    entries = []
+    if os.path.isfile(ignore_file):
+        with open(ignore_file, 'r') as f:
+            entries = f.read().splitlines()
+
+    if basename not in entries:
+        with open(ignore_file, 'a') as f:
+            f.write(f'{basename}\n')
+
+
+# keeps track of the stat info and content hash of files, similar in spirit to
+# git's index. if a file's stat info has not changed since it was last hashed
+# the stored hash is used instead of reading the file again. if fname is None
+# the index is kept in memory only.
+#
+# if root is given the index also keeps a journal of the paths inside root
+# that were changed since the last commit, so that only those need to be
+# staged
+class Index:
+    def __init__(self, fname=None, root=None):
+        self.fname = fname
+        self.root = None if root is None else os.path.abspath(str(root))
+        self.entries = {}
+        self.dirty = False
+        # ops can be applied from multiple threads
+        self.lock = threading.RLock()
+
+        self.journal = None
+        self.touched = set()
+        # the journal only covers all the changes if it was kept since the
+        # last commit
+        self.complete = True
+        if fname is not None and self.root is not None:
+            self.journal = os.path.join(os.path.dirname(fname), 'touched')
+            self.complete = os.path.isfile(self.journal)
+            if self.complete:
+                with open(self.journal, 'r', errors='surrogateescape') as f:
+                    self.touched = set(p for p in f.read().split('\0') if p)
+
+        if fname is not None and os.path.isfile(fname):
+            self.load()
+
+    def load(self):
+        try:
+            with open(self.fname, 'r') as f:
+                entries = json.load(f)
+        except ValueError:
+            logging.warning(f'corrupt index {self.fname}, ignoring')
+            return
+
+        # entries for files that were modified in the same timestamp tick
+        # that the index was written in can't be trusted since the file might
+        # have been modified after it was hashed without changing its stat
+        # info (the "racy git" problem)
+        stamp = os.stat(self.fname).st_mtime_ns
+        self.entries = {path: entry for path, entry in entries.items()
+                        if entry[3] < stamp}
+
+    # writes the index to disk if it has been changed
+    def save(self):
+        if self.fname is None or not self.dirty:
+            return
+
+        dirname = os.path.dirname(self.fname)
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+        with self.lock:
+            write_atomic(self.fname, json.dumps(self.entries))
+
+        gitignore(self.fname)
+        self.dirty = False
+
+    @staticmethod
+    def key(path):
+        return os.path.abspath(str(path))
+
+    @staticmethod
+    def stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns]
+
+    # returns the stored hash for path if the file has not changed since it was
+    # recorded, otherwise returns None. if algorithm is given None is also
+    # returned if the stored hash was made with a different algorithm
+    def lookup(self, path, algorithm=None):
+        key = self.key(path)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        if entry[:4] != self.stat(key):
+            self.forget(key)
+            return None
+        if algorithm is not None and algorithm_of(entry[4]) != algorithm:
+            return None
+        return entry[4]
+
+    # records the hash of the file currently at path
+    def record(self, path, digest):
+        key = self.key(path)
+        st = self.stat(key)
+        if st is None:
+            return
+        with self.lock:
+            self.entries[key] = st + [digest]
+            self.dirty = True
+
+    # returns the hash of the file at path, only reading the file if it has
+    # changed since it was last hashed
+    def hash(self, path, algorithm=DEFAULT):
+        digest = self.lookup(path, algorithm)
+        if digest is None:
+            digest = hash_file(str(path), algorithm)
+            self.record(path, digest)
+        return digest
+
+    # makes sure that the hashes of all the given paths are in the index,
+    # hashing the files that changed in parallel
+    def hash_many(self, paths, algorithm=DEFAULT):
+        paths = [p for p in paths if self.lookup(p, algorithm) is None]
+        if len(paths) < 2:
+            for path in paths:
+                self.hash(path, algorithm)
+            return
+
+        for path, digest in zip(paths, hash_files(paths, algorithm)):
+            self.record(path, digest)
+
+    # removes path (and everything below it) from the index
+    def forget(self, path):
+        key = self.key(path)
+        with self.lock:
+            if self.entries.pop(key, None) is not None:
+                self.dirty = True
+
+            prefix = key + os.sep
+            if os.path.isdir(key):
+                for entry in [e for e in self.entries if e.startswith(prefix)]:
+                    self.entries.pop(entry)
+                    self.dirty = True
+
+    # records that dest is a copy of source, re-using source's hash if it is
+    # known
+    def copy(self, source, dest):
+        self.forget(dest)
+        digest = self.lookup(source)
+        if digest is not None:
+            self.record(dest, digest)
+
+    # moves source's entry to dest, a rename does not change a file's stat info
+    # so the entry stays valid
+    def move(self, source, dest):
+        with self.lock:
+            self.forget(dest)
+            entry = self.entries.pop(self.key(source), None)
+            if entry is not None:
+                self.entries[self.key(dest)] = entry
+                self.dirty = True
+
+    # records that path was changed. the change is written to the journal
+    # straight away so that it isn't lost if dotgit doesn't exit cleanly
+    def touch(self, path):
+        if self.root is None:
+            return
+
+        key = self.key(path)
+        if not key.startswith(self.root + os.sep):
+            return
+        path = os.path.relpath(key, self.root)
+
+        with self.lock:
+            if path in self.touched:
+                return
+            self.touched.add(path)
+
+            if self.journal is not None:
+                if not os.path.isfile(self.journal):
+                    dirname = os.path.dirname(self.journal)
+                    if not os.path.isdir(dirname):
+                        os.makedirs(dirname)
+                    gitignore(self.journal)
+                with open(self.journal, 'a', errors='surrogateescape') as f:
+                    f.write(path + '\0')
+
+    # returns the paths (relative to root) that were changed since the journal
+    # was last cleared, or None if the journal wasn't kept since the last
+    # commit (e.g. the repo was committed by an older version of dotgit)
+    def touched_paths(self):
+        if not self.complete:
+            return None
+        return sorted(self.touched)
+
+    # clears the journal, e.g. after the changes were committed
+    def clear_touched(self):
+        with self.lock:
+            self.touched = set()
+            self.complete = True
+            if self.journal is not None:
+                dirname = os.path.dirname(self.journal)
+                if not os.path.isdir(dirname):
+                    os.makedirs(dirname)
+                gitignore(self.journal)
+                open(self.journal, 'w').close()
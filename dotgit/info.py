@@ -1,5 +1,5 @@
+import os
 from os.path import expanduser
-import socket
 
 __version__ = '2.2.9'
 __author__ = 'Kobus van Schoor'
@@ -8,4 +8,21 @@ __url__ = 'https://github.com/kobus-v-schoor/dotgit'
 __license__ = 'GNU General Public License v2 (GPLv2)'
 
 home = expanduser('~')
-hostname = socket.gethostname()
+
+
+# the hostname is only looked up when it is first needed, use get_hostname
+# instead of reading it directly
+hostname = None
+
+
+def get_hostname():
+    global hostname
+
+    if hostname is None:
+        try:
+            # the same as socket.gethostname() without importing socket
+            hostname = os.uname().nodename
+        except AttributeError:
+            import socket
+            hostname = socket.gethostname()
+    return hostname
@@ -0,0 +1,214 @@
+import os
+import json
+import shutil
+import logging
+
+from dotgit.file_ops import Op
+from dotgit.fsutil import write_atomic
+from dotgit.index import gitignore
+from dotgit.plan import Plan, VERSION
+
+
+# a write-ahead journal of the file operations of a run, so that a run that
+# is interrupted halfway (e.g. by a failing op or Ctrl-C) can be rolled back
+# or resumed afterwards. before any op is executed the ops are written to the
+# journal (in the plan format) and fsync'd, after which a record is appended
+# when each op starts and when it is done. removed files are moved into a
+# trash directory instead of being deleted so that they can be put back. once
+# all the ops are done the journal and the trash are deleted
+class Journal:
+    hint = ('run "dotgit recover resume" to finish the changes or '
+            '"dotgit recover rollback" to undo them')
+
+    def __init__(self, data_dir, home, repo, plugins, index=None,
+                 settings=None):
+        self.fname = os.path.join(data_dir, 'journal')
+        self.trash_dir = os.path.join(data_dir, 'trash')
+        self.plan = Plan(home, repo, plugins, index)
+        self.plugins = plugins
+        self.index = index
+        self.settings = settings or {}
+        self.fd = None
+        self.started = set()
+        self.done = set()
+
+    # returns if there is a journal of an interrupted run
+    def exists(self):
+        return os.path.isfile(self.fname)
+
+    # where the file removed by op i is moved to
+    def trash(self, i):
+        return os.path.join(self.trash_dir, str(i))
+
+    # where the copy of a plugin's data file is kept (see Plugin.data_files)
+    def data_trash(self, name, path):
+        return os.path.join(self.trash_dir, 'data', name,
+                            os.path.basename(path))
+
+    # writes the ops of fops to the journal, must be called before any of the
+    # ops are executed. the plugins' data is copied into the trash first, so
+    # that it can be reverted along with the files
+    def begin(self, fops):
+        self.plan.ops = []
+        self.plan.add(fops, fingerprint=False)
+        header = json.dumps({'version': VERSION, 'settings': self.settings,
+                             'ops': self.plan.ops})
+
+        # the trash could be left behind if the journal was deleted by hand
+        shutil.rmtree(self.trash_dir, ignore_errors=True)
+        os.makedirs(self.trash_dir)
+        for name, plugin in self.plugins.items():
+            for path in plugin.data_files():
+                if not os.path.exists(path):
+                    continue
+                trash = self.data_trash(name, path)
+                os.makedirs(os.path.dirname(trash), exist_ok=True)
+                with open(path, 'rb') as f:
+                    write_atomic(trash, f.read())
+
+        gitignore(self.fname)
+        gitignore(self.trash_dir)
+        write_atomic(self.fname, header + '\n')
+        self.open()
+
+    def open(self):
+        self.started, self.done = set(), set()
+        self.fd = os.open(self.fname, os.O_WRONLY | os.O_APPEND)
+
+    # appends a record to the journal. the records are written straight to
+    # the file so that they survive dotgit being killed, but they aren't
+    # fsync'd since that would make every op a lot slower
+    def record(self, kind, i):
+        os.write(self.fd, f'{kind} {i}\n'.encode())
+        (self.started if kind == 'start' else self.done).add(i)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    # deletes the journal and the trash once all the ops are done (or undone)
+    def commit(self):
+        self.close()
+        shutil.rmtree(self.trash_dir, ignore_errors=True)
+        os.remove(self.fname)
+
+    # loads the journal of an interrupted run, returning its settings. raises
+    # a RuntimeError if it can't be read
+    def load(self):
+        with open(self.fname, 'r') as f:
+            header, *records = f.read().splitlines()
+        settings = self.plan.load(header)
+
+        self.started, self.done = set(), set()
+        for line in records:
+            kind, _, i = line.partition(' ')
+            # the last record is cut short if dotgit died while writing it
+            if kind not in ['start', 'done'] or not i.isdigit():
+                continue
+            (self.started if kind == 'start' else self.done).add(int(i))
+        return settings
+
+    # returns the (resolved) ops of the loaded journal along with the FileOps
+    # that executes them
+    def fileops(self):
+        fops = self.plan.fileops()
+        return fops, [fops.resolve_op(op) for op in fops.ops]
+
+    # returns if op i, which was started but not recorded as done, did
+    # complete. only removes and moves can be checked, the other ops are
+    # simply executed again. a remove is complete once the file is in the
+    # trash (see file_ops.move_to_trash)
+    def completed(self, i, op, path):
+        if op == Op.REMOVE:
+            return os.path.lexists(self.trash(i))
+        if op == Op.MOVE:
+            src, dest = path
+            return os.path.lexists(dest) and not os.path.lexists(src)
+        return False
+
+    # undoes op i, which can also be an op that only partially completed
+    def undo(self, i, op, path):
+        changed = []
+        if op == Op.REMOVE:
+            trash = self.trash(i)
+            remove(trash + '.part')
+            if os.path.lexists(trash):
+                # what is left of the file if dotgit died while deleting it
+                # after copying it into the trash
+                remove(path)
+                shutil.move(trash, path)
+                changed.append(path)
+        elif op == Op.MKDIR:
+            try:
+                os.rmdir(path)
+            except OSError:
+                # the directory is not empty or was never created
+                pass
+        elif op == Op.MOVE:
+            src, dest = path
+            if self.completed(i, op, path):
+                shutil.move(dest, src)
+                changed += [src, dest]
+        else:
+            dest = path[1]
+            if remove(dest):
+                changed.append(dest)
+
+        if self.index is not None:
+            for p in changed:
+                self.index.forget(p)
+                self.index.touch(p)
+
+    # undoes all the ops that were started, in reverse order, and puts back
+    # the plugins' data from before the run
+    def rollback(self):
+        fops, ops = self.fileops()
+        for i in reversed(range(len(ops))):
+            if i in self.started:
+                logging.info(f'undoing {fops.str_op(*ops[i])}')
+                self.undo(i, *ops[i])
+
+        for name, plugin in self.plugins.items():
+            for path in plugin.data_files():
+                trash = self.data_trash(name, path)
+                if os.path.exists(trash):
+                    with open(trash, 'rb') as f:
+                        write_atomic(path, f.read())
+                else:
+                    remove(path)
+            plugin.setup_data()
+        self.commit()
+
+    # executes the ops that are not done yet. an op that was started but did
+    # not complete is undone before it is executed again
+    def resume(self):
+        fops, ops = self.fileops()
+
+        started, done = self.started, self.done
+        self.open()
+        for i, (op, path) in enumerate(ops):
+            if i in done:
+                continue
+            if i in started:
+                if self.completed(i, op, path):
+                    if op == Op.REMOVE:
+                        remove(path)
+                    self.record('done', i)
+                    continue
+                self.undo(i, op, path)
+
+            logging.info(fops.str_op(op, path))
+            fops.run_journaled(ops, i, self)
+        self.commit()
+
+
+# removes the file or directory at path if it exists, returns if it did
+def remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+    else:
+        return False
+    return True
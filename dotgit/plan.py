@@ -0,0 +1,177 @@
+import os
+import json
+import logging
+
+from dotgit.file_ops import FileOps, Op
+
+# bump this when the plan format changes
+VERSION = 1
+
+
+# a serializable list of file operations that can be applied later (or on
+# another machine). paths are stored relative to the home directory or the
+# repo so that the plan can be applied to a different home and repo, and for
+# every path the state it had when the plan was made is stored so that a plan
+# is never applied to files that changed in the meantime
+class Plan:
+    # the only plugin methods a plan may call, since the plan file could have
+    # been changed to call anything else
+    plugin_methods = ['apply', 'remove']
+
+    def __init__(self, home, repo, plugins, index=None):
+        self.roots = {'home': os.path.abspath(str(home)),
+                      'repo': os.path.abspath(str(repo))}
+        self.plugins = plugins
+        self.index = index
+        self.ops = []
+
+    # converts an absolute path into a (root, relative path) pair
+    def encode(self, path):
+        path = os.path.abspath(path)
+        # the repo usually lives inside home so it has to be checked first
+        for root in ['repo', 'home']:
+            prefix = self.roots[root] + os.sep
+            if path == self.roots[root] or path.startswith(prefix):
+                return [root, os.path.relpath(path, self.roots[root])]
+        return ['abs', path]
+
+    # converts a (root, relative path) pair back into an absolute path. raises
+    # a RuntimeError if the path doesn't lie inside home or the repo, since
+    # the plan file could have been changed to point anywhere else
+    def decode(self, path):
+        root, path = path
+        if root not in ['home', 'repo']:
+            logging.error(f'invalid path "{path}" in plan, only paths inside '
+                          'the home directory and the repo are allowed')
+            raise RuntimeError
+
+        decoded = os.path.normpath(os.path.join(self.roots[root], path))
+        if decoded != self.roots[root] and not decoded.startswith(
+                self.roots[root] + os.sep):
+            logging.error(f'invalid path "{path}" in plan, it lies outside '
+                          f'the {root} directory')
+            raise RuntimeError
+        return decoded
+
+    # returns the current state of path: None if it doesn't exist, otherwise
+    # its type along with its link target or content hash
+    def fingerprint(self, path):
+        if os.path.islink(path):
+            target = os.path.join(os.path.dirname(path), os.readlink(path))
+            return ['link'] + self.encode(target)
+        if os.path.isdir(path):
+            return ['dir']
+        if os.path.isfile(path):
+            digest = (self.index.hash(path) if self.index is not None else
+                      None)
+            return ['file', os.path.getsize(path), digest]
+        return None
+
+    # adds the ops of fops to the plan. the state of each path is recorded the
+    # first time it is used in the plan, later ops see the changes made by
+    # the ops before them. with fingerprint=False the states aren't recorded,
+    # so the plan isn't checked for changed files when it is applied
+    def add(self, fops, fingerprint=True):
+        seen = set(tuple(op['paths'][i]) for op in self.ops for i, pre in
+                   op['pre'])
+
+        for op in fops.ops:
+            op, path = fops.resolve_op(op)
+            paths = list(path) if type(path) is tuple else [path]
+
+            # pre is a list of (path index, fingerprint) pairs
+            entry = {'paths': [self.encode(p) for p in paths], 'pre': []}
+            if isinstance(op, Op):
+                entry['op'] = op.name.lower()
+            else:
+                name = [n for n, p in self.plugins.items() if p is
+                        op.__self__][0]
+                entry['op'] = 'plugin'
+                entry['plugin'] = [name, op.__name__]
+
+            for i, p in enumerate(paths if fingerprint else []):
+                if tuple(entry['paths'][i]) not in seen:
+                    seen.add(tuple(entry['paths'][i]))
+                    entry['pre'].append([i, self.fingerprint(p)])
+
+            self.ops.append(entry)
+
+    def dump(self, **settings):
+        return json.dumps({'version': VERSION, 'settings': settings,
+                           'ops': self.ops}, indent=1)
+
+    # loads a dumped plan, returning its settings
+    def load(self, content):
+        try:
+            data = json.loads(content)
+        except ValueError:
+            logging.error('unable to parse plan file')
+            raise RuntimeError
+        if type(data) is not dict or data.get('version') != VERSION:
+            logging.error('unsupported plan file version')
+            raise RuntimeError
+
+        # every op is checked up front, so that a broken plan is rejected
+        # before any of it is used
+        try:
+            ops, settings = data['ops'], data['settings']
+            if type(settings) is not dict:
+                raise TypeError
+            for op in ops:
+                for path in op['paths']:
+                    self.decode(path)
+                if any(i not in range(len(op['paths'])) for i, pre in
+                       op['pre']):
+                    raise IndexError
+                self.decode_op(op)
+        except (KeyError, TypeError, ValueError, IndexError, AttributeError):
+            logging.error('invalid plan file')
+            raise RuntimeError
+
+        self.ops = ops
+        return settings
+
+    # returns the paths whose state doesn't match the state they had when the
+    # plan was made
+    def stale(self):
+        stale = []
+        for op in self.ops:
+            for i, pre in op['pre']:
+                path = self.decode(op['paths'][i])
+                if self.fingerprint(path) != pre:
+                    stale.append(path)
+        return stale
+
+    # converts the plan back into file operations, raises a RuntimeError if
+    # any of the files changed since the plan was made
+    def fileops(self):
+        stale = self.stale()
+        if stale:
+            for path in stale:
+                logging.error(f'{path} changed since the plan was made')
+            raise RuntimeError
+
+        fops = FileOps(self.roots['repo'], self.index)
+        for op in self.ops:
+            paths = [self.decode(p) for p in op['paths']]
+            path = tuple(paths) if len(paths) > 1 else paths[0]
+
+            fops.ops.append((self.decode_op(op), path))
+
+        return fops
+
+    # returns the operation (an Op or a plugin method) of a loaded op, raises
+    # a RuntimeError if it isn't one that can be in a plan
+    def decode_op(self, op):
+        if op['op'] == 'plugin':
+            name, method = op['plugin']
+            if name in self.plugins and method in self.plugin_methods:
+                return getattr(self.plugins[name], method)
+            logging.error(f'invalid plugin operation "{name}.{method}" in '
+                          'plan')
+            raise RuntimeError
+
+        if op['op'].upper() not in Op.__members__:
+            logging.error(f'invalid operation "{op["op"]}" in plan')
+            raise RuntimeError
+        return Op[op['op'].upper()]
@@ -1,10 +1,15 @@
 import os
 
+from dotgit.index import Index
+
 
 class Plugin:
-    def __init__(self, data_dir, repo_dir=None):
+    def __init__(self, data_dir, repo_dir=None, index=None):
         self.data_dir = data_dir
         self.repo_dir = '/' if repo_dir is None else repo_dir
+        # the index is used to avoid re-reading files that have not changed,
+        # if no index is given an in-memory index is used
+        self.index = Index() if index is None else index
 
         if not os.path.isdir(self.data_dir):
             os.makedirs(self.data_dir)
@@ -20,6 +25,16 @@ class Plugin:
     def clean_data(self, manifest):
         pass
 
+    # saves the plugin's data to the data_dir
+    def save_data(self):
+        pass
+
+    # returns the paths of the files in the data_dir that hold the plugin's
+    # data. the journal keeps a copy of them so that the data can be reverted
+    # along with the files when an interrupted run is rolled back
+    def data_files(self):
+        return []
+
     # takes a source (outside the repo) and applies its operation and store the
     # resulting file in dest (inside the repo). This operation should not
     # remove the source file
@@ -31,11 +46,36 @@ class Plugin:
     def remove(self, source, dest):
         pass
 
+    # takes one of the plugin's ops and returns a callable that applies the op
+    # to a list of (source, dest) pairs at once, or None if the op can only be
+    # applied to one pair at a time. the pairs don't depend on each other
+    def batch(self, op):
+        return None
+
     # takes a path to a repo_file and an ext_file and compares them, should
     # return true if they are the same file
     def samefile(self, repo_file, ext_file):
         pass
 
+    # takes a repo_file and an ext_file that are not the same file (see
+    # samefile) and returns true if they should be, e.g. a hardlink that was
+    # broken when git replaced repo_file. ext_file is then not simply taken as
+    # the newer version of the file: it is linked again if it has the same
+    # content as repo_file (see samecontent), otherwise the versions conflict
+    def broken_link(self, repo_file, ext_file):
+        return False
+
+    # takes a path to a repo_file and an ext_file and compares their content,
+    # should return true if they have the same content
+    def samecontent(self, repo_file, ext_file):
+        return False
+
+    # takes a list of (repo_file, ext_file) pairs that are about to be compared
+    # with samefile, allowing the plugin to prepare the comparison for all of
+    # them at once (e.g. by hashing the files in parallel)
+    def prefetch(self, pairs):
+        pass
+
     # takes a callable (one of the plugin's ops) and returns a string
     # describing the op
     def strify(self, op):
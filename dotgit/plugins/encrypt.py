@@ -6,13 +6,22 @@ import getpass
 import hashlib
 import os
 import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 from dotgit.plugin import Plugin
+from dotgit.fsutil import write_atomic
+from dotgit.index import gitignore
+from dotgit.hashing import algorithm_of, DEFAULT
+import dotgit.tracing as tracing
 
 
 class GPG:
-    def __init__(self, password):
+    def __init__(self, password, workers=None):
         self.password = password
+        # the maximum number of gpg processes that are run at the same time
+        self.workers = workers if workers else (os.cpu_count() or 1)
+        self.slots = threading.BoundedSemaphore(self.workers)
 
     def run(self, cmd):
         if not type(cmd) is list:
@@ -28,9 +37,11 @@ class GPG:
         logging.debug(f'running gpg command {cmd}')
 
         try:
-            proc = subprocess.run(cmd, input=self.password.encode(),
-                                  stdout=subprocess.PIPE,
-                                  stderr=subprocess.PIPE, check=True)
+            with self.slots, tracing.span(f'gpg {cmd[-2]}', 'gpg', cmd=cmd,
+                                          bytes=tracing.size(cmd[-1])):
+                proc = subprocess.run(cmd, input=self.password.encode(),
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.PIPE, check=True)
         except subprocess.CalledProcessError as e:
             logging.error(e.stderr.decode())
             logging.error(f'gpg command {cmd} failed with exit code '
@@ -40,27 +51,34 @@ class GPG:
         logging.debug(f'gpg command {cmd} succeeded')
         return proc.stdout.decode()
 
-    def encrypt(self, input_file, output_file):
-        self.run(f'gpg --armor --output {shlex.quote(output_file)} '
-                 f'--symmetric {shlex.quote(input_file)}')
+    # runs multiple gpg commands on a pool of workers and returns their output
+    # in the same order as the commands
+    def run_many(self, cmds):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self.run, cmds))
 
-    def decrypt(self, input_file, output_file):
-        self.run(f'gpg --output {shlex.quote(output_file)} '
-                 f'--decrypt {shlex.quote(input_file)}')
+    @staticmethod
+    def encrypt_cmd(input_file, output_file):
+        return ['gpg', '--armor', '--output', output_file, '--symmetric',
+                input_file]
 
+    @staticmethod
+    def decrypt_cmd(input_file, output_file):
+        return ['gpg', '--output', output_file, '--decrypt', input_file]
 
-# calculates the sha256 hash of the file at fpath
-def hash_file(path):
-    h = hashlib.sha256()
+    def encrypt(self, input_file, output_file):
+        self.run(self.encrypt_cmd(input_file, output_file))
 
-    with open(path, 'rb') as f:
-        while True:
-            chunk = f.read(h.block_size)
-            if not chunk:
-                break
-            h.update(chunk)
+    def decrypt(self, input_file, output_file):
+        self.run(self.decrypt_cmd(input_file, output_file))
 
-    return h.hexdigest()
+    # encrypts/decrypts a list of (input_file, output_file) pairs on the worker
+    # pool
+    def encrypt_many(self, files):
+        self.run_many([self.encrypt_cmd(i, o) for i, o in files])
+
+    def decrypt_many(self, files):
+        self.run_many([self.decrypt_cmd(i, o) for i, o in files])
 
 
 # hash password using suitable key-stretching algorithm
@@ -77,14 +95,22 @@ def key_stretch(password, salt):
 
 
 class EncryptPlugin(Plugin):
+    # the number of pending changes after which the hashes and modes are saved
+    checkpoint = 100
+
     def __init__(self, data_dir, *args, **kwargs):
         self.gpg = None
         self.hashes_path = os.path.join(data_dir, 'hashes')
         self.modes_path = os.path.join(data_dir, 'modes')
+        self.pending_path = os.path.join(data_dir, 'pending')
         self.pword_path = os.path.join(data_dir, 'passwd')
+        # ops can be applied from multiple threads, so access to the password
+        # prompt and the stored data is serialised
+        self.lock = threading.RLock()
         super().__init__(*args, data_dir=data_dir, **kwargs)
 
-    # reads the stored hashes
+    # reads the stored hashes, including the changes that were still pending
+    # when dotgit last exited
     def setup_data(self):
         if os.path.exists(self.hashes_path):
             with open(self.hashes_path, 'r') as f:
@@ -98,6 +124,27 @@ class EncryptPlugin(Plugin):
         else:
             self.modes = {}
 
+        self.pending = 0
+        if os.path.exists(self.pending_path):
+            with open(self.pending_path, 'r') as f:
+                for line in f:
+                    try:
+                        path, digest, mode = json.loads(line)
+                    except ValueError:
+                        # the last line might have been cut short
+                        break
+                    self.hashes[path] = digest
+                    self.modes[path] = mode
+            logging.debug('recovered pending encrypt plugin data')
+            self.save_data()
+
+        # new repos use the default hash algorithm while existing repos keep
+        # using the algorithm their hashes were made with
+        if self.hashes:
+            self.algorithm = algorithm_of(next(iter(self.hashes.values())))
+        else:
+            self.algorithm = DEFAULT
+
     # removes file entries in modes and hashes that are no longer in the
     # manifest
     def clean_data(self, manifest):
@@ -107,12 +154,38 @@ class EncryptPlugin(Plugin):
                 data.pop(key)
         self.save_data()
 
-    # saves the current hashes and modes to the data dir
+    # saves the current hashes and modes to the data dir. once they are safely
+    # written the pending changes are no longer needed
     def save_data(self):
-        with open(self.hashes_path, 'w') as f:
-            json.dump(self.hashes, f)
-        with open(self.modes_path, 'w') as f:
-            json.dump(self.modes, f)
+        with self.lock:
+            write_atomic(self.hashes_path, json.dumps(self.hashes))
+            write_atomic(self.modes_path, json.dumps(self.modes))
+
+            if os.path.exists(self.pending_path):
+                os.remove(self.pending_path)
+            self.pending = 0
+
+    def data_files(self):
+        return [self.hashes_path, self.modes_path, self.pending_path]
+
+    # records the metadata of a newly encrypted file. instead of rewriting the
+    # hashes and modes for every file the change is appended to the pending
+    # file, which is read back if dotgit exits before the data is saved. this
+    # is only done after the file was encrypted, so the worst a crash can do
+    # is leave an outdated hash which causes the file to be encrypted again
+    def add_data(self, path, digest, mode):
+        with self.lock:
+            self.hashes[path] = digest
+            self.modes[path] = mode
+
+            if not self.pending:
+                gitignore(self.pending_path)
+            with open(self.pending_path, 'a') as f:
+                f.write(json.dumps([path, digest, mode]) + '\n')
+            self.pending += 1
+
+            if self.pending >= self.checkpoint:
+                self.save_data()
 
     # sets the password in the plugin's data dir. do not use directly, use
     # change_password instead
@@ -151,27 +224,28 @@ class EncryptPlugin(Plugin):
         if repo is not None:
             self.init_password()
 
-            for root, dirs, files in os.walk(repo):
-                for fname in files:
-                    fname = os.path.join(root, fname)
-                    logging.info(f'changing passphrase for '
-                                 f'{os.path.relpath(fname, repo)}')
-
-                    # make a secure temporary file
-                    fs, sfname = tempfile.mkstemp()
-                    # close the file-handle since we won't be using it (just
-                    # there for gpg to write to)
-                    os.close(fs)
-
-                    try:
-                        # decrypt with old passphrase and re-encrypt with new
-                        # passphrase
-                        self.gpg.decrypt(fname, sfname)
-                        new_gpg.encrypt(sfname, fname)
-                    except:  # noqa: E722
-                        raise
-                    finally:
-                        os.remove(sfname)
+            fnames = [os.path.join(root, fname) for root, dirs, files in
+                      os.walk(repo) for fname in files]
+            for fname in fnames:
+                logging.info(f'changing passphrase for '
+                             f'{os.path.relpath(fname, repo)}')
+
+            # make secure temporary files and close the file-handles since we
+            # won't be using them (just there for gpg to write to)
+            tmp_fnames = []
+            for fname in fnames:
+                fs, sfname = tempfile.mkstemp()
+                os.close(fs)
+                tmp_fnames.append(sfname)
+
+            try:
+                # decrypt with old passphrase and re-encrypt with new
+                # passphrase
+                self.gpg.decrypt_many(zip(fnames, tmp_fnames))
+                new_gpg.encrypt_many(zip(tmp_fnames, fnames))
+            finally:
+                for sfname in tmp_fnames:
+                    os.remove(sfname)
 
         self.gpg = new_gpg
         self.save_password(new_pword)
@@ -179,47 +253,98 @@ class EncryptPlugin(Plugin):
 
     # gets the password from the user if needed
     def init_password(self):
-        if self.gpg is not None:
-            return
-
-        if not os.path.exists(self.pword_path):
-            print('No encryption password was found for this repo. To '
-                  'continue please set an encryption password\n')
-            password = self.change_password()
-        else:
-            while True:
-                password = getpass.getpass(prompt='Encryption password: ')
-                if self.verify_password(password):
-                    break
-                print('Incorrect password entered, please try again')
+        with self.lock:
+            if self.gpg is not None:
+                return
+
+            if not os.path.exists(self.pword_path):
+                print('No encryption password was found for this repo. To '
+                      'continue please set an encryption password\n')
+                password = self.change_password()
+            else:
+                while True:
+                    password = getpass.getpass(prompt='Encryption password: ')
+                    if self.verify_password(password):
+                        break
+                    print('Incorrect password entered, please try again')
 
-        self.gpg = GPG(password)
+            self.gpg = GPG(password)
 
     # encrypts a file from outside the repo and stores it inside the repo
     def apply(self, source, dest):
         self.init_password()
         self.gpg.encrypt(source, dest)
+        self.encrypted(source, dest)
 
-        # calculate and store file hash
-        self.hashes[self.strip_repo(dest)] = hash_file(source)
-        # store file mode data (metadata)
-        self.modes[self.strip_repo(dest)] = os.stat(source).st_mode & 0o777
+    # encrypts a list of (source, dest) pairs, running gpg on them in parallel
+    def apply_many(self, pairs):
+        self.init_password()
+        self.gpg.encrypt_many(pairs)
+        for source, dest in pairs:
+            self.encrypted(source, dest)
 
-        self.save_data()
+    # calculate and store file hash and file mode data (metadata) of a source
+    # that was encrypted to dest
+    def encrypted(self, source, dest):
+        digest = self.index.hash(source, self.algorithm)
+        mode = os.stat(source).st_mode & 0o777
+        self.add_data(self.strip_repo(dest), digest, mode)
 
     # decrypts source and saves it in dest
     def remove(self, source, dest):
         self.init_password()
         self.gpg.decrypt(source, dest)
-        os.chmod(dest, self.modes[self.strip_repo(source)])
+        self.decrypted(source, dest)
+
+    # decrypts a list of (source, dest) pairs, running gpg on them in parallel
+    def remove_many(self, pairs):
+        self.init_password()
+        self.gpg.decrypt_many(pairs)
+        for source, dest in pairs:
+            self.decrypted(source, dest)
+
+    # restores the mode of a source that was decrypted to dest
+    def decrypted(self, source, dest):
+        # the mode might not be known if dotgit was killed before the data of
+        # a newly encrypted file was recorded
+        mode = self.modes.get(self.strip_repo(source))
+        if mode is not None:
+            os.chmod(dest, mode)
+
+        # the decrypted file's hash is already known, so record it in the index
+        # to avoid having to read the file again when it is compared
+        digest = self.hashes.get(self.strip_repo(source))
+        if digest is not None:
+            self.index.record(dest, digest)
+
+    # several files are encrypted or decrypted at once on the gpg worker pool
+    def batch(self, op):
+        if op == self.apply:
+            return self.apply_many
+        elif op == self.remove:
+            return self.remove_many
+        return None
 
     # compares the ext_file to repo_file and returns true if they are the same.
     # does this by looking at the repo_file's hash and calculating the hash of
-    # the ext_file
+    # the ext_file (which is only read if it changed since it was last hashed)
+    # with the same algorithm
     def samefile(self, repo_file, ext_file):
-        ext_hash = hash_file(ext_file)
-        repo_file = self.strip_repo(repo_file)
-        return self.hashes.get(repo_file, None) == ext_hash
+        repo_hash = self.hashes.get(self.strip_repo(repo_file), None)
+        if repo_hash is None:
+            return False
+        return self.index.hash(ext_file, algorithm_of(repo_hash)) == repo_hash
+
+    # hashes the ext_files that are about to be compared in parallel
+    def prefetch(self, pairs):
+        paths = {}
+        for repo_file, ext_file in pairs:
+            repo_hash = self.hashes.get(self.strip_repo(repo_file), None)
+            if repo_hash is not None and os.path.isfile(ext_file):
+                paths.setdefault(algorithm_of(repo_hash), []).append(ext_file)
+
+        for algorithm in paths:
+            self.index.hash_many(paths[algorithm], algorithm)
 
     def strify(self, op):
         if op == self.apply:
@@ -1,46 +1,119 @@
 import os
-import shutil
-import filecmp
+import stat
+import errno
+import logging
 
 from dotgit.plugin import Plugin
+from dotgit.fastcopy import copy2
 
 
 class PlainPlugin(Plugin):
     def __init__(self, *args, **kwargs):
         self.hard = kwargs.pop('hard', False)
+        self.hardlink = kwargs.pop('hardlink', False)
         super().__init__(*args, **kwargs)
 
     def setup_data(self):
         pass
 
-    # copies file from outside the repo to the repo
+    # copies file from outside the repo to the repo. in hardlink mode the file
+    # is hardlinked instead
     def apply(self, source, dest):
-        shutil.copy2(source, dest)
+        if self.hardlink:
+            self.link(source, dest)
+        else:
+            copy2(source, dest)
+        self.index.copy(source, dest)
+
+    # hardlinks dest to source, falls back to copying the file if they are on
+    # different filesystems (or the filesystem doesn't support hardlinks)
+    def link(self, source, dest):
+        try:
+            os.link(source, dest)
+        except OSError as e:
+            if e.errno not in [errno.EXDEV, errno.EPERM, errno.EMLINK]:
+                raise
+            logging.warning(f'unable to hardlink "{dest}" to "{source}" '
+                            f'({e.strerror}), copying it instead')
+            copy2(source, dest)
 
     # if not in hard mode, creates a symlink in dest (outside the repo) that
     # points to source (inside the repo)
     # if in hard mode, copies the file from the repo to the dest.
+    # if in hardlink mode, creates a hardlink in dest to source
     def remove(self, source, dest):
-        if self.hard:
-            shutil.copy2(source, dest)
+        if self.hardlink:
+            self.link(source, dest)
+            self.index.copy(source, dest)
+        elif self.hard:
+            copy2(source, dest)
+            self.index.copy(source, dest)
         else:
             os.symlink(source, dest)
 
     # if not in hard mode, checks if symlink points to file in repo
-    # if in hard mode, a bit-by-bit comparison is made to compare the files
+    # if in hard mode, the files' contents are compared (see samecontent)
+    # if in hardlink mode, checks if the files are the same inode, so no
+    # content needs to be compared
     def samefile(self, repo_file, ext_file):
-        if self.hard:
-            if os.path.islink(ext_file):
+        if self.hardlink:
+            try:
+                repo_st, ext_st = os.lstat(repo_file), os.lstat(ext_file)
+            except OSError:
                 return False
-            if not os.path.exists(repo_file):
+            if stat.S_ISLNK(ext_st.st_mode):
                 return False
-            return filecmp.cmp(repo_file, ext_file, shallow=False)
+            repo_id = (repo_st.st_dev, repo_st.st_ino)
+            return repo_id == (ext_st.st_dev, ext_st.st_ino)
+        elif self.hard:
+            return self.samecontent(repo_file, ext_file)
         else:
             # not using os.samefile since it resolves repo_file as well which
             # is not what we want
             return os.path.realpath(ext_file) == os.path.abspath(repo_file)
 
+    # in hardlink mode, a regular file outside the repo that is not a
+    # hardlink of the file in the repo was unlinked, e.g. when git replaced
+    # the file in the repo during a pull or checkout
+    def broken_link(self, repo_file, ext_file):
+        if not self.hardlink or os.path.islink(ext_file):
+            return False
+        if not os.path.isfile(repo_file) or not os.path.isfile(ext_file):
+            return False
+        return not self.samefile(repo_file, ext_file)
+
+    # compares the files' content hashes. the hashes come from the index so
+    # files that have not changed are not read again
+    def samecontent(self, repo_file, ext_file):
+        # a symlink is never a copy of the file in the repo, even if it points
+        # to it, so that hard mode turns it into a copy when restoring and
+        # leaves it alone when cleaning
+        if os.path.islink(ext_file):
+            return False
+        if not os.path.exists(repo_file):
+            return False
+        if os.path.getsize(repo_file) != os.path.getsize(ext_file):
+            return False
+        return self.index.hash(repo_file) == self.index.hash(ext_file)
+
+    # in hard mode, hashes the files that are about to be compared in parallel
+    def prefetch(self, pairs):
+        if not self.hard or self.hardlink:
+            return
+
+        paths = []
+        for repo_file, ext_file in pairs:
+            if not os.path.isfile(repo_file) or not os.path.isfile(ext_file):
+                continue
+            if os.path.islink(ext_file):
+                continue
+            if os.path.getsize(repo_file) == os.path.getsize(ext_file):
+                paths += [repo_file, ext_file]
+        self.index.hash_many(paths)
+
     def strify(self, op):
+        if self.hardlink and op in [self.apply, self.remove]:
+            return "HARDLINK"
         if op == self.apply:
             return "COPY"
         elif op == self.remove:
@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import threading
+import contextlib
+from collections import Counter
+
+import dotgit.tracing as tracing
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# the active profiler, None if profiling is disabled
+active = None
+
+
+# returns a context manager that records the time spent in the named phase if
+# profiling is enabled (and adds a span for it to the trace if tracing is
+# enabled). phases can be nested, the time of a phase includes the time of
+# the phases nested in it
+def phase(name):
+    if active is None:
+        return tracing.span(name, 'phase')
+    return active.phase(name)
+
+
+# reads the number of bytes the process read and wrote (including from the
+# page cache), returns None if it isn't available (e.g. on non-Linux systems)
+def read_io():
+    try:
+        with open('/proc/self/io', 'r') as f:
+            fields = dict(line.split(': ') for line in f.read().splitlines())
+        return int(fields['rchar']), int(fields['wchar'])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# returns the cpu time used by the process and by its (finished) child
+# processes
+def cpu_times():
+    if resource is None:
+        return time.process_time(), 0
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return time.process_time(), children.ru_utime + children.ru_stime
+
+
+# records how long each phase of a run takes along with counts of the
+# expensive calls that were made. the calls are counted by wrapping the
+# functions that make them while the profiler is installed, so that there is
+# no cost at all when profiling is disabled
+class Profiler:
+    def __init__(self):
+        # phase name -> [calls, wall time, cpu time, children cpu time]
+        self.phases = {}
+        self.counts = Counter()
+        self.lock = threading.Lock()
+        self.wrapped = []
+        self.start = None
+
+    def phase(self, name):
+        @contextlib.contextmanager
+        def measure():
+            wall = time.perf_counter()
+            cpu, children = cpu_times()
+            try:
+                with tracing.span(name, 'phase'):
+                    yield
+            finally:
+                end_cpu, end_children = cpu_times()
+                with self.lock:
+                    entry = self.phases.setdefault(name, [0, 0, 0, 0])
+                    entry[0] += 1
+                    entry[1] += time.perf_counter() - wall
+                    entry[2] += end_cpu - cpu
+                    entry[3] += end_children - children
+        return measure()
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counts[name] += amount
+
+    # replaces attr of obj with a wrapper that counts the calls under name
+    def wrap(self, obj, attr, name):
+        func = getattr(obj, attr)
+        count = self.count
+
+        def wrapper(*args, **kwargs):
+            count(name)
+            return func(*args, **kwargs)
+
+        setattr(obj, attr, wrapper)
+        self.wrapped.append((obj, attr, func))
+
+    def wrap_popen(self):
+        import subprocess
+
+        profiler = self
+        popen = subprocess.Popen
+
+        # counts the subprocesses by command and adds up how long they ran
+        class Popen(popen):
+            def __init__(self, args, *a, **kwargs):
+                cmd = args if isinstance(args, str) else args[0]
+                self.profile_name = f'subprocess {os.path.basename(cmd)}'
+                self.profile_start = time.perf_counter()
+                profiler.count(self.profile_name)
+                super().__init__(args, *a, **kwargs)
+
+            def wait(self, *a, **kwargs):
+                running = self.returncode is None
+                status = super().wait(*a, **kwargs)
+                if running:
+                    profiler.count(f'{self.profile_name} seconds',
+                                   time.perf_counter() - self.profile_start)
+                return status
+
+        subprocess.Popen = Popen
+        self.wrapped.append((subprocess, 'Popen', popen))
+
+    # counts the copies made by each method in dotgit.fastcopy
+    def wrap_copies(self):
+        import dotgit.fastcopy as fastcopy
+
+        record = fastcopy.record
+        count = self.count
+
+        def wrapper(method, size):
+            count(f'copy {method}')
+            count(f'copy {method} bytes', size)
+            return record(method, size)
+
+        fastcopy.record = wrapper
+        self.wrapped.append((fastcopy, 'record', record))
+
+    # starts profiling
+    def install(self):
+        global active
+
+        self.wrap(os, 'stat', 'stat')
+        self.wrap(os, 'lstat', 'lstat')
+        self.wrap(os.path, 'realpath', 'realpath')
+
+        # hash_file is imported by name into the modules that use it
+        import dotgit.hashing as hashing
+        hash_file = hashing.hash_file
+        for name, module in list(sys.modules.items()):
+            if not name.startswith('dotgit'):
+                continue
+            if getattr(module, 'hash_file', None) is hash_file:
+                self.wrap(module, 'hash_file', 'hash')
+
+        self.wrap_popen()
+        self.wrap_copies()
+
+        self.io = read_io()
+        self.start = (time.perf_counter(),) + cpu_times()
+        active = self
+
+    # stops profiling and restores the wrapped functions
+    def uninstall(self):
+        global active
+
+        self.total = [1, time.perf_counter() - self.start[0],
+                      cpu_times()[0] - self.start[1],
+                      cpu_times()[1] - self.start[2]]
+        io = read_io()
+        if io is not None and self.io is not None:
+            self.counts['bytes read'] = io[0] - self.io[0]
+            self.counts['bytes written'] = io[1] - self.io[1]
+
+        for obj, attr, func in reversed(self.wrapped):
+            setattr(obj, attr, func)
+        self.wrapped = []
+        active = None
+
+    def report(self):
+        return {'total': dict(zip(['calls', 'wall', 'cpu', 'children_cpu'],
+                                  self.total)),
+                'phases': {name: dict(zip(['calls', 'wall', 'cpu',
+                                           'children_cpu'], entry))
+                           for name, entry in self.phases.items()},
+                'counts': dict(self.counts)}
+
+    def json(self):
+        import json
+        return json.dumps(self.report(), indent=1)
+
+    def table(self):
+        lines = [f'{"phase":<24} {"calls":>6} {"wall":>9} {"cpu":>9} '
+                 f'{"children":>9}']
+        for name, entry in [('total', self.total)] + list(self.phases.items()):
+            calls, wall, cpu, children = entry
+            lines.append(f'{name:<24} {calls:>6} {wall:>8.3f}s {cpu:>8.3f}s '
+                         f'{children:>8.3f}s')
+
+        lines.append('')
+        lines.append(f'{"count":<33} {"total":>12}')
+        for name, count in sorted(self.counts.items()):
+            count = f'{count:.3f}' if type(count) is float else str(count)
+            lines.append(f'{name:<33} {count:>12}')
+
+        return '\n'.join(lines)
@@ -0,0 +1,105 @@
+import os
+import time
+import threading
+import contextlib
+
+import dotgit.info as info
+
+# the active tracer, None if tracing is disabled
+active = None
+
+
+# a context manager that does nothing, like contextlib.nullcontext (which
+# needs python 3.7)
+class NullContext:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = NullContext()
+
+# native thread ids match the ones shown by other tools (e.g. top and perf)
+# but need python 3.8
+get_thread_id = getattr(threading, 'get_native_id', threading.get_ident)
+
+
+# returns a context manager that records a span named name in category cat if
+# tracing is enabled. args are shown along with the span in the trace viewer
+def span(name, cat, **args):
+    if active is None:
+        return NULL_SPAN
+    return active.span(name, cat, args)
+
+
+# records a span that started at start (a time.perf_counter timestamp) and
+# ends now if tracing is enabled
+def event(name, cat, start, **args):
+    if active is not None:
+        active.add(name, cat, start, time.perf_counter(), args)
+
+
+# returns the size of the file at path, or None if it isn't a file (or path is
+# None)
+def size(path):
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+
+# records spans as Chrome trace events (the JSON trace event format that is
+# understood by chrome://tracing and Perfetto), so that a run can be viewed as
+# a timeline with a row per thread
+class Tracer:
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.pid = os.getpid()
+        self.threads = set()
+
+    def span(self, name, cat, args):
+        @contextlib.contextmanager
+        def record():
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                self.add(name, cat, start, time.perf_counter(), args)
+        return record()
+
+    def add(self, name, cat, start, end, args):
+        tid = get_thread_id()
+        # timestamps are in microseconds
+        entry = {'name': name, 'cat': cat, 'ph': 'X', 'pid': self.pid,
+                 'tid': tid, 'ts': (start - self.start) * 1e6,
+                 'dur': (end - start) * 1e6,
+                 'args': {k: v for k, v in args.items() if v is not None}}
+
+        with self.lock:
+            if tid not in self.threads:
+                self.threads.add(tid)
+                name = threading.current_thread().name
+                self.events.append({'name': 'thread_name', 'ph': 'M',
+                                    'pid': self.pid, 'tid': tid,
+                                    'args': {'name': name}})
+            self.events.append(entry)
+
+    def install(self):
+        global active
+        active = self
+
+    def uninstall(self):
+        global active
+        active = None
+
+    def json(self):
+        import json
+        return json.dumps({'traceEvents': self.events,
+                           'displayTimeUnit': 'ms',
+                           'otherData': {'version': info.__version__}})
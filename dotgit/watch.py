@@ -0,0 +1,194 @@
+import os
+import errno
+import select
+import struct
+import logging
+import ctypes
+import ctypes.util
+
+# inotify event flags, see inotify(7)
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+# the events that mean that a file in a watched directory changed
+IN_CHANGED = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_CREATE | IN_DELETE
+IN_CHANGED |= IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE_SELF | IN_MOVE_SELF
+
+EVENT = struct.Struct('iIII')
+
+# how long (in seconds) to wait for a burst of changes to end before acting
+# on them
+DEBOUNCE = 1.0
+
+
+# a thin wrapper around the Linux inotify API
+class Inotify:
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            logging.error('inotify is not supported on this system')
+            raise RuntimeError
+
+        self.libc = libc
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            logging.error(f'unable to start inotify: {os.strerror(err)}')
+            raise RuntimeError
+        # maps the watch descriptors to the watched directories
+        self.watches = {}
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+    # starts watching the directory at path, does nothing if it is already
+    # watched. returns False if the directory couldn't be watched
+    def add(self, path):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path),
+                                         IN_CHANGED | IN_ONLYDIR)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err not in [errno.ENOENT, errno.ENOTDIR]:
+                logging.warning(f'unable to watch {path}: '
+                                f'{os.strerror(err)}')
+            return False
+        self.watches[wd] = path
+        return True
+
+    # waits up to timeout seconds (forever if None) for events and returns the
+    # (path, mask) pair of each one. the path is None if the event queue
+    # overflowed, which means that events were lost
+    def read(self, timeout=None):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, size = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = data[offset:offset + size].rstrip(b'\0')
+            offset += size
+
+            if mask & IN_Q_OVERFLOW:
+                events.append((None, mask))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+
+            path = self.watches.get(wd)
+            if path is None:
+                continue
+            if name:
+                path = os.path.join(path, os.fsdecode(name))
+            events.append((path, mask))
+
+        return events
+
+
+# watches a set of files for changes. targets maps the absolute path of every
+# watched file to a key that is returned when the file changes. the
+# directories the files are in are watched instead of the files themselves so
+# that files that are replaced (e.g. by editors that save by renaming a new
+# file over the old one), created or deleted are also picked up. if a file's
+# directory doesn't exist yet the closest existing parent directory is watched
+# until it is created
+class Watcher:
+    def __init__(self, targets):
+        self.inotify = Inotify()
+        self.targets = {}
+        self.dirs = {}
+        self.update(targets)
+
+    def close(self):
+        self.inotify.close()
+
+    # replaces the watched files with targets
+    def update(self, targets):
+        self.targets = {os.path.abspath(p): k for p, k in targets.items()}
+
+        # group the files by their directory so that the events for a
+        # directory can be matched with its files without a full scan
+        self.dirs = {}
+        for path in self.targets:
+            self.dirs.setdefault(os.path.dirname(path), []).append(path)
+
+        self.refresh()
+
+    # makes sure that the closest existing directory of every file is watched,
+    # needs to be called after directories are created or removed
+    def refresh(self):
+        watched = set(self.inotify.watches.values())
+        for dirname in self.dirs:
+            while dirname not in watched:
+                if self.inotify.add(dirname):
+                    watched.add(dirname)
+                    break
+                parent = os.path.dirname(dirname)
+                if parent == dirname:
+                    break
+                dirname = parent
+
+    # returns the keys of the files affected by a change to path
+    def affected(self, path, mask):
+        if path in self.targets:
+            return {self.targets[path]}
+        if not mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF):
+            return set()
+
+        # a directory changed, which affects all the files below it
+        prefix = path + os.sep
+        return {self.targets[p] for d in self.dirs for p in self.dirs[d] if
+                d == path or d.startswith(prefix)}
+
+    # blocks until watched files change and returns the keys of the changed
+    # files. once a change is seen events are collected until there were none
+    # for delay seconds, so that a burst of changes (e.g. a git checkout) is
+    # handled at once. returns None if events were lost, in which case all
+    # the files should be checked
+    def wait(self, delay=DEBOUNCE):
+        keys = set()
+        lost = False
+        timeout = None
+
+        while True:
+            events = self.inotify.read(timeout)
+            if not events:
+                if timeout is not None:
+                    break
+                continue
+
+            for path, mask in events:
+                if path is None:
+                    lost = True
+                    continue
+                keys |= self.affected(path, mask)
+                if mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF):
+                    self.refresh()
+
+            # the first batch of events was seen, wait for the burst to end.
+            # there's nothing to report if none of the files changed
+            if keys or lost:
+                timeout = delay
+
+        return None if lost else keys
@@ -2,6 +2,7 @@
 
 function _dotgit {
 	local has_action=0
+	local action
 
 	# iterate through the current args to check if we are trying to complete an
 	# action or a category
@@ -16,6 +17,7 @@ function _dotgit {
 		# an action
 		if [[ ${word} != -* ]]; then
 			has_action=1
+			action=$word
 			break
 		fi
 	done
@@ -26,9 +28,16 @@ function _dotgit {
 		COMPREPLY+=("update")
 		COMPREPLY+=("restore")
 		COMPREPLY+=("clean")
+		COMPREPLY+=("watch")
+		COMPREPLY+=("plan")
+		COMPREPLY+=("apply")
+		COMPREPLY+=("recover")
 		COMPREPLY+=("diff")
 		COMPREPLY+=("commit")
 		COMPREPLY+=("passwd")
+	elif [[ $action == "recover" ]]; then
+		COMPREPLY+=("rollback")
+		COMPREPLY+=("resume")
 	else
 		# there is alreay an action specified, so parse the filelist for
 		# category names
@@ -72,6 +81,7 @@ function _dotgit {
 	COMPREPLY+=("--version")
 	COMPREPLY+=("--dry-run")
 	COMPREPLY+=("--hard")
+	COMPREPLY+=("--link-mode")
 
 	# filter options that start with the current word
 	COMPREPLY=($(compgen -W "${COMPREPLY[*]}" -- ${COMP_WORDS[COMP_CWORD]}))
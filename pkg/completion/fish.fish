@@ -3,7 +3,7 @@
 
 function __fish_dotgit_no_subcommand -d 'Test if dotgit has yet to be given the subcommand'
 	for i in (commandline -opc)
-		if contains -- $i init update restore clean diff commit passwd
+		if contains -- $i init update restore clean watch plan apply recover diff commit passwd
 			return 1
 		end
 	end
@@ -14,6 +14,10 @@ complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'init' -d 'Setup a new
 complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'update' -d 'Update the repository structure to match filelists'
 complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'restore' -d 'Create links from the home folder to the repository'
 complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'clean' -d 'Remove links in the home folder'
+complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'watch' -d 'Keep updating the repository as files change'
+complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'plan' -d 'Save the changes a restore would make to a plan file'
+complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'apply' -d 'Apply a plan file'
+complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'recover' -d 'Roll back or resume an interrupted run'
 complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'diff' -d 'Print the current changes'
 complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'commit' -d 'Generate a commit and push the changes'
 complete -f -n '__fish_dotgit_no_subcommand' -c dotgit -a 'passwd' -d 'Change the dotgit encryption password'
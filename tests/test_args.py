@@ -1,11 +1,15 @@
 import logging
 import socket
 
+import pytest
+
 from dotgit.args import Arguments
-from dotgit.enums import Actions
+from dotgit.enums import Actions, Conflict, LinkMode, Recover
 
 class TestArguments:
-    valid_actions = [a.value for a in Actions]
+    # apply and recover need arguments so they are tested separately
+    valid_actions = [a.value for a in Actions if a not in [Actions.APPLY,
+                                                           Actions.RECOVER]]
 
     def test_verbose(self):
         act = self.valid_actions[0]
@@ -37,6 +41,93 @@ class TestArguments:
         assert not Arguments([act]).hard_mode
         assert Arguments(['--hard', act]).hard_mode
 
+    def test_link_mode(self):
+        act = self.valid_actions[0]
+
+        assert Arguments([act]).link_mode == LinkMode.SYMLINK
+        assert Arguments(['--hard', act]).link_mode == LinkMode.COPY
+        args = Arguments(['--link-mode', 'hard', act])
+        assert args.link_mode == LinkMode.HARD
+        assert args.hard_mode
+        assert not Arguments(['--link-mode=symlink', act]).hard_mode
+        assert Arguments(['--hard', '--link-mode=copy', act]).hard_mode
+
+        with pytest.raises(SystemExit):
+            Arguments(['--hard', '--link-mode=hard', act])
+        with pytest.raises(SystemExit):
+            Arguments(['--link-mode=other', act])
+
+    def test_jobs(self):
+        act = self.valid_actions[0]
+
+        assert Arguments([act]).jobs == 1
+        assert Arguments(['--jobs', '4', act]).jobs == 4
+        assert Arguments(['-j', '2', act]).jobs == 2
+
+        with pytest.raises(SystemExit):
+            Arguments(['-j', '0', act])
+
+    def test_conflict(self):
+        act = self.valid_actions[0]
+
+        assert Arguments([act]).conflict == Conflict.ASK
+        assert Arguments(['--conflict', 'newest', act]).conflict == \
+            Conflict.NEWEST
+
+        with pytest.raises(SystemExit):
+            Arguments(['--conflict', 'foo', act])
+
+    def test_auto_commit(self):
+        assert not Arguments(['watch']).auto_commit
+        assert Arguments(['--auto-commit', 'watch']).auto_commit
+
+    def test_profile(self):
+        act = self.valid_actions[0]
+
+        assert not Arguments([act]).profile
+        assert Arguments(['--profile', act]).profile
+
+        args = Arguments(['--profile-json', 'profile.json', act])
+        assert args.profile
+        assert args.profile_json == 'profile.json'
+
+    def test_trace(self):
+        act = self.valid_actions[0]
+
+        assert Arguments([act]).trace is None
+        assert Arguments(['--trace', 'trace.json', act]).trace == \
+            'trace.json'
+
+    def test_plan(self):
+        assert Arguments(['plan']).output is None
+        assert Arguments(['plan', '-o', 'plan.json']).output == 'plan.json'
+
+        args = Arguments(['apply', 'plan.json'])
+        assert args.action == Actions.APPLY
+        assert args.plan_file == 'plan.json'
+        assert args.categories == ['common', socket.gethostname()]
+
+        with pytest.raises(SystemExit):
+            Arguments(['apply'])
+        with pytest.raises(SystemExit):
+            Arguments(['apply', 'plan.json', 'other.json'])
+
+    def test_recover(self):
+        assert Arguments(['update']).recover is None
+
+        args = Arguments(['recover', 'rollback'])
+        assert args.action == Actions.RECOVER
+        assert args.recover == Recover.ROLLBACK
+        assert args.categories == ['common', socket.gethostname()]
+        assert Arguments(['recover', 'resume']).recover == Recover.RESUME
+
+        with pytest.raises(SystemExit):
+            Arguments(['recover'])
+        with pytest.raises(SystemExit):
+            Arguments(['recover', 'other'])
+        with pytest.raises(SystemExit):
+            Arguments(['recover', 'rollback', 'resume'])
+
     def test_actions(self):
         # test valid actions
         for act in self.valid_actions:
@@ -2,7 +2,10 @@ import os
 from pathlib import Path
 
 from dotgit.calc_ops import CalcOps
-from dotgit.file_ops import FileOps
+from dotgit.conflicts import ConflictResolver
+from dotgit.enums import Conflict
+from dotgit.file_ops import FileOps, Op
+from dotgit.flists import Manifest
 from dotgit.plugins.plain import PlainPlugin
 
 class TestCalcOps:
@@ -160,6 +163,78 @@ class TestCalcOps:
         assert not (repo / 'cat1' / 'file').is_symlink()
         assert (repo / 'cat2' / 'file').is_symlink()
 
+    def test_update_multiple_candidates_policy(self, tmp_path):
+        home, repo = self.setup_home_repo(tmp_path)
+
+        (repo / 'cat1').mkdir()
+        (repo / 'cat2').mkdir()
+
+        (repo / 'cat1' / 'file').write_text('file1')
+        (repo / 'cat2' / 'file').write_text('file2')
+        os.utime(repo / 'cat1' / 'file', (0, 0))
+
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'),
+                       ConflictResolver(Conflict.NEWEST))
+        calc.update({'file': ['cat1', 'cat2']}).apply()
+
+        assert (repo / 'cat1' / 'file').read_text() == 'file2'
+        assert (repo / 'cat2' / 'file').is_symlink()
+
+    def test_update_multiple_candidates_skip(self, tmp_path):
+        home, repo = self.setup_home_repo(tmp_path)
+
+        (repo / 'cat1').mkdir()
+        (repo / 'cat2').mkdir()
+
+        (repo / 'cat1' / 'file').write_text('file1')
+        (repo / 'cat2' / 'file').write_text('file2')
+
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'),
+                       ConflictResolver(Conflict.SKIP))
+        assert calc.update({'file': ['cat1', 'cat2']}).ops == []
+
+    def test_batch(self, tmp_path, monkeypatch):
+        home, repo = self.setup_home_repo(tmp_path)
+        os.makedirs(repo / 'cat1')
+        for name in ['file1', 'file2', 'file3']:
+            (repo / 'cat1' / name).write_text('repo')
+        (home / 'file1').write_text('home')
+        (home / 'file2').write_text('home')
+
+        prompts = []
+
+        def ask(prompt):
+            prompts.append(prompt)
+            return 'repo'
+        monkeypatch.setattr('builtins.input', ask)
+
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'),
+                       ConflictResolver(Conflict.BATCH))
+        calc.restore({name: ['cat1'] for name in
+                      ['file1', 'file2', 'file3']}).apply()
+
+        # both conflicts are answered with a single prompt
+        assert len(prompts) == 1
+        for name in ['file1', 'file2', 'file3']:
+            assert (home / name).is_symlink()
+            assert (home / name).samefile(repo / 'cat1' / name)
+
+    def test_restore_master_home_policy(self, tmp_path):
+        home, repo = self.setup_home_repo(tmp_path)
+        os.makedirs(repo / 'cat1')
+        (repo / 'cat1' / 'file').write_text('repo')
+        (home / 'file').write_text('home')
+
+        for policy in [Conflict.HOME, Conflict.SKIP, Conflict.NEWEST]:
+            calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'),
+                           ConflictResolver(policy))
+            assert calc.restore({'file': ['cat1']}).ops == []
+
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'),
+                       ConflictResolver(Conflict.REPO))
+        calc.restore({'file': ['cat1']}).apply()
+        assert (home / 'file').samefile(repo / 'cat1' / 'file')
+
     def test_restore_nomaster_nohome(self, tmp_path, caplog):
         home, repo = self.setup_home_repo(tmp_path)
 
@@ -393,6 +468,45 @@ class TestCalcOps:
 
         assert not (repo / 'cat1').is_dir()
 
+    def test_clean_repo_prune(self, tmp_path):
+        home, repo = self.setup_home_repo(tmp_path)
+        os.makedirs(repo / 'cat1' / 'keep')
+        os.makedirs(repo / 'cat1' / 'stale' / 'sub')
+        open(repo / 'cat1' / 'keep' / 'file', 'w').close()
+        open(repo / 'cat1' / 'stale' / 'sub' / 'file', 'w').close()
+        os.makedirs(repo / 'cat2' / 'dir')
+        open(repo / 'cat2' / 'dir' / 'file', 'w').close()
+
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'))
+        fops = calc.clean_repo(Manifest(['cat1/keep/file']))
+
+        # directories without any files in the manifest are removed as a
+        # whole
+        assert all(op == Op.REMOVE for op, path in fops.ops)
+        assert sorted(path for op, path in fops.ops) == ['cat1/stale', 'cat2']
+        fops.apply()
+        assert (repo / 'cat1' / 'keep' / 'file').is_file()
+        assert not (repo / 'cat1' / 'stale').exists()
+        assert not (repo / 'cat2').exists()
+
+    def test_clean_repo_collapse(self, tmp_path):
+        home, repo = self.setup_home_repo(tmp_path)
+        os.makedirs(repo / 'cat1' / 'dir' / 'empty')
+        os.makedirs(repo / 'cat1' / 'dir' / 'sub')
+        open(repo / 'cat1' / 'dir' / 'stale', 'w').close()
+        open(repo / 'cat1' / 'dir' / 'sub' / 'stale', 'w').close()
+        open(repo / 'cat1' / 'file', 'w').close()
+
+        # cat1/dir/sub/file is in the manifest but not in the repo, so all of
+        # cat1/dir becomes empty and is removed with a single op
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'))
+        fops = calc.clean_repo(Manifest(['cat1/file', 'cat1/dir/sub/file']))
+
+        assert fops.ops == [(Op.REMOVE, 'cat1/dir')]
+        fops.apply()
+        assert (repo / 'cat1' / 'file').is_file()
+        assert not (repo / 'cat1' / 'dir').exists()
+
     def test_diff(self, tmp_path):
         home, repo = self.setup_home_repo(tmp_path)
 
@@ -407,3 +521,87 @@ class TestCalcOps:
         (home / 'file2').unlink()
 
         assert calc.diff(['common']) == [f'modified {home / "file"}']
+
+    # sets up a home and repo with files in all the states that update and
+    # restore handle
+    def setup_sync(self, tmp_path):
+        home, repo = self.setup_home_repo(tmp_path)
+        files = {}
+
+        # new file in home
+        (home / 'new').write_text('new')
+        files['new'] = ['common']
+        # file only in the repo
+        os.makedirs(repo / 'common')
+        (repo / 'common' / 'repo').write_text('repo')
+        files['repo'] = ['common']
+        # file linked to the repo
+        (repo / 'common' / 'linked').write_text('linked')
+        os.symlink(repo / 'common' / 'linked', home / 'linked')
+        files['linked'] = ['common']
+        # copy of the file in the repo
+        (repo / 'common' / 'copy').write_text('copy')
+        (home / 'copy').write_text('copy')
+        files['copy'] = ['common']
+        # changed file in home
+        (repo / 'common' / 'changed').write_text('old')
+        (home / 'changed').write_text('changed')
+        files['changed'] = ['common']
+        # file in a slave category that should become the master
+        os.makedirs(repo / 'cat2')
+        (repo / 'cat2' / 'slave').write_text('slave')
+        files['slave'] = ['cat1', 'cat2']
+        # dangling link in home
+        os.symlink(tmp_path / 'nowhere', home / 'dangling')
+        (repo / 'common' / 'dangling').write_text('dangling')
+        files['dangling'] = ['common']
+        # file that doesn't exist anywhere
+        files['missing'] = ['common']
+
+        return home, repo, files
+
+    def tree(self, path):
+        tree = {}
+        for root, dirs, files in os.walk(path):
+            for name in files:
+                fname = os.path.join(root, name)
+                rel = os.path.relpath(fname, path)
+                tree[rel] = (os.path.islink(fname), open(fname).read())
+        return tree
+
+    def test_sync(self, tmp_path):
+        for hard in [False, True]:
+            results = []
+            for name, sync in [('separate', False), ('sync', True)]:
+                home, repo, files = self.setup_sync(tmp_path / f'{name}{hard}')
+                calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data',
+                                                       hard=hard))
+                if sync:
+                    calc.sync(files).apply()
+                else:
+                    calc.update(files).apply()
+                    calc.restore(files).apply()
+                results.append((self.tree(home), self.tree(repo)))
+
+            assert results[0] == results[1]
+            home, repo = results[1]
+            assert home['new'] == (not hard, 'new')
+            assert home['changed'] == (not hard, 'changed')
+            assert home['slave'] == (not hard, 'slave')
+            assert repo['cat1/slave'] == (False, 'slave')
+            assert repo['cat2/slave'] == (True, 'slave')
+            assert 'missing' not in home
+
+    def test_sync_checks(self, tmp_path, monkeypatch):
+        home, repo, files = self.setup_sync(tmp_path)
+        calc = CalcOps(repo, home, PlainPlugin(tmp_path / '.data'))
+
+        # the file that update just moved into the repo should not be checked
+        # again
+        checked = []
+        exists = os.path.exists
+        monkeypatch.setattr(os.path, 'exists',
+                            lambda p: checked.append(str(p)) or exists(p))
+        calc.sync(files)
+        assert str(home / 'new') not in checked
+        assert str(home / 'changed') not in checked
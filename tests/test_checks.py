@@ -62,3 +62,11 @@ class TestSafetyChecks:
 
         assert not safety_checks(repo, home, False)
         assert 'old dotgit repo' in caplog.text
+
+    def test_no_git_command(self, tmp_path, monkeypatch, caplog):
+        home = tmp_path / 'home'
+        repo = tmp_path / 'repo'
+
+        monkeypatch.setenv('PATH', str(tmp_path))
+        assert not safety_checks(repo, home, True)
+        assert '"git" command not found' in caplog.text
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+from dotgit.conflicts import ConflictResolver, Deferred
+from dotgit.enums import Conflict
+
+
+class TestConflictResolver:
+    def setup_files(self, tmp_path):
+        old, new = str(tmp_path / 'old'), str(tmp_path / 'new')
+        with open(old, 'w') as f:
+            f.write('old')
+        with open(new, 'w') as f:
+            f.write('new')
+        os.utime(old, (0, 0))
+        return old, new
+
+    def test_choose(self, tmp_path):
+        old, new = self.setup_files(tmp_path)
+        cands = [new, old]
+
+        assert ConflictResolver(Conflict.NEWEST).choose(
+            'file', cands, old, None) == new
+        assert ConflictResolver(Conflict.REPO).choose(
+            'file', cands, old, None) == old
+        assert ConflictResolver(Conflict.REPO).choose(
+            'file', cands, None, None) == sorted(cands)[0]
+        assert ConflictResolver(Conflict.HOME).choose(
+            'file', cands, old, new) == new
+        assert ConflictResolver(Conflict.SKIP).choose(
+            'file', cands, old, new) is None
+
+    def test_replace(self, tmp_path):
+        old, new = self.setup_files(tmp_path)
+
+        assert ConflictResolver(Conflict.NEWEST).replace(new, old)
+        assert not ConflictResolver(Conflict.NEWEST).replace(old, new)
+        assert ConflictResolver(Conflict.REPO).replace(old, new)
+        assert not ConflictResolver(Conflict.HOME).replace(new, old)
+        assert not ConflictResolver(Conflict.SKIP).replace(new, old)
+
+    def test_fail(self, tmp_path, caplog):
+        old, new = self.setup_files(tmp_path)
+
+        with pytest.raises(RuntimeError):
+            ConflictResolver(Conflict.FAIL).replace(new, old)
+        assert f'{old} already exists' in caplog.text
+
+        with pytest.raises(RuntimeError):
+            ConflictResolver(Conflict.FAIL).choose('file', [old, new], old,
+                                                   None)
+
+    def test_ask(self, tmp_path, monkeypatch):
+        old, new = self.setup_files(tmp_path)
+
+        monkeypatch.setattr('builtins.input', lambda p: '1')
+        assert ConflictResolver().choose('file', [old, new], old,
+                                         None) == new
+
+        monkeypatch.setattr('builtins.input', lambda p: 'n')
+        assert not ConflictResolver().replace(new, old)
+
+    def test_batch(self, tmp_path, monkeypatch):
+        old, new = self.setup_files(tmp_path)
+        resolver = ConflictResolver(Conflict.BATCH)
+
+        with pytest.raises(Deferred):
+            resolver.replace(new, old)
+        with pytest.raises(Deferred):
+            resolver.replace(new, old)
+        with pytest.raises(Deferred):
+            resolver.choose('file', [old, new], old, None)
+        assert len(resolver.pending) == 2
+
+        monkeypatch.setattr('builtins.input', lambda p: 'newest')
+        resolver.ask_pending()
+        assert resolver.pending == []
+        assert resolver.replace(new, old)
+        assert resolver.choose('file', [old, new], old, None) == new
+
+    def test_batch_invalid(self, tmp_path, monkeypatch):
+        old, new = self.setup_files(tmp_path)
+        resolver = ConflictResolver(Conflict.BATCH)
+        with pytest.raises(Deferred):
+            resolver.replace(new, old)
+
+        answers = iter(['batch', 'foo', 'repo'])
+        monkeypatch.setattr('builtins.input', lambda p: next(answers))
+        resolver.ask_pending()
+        assert resolver.replace(new, old)
+
+    def test_batch_eof(self, tmp_path, monkeypatch):
+        old, new = self.setup_files(tmp_path)
+        resolver = ConflictResolver(Conflict.BATCH)
+        with pytest.raises(Deferred):
+            resolver.replace(new, old)
+
+        def eof(prompt):
+            raise EOFError
+        monkeypatch.setattr('builtins.input', eof)
+        with pytest.raises(RuntimeError):
+            resolver.ask_pending()
@@ -0,0 +1,129 @@
+import os
+import errno
+import shutil
+import logging
+
+import pytest
+
+import dotgit.fastcopy as fastcopy
+
+
+class TestFastCopy:
+    @pytest.fixture(autouse=True)
+    def reset(self):
+        fastcopy.stats.clear()
+        fastcopy.unsupported.clear()
+        yield
+        fastcopy.stats.clear()
+        fastcopy.unsupported.clear()
+
+    def unsupported(self, err):
+        def func(*args):
+            raise OSError(err, os.strerror(err))
+        return func
+
+    def test_copyfile(self, tmp_path):
+        (tmp_path / 'source').write_text('hello world')
+        (tmp_path / 'dest').write_text('old content which is longer')
+
+        method = fastcopy.copyfile(tmp_path / 'source', tmp_path / 'dest')
+        assert method in ['reflink', 'copy_file_range', 'copy']
+        assert (tmp_path / 'dest').read_text() == 'hello world'
+        assert fastcopy.stats[method] == 1
+        assert fastcopy.stats[f'{method} bytes'] == len('hello world')
+
+    def test_large(self, tmp_path):
+        data = os.urandom(3 * 1024 * 1024 + 5)
+        (tmp_path / 'source').write_bytes(data)
+        fastcopy.copyfile(tmp_path / 'source', tmp_path / 'dest')
+        assert (tmp_path / 'dest').read_bytes() == data
+
+    def test_fallback(self, tmp_path, monkeypatch):
+        (tmp_path / 'source').write_text('hello world')
+
+        monkeypatch.setattr('fcntl.ioctl', self.unsupported(errno.EOPNOTSUPP))
+        assert fastcopy.copyfile(tmp_path / 'source',
+                                 tmp_path / 'dest') == 'copy_file_range'
+
+        monkeypatch.setattr('os.copy_file_range',
+                            self.unsupported(errno.EXDEV))
+        assert fastcopy.copyfile(tmp_path / 'source',
+                                 tmp_path / 'dest2') == 'copy'
+        assert (tmp_path / 'dest2').read_text() == 'hello world'
+
+        # methods that are not supported by the filesystems are not tried
+        # again
+        def fail(*args):
+            assert False
+        monkeypatch.setattr('fcntl.ioctl', fail)
+        monkeypatch.setattr('os.copy_file_range', fail)
+        assert fastcopy.copyfile(tmp_path / 'source',
+                                 tmp_path / 'dest3') == 'copy'
+
+    def test_fallback_file(self, tmp_path, monkeypatch):
+        (tmp_path / 'source').write_text('hello world')
+
+        # some errors only mean that the method doesn't work for this file
+        monkeypatch.setattr('fcntl.ioctl', self.unsupported(errno.EINVAL))
+        monkeypatch.setattr('os.copy_file_range',
+                            self.unsupported(errno.EINVAL))
+        assert fastcopy.copyfile(tmp_path / 'source',
+                                 tmp_path / 'dest') == 'copy'
+        assert fastcopy.unsupported == set()
+
+    def test_short_copy(self, tmp_path, monkeypatch):
+        data = os.urandom(1024 * 1024)
+        (tmp_path / 'source').write_bytes(data)
+        monkeypatch.setattr('fcntl.ioctl', self.unsupported(errno.EOPNOTSUPP))
+
+        # copy_file_range copies part of the file and then reports the end of
+        # the file
+        def short(fsrc, fdst, count):
+            if os.lseek(fsrc, 0, os.SEEK_CUR) >= 1000:
+                return 0
+            return os.write(fdst, os.read(fsrc, min(count, 1000)))
+        monkeypatch.setattr('os.copy_file_range', short)
+
+        fastcopy.copyfile(tmp_path / 'source', tmp_path / 'dest')
+        assert (tmp_path / 'dest').read_bytes() == data
+
+        # if nothing is copied the file is copied normally
+        monkeypatch.setattr('os.copy_file_range', lambda *args: 0)
+        assert fastcopy.copyfile(tmp_path / 'source',
+                                 tmp_path / 'dest2') == 'copy'
+        assert (tmp_path / 'dest2').read_bytes() == data
+
+    def test_error(self, tmp_path, monkeypatch):
+        (tmp_path / 'source').write_text('hello world')
+
+        monkeypatch.setattr('fcntl.ioctl', self.unsupported(errno.EOPNOTSUPP))
+        monkeypatch.setattr('os.copy_file_range', self.unsupported(errno.EIO))
+        with pytest.raises(OSError):
+            fastcopy.copyfile(tmp_path / 'source', tmp_path / 'dest')
+
+    def test_samefile(self, tmp_path):
+        (tmp_path / 'source').write_text('hello world')
+        with pytest.raises(shutil.SameFileError):
+            fastcopy.copyfile(tmp_path / 'source', tmp_path / 'source')
+        assert (tmp_path / 'source').read_text() == 'hello world'
+
+    def test_copy2(self, tmp_path):
+        (tmp_path / 'source').write_text('hello world')
+        os.chmod(tmp_path / 'source', 0o600)
+        os.utime(tmp_path / 'source', (1000, 1000))
+        (tmp_path / 'dir').mkdir()
+
+        fastcopy.copy2(tmp_path / 'source', tmp_path / 'dir')
+        dest = tmp_path / 'dir' / 'source'
+        assert dest.read_text() == 'hello world'
+        assert os.stat(dest).st_mode & 0o777 == 0o600
+        assert os.stat(dest).st_mtime == 1000
+
+    def test_summary(self, tmp_path, caplog):
+        (tmp_path / 'source').write_text('hello world')
+        method = fastcopy.copyfile(tmp_path / 'source', tmp_path / 'dest')
+
+        with caplog.at_level(logging.INFO):
+            fastcopy.log_summary()
+        assert f'copied 1 files (11 bytes) using {method}' in caplog.text
+        assert not fastcopy.stats
@@ -1,6 +1,11 @@
 import os
+import errno
+import logging
 
-from dotgit.file_ops import FileOps, Op
+import pytest
+
+from dotgit.file_ops import FileOps, Op, move_to_trash
+from dotgit.index import Index
 
 class TestFileOps:
     def test_init(self, tmp_path):
@@ -195,3 +200,165 @@ class TestFileOps:
         assert os.path.isdir(tmp_path / 'copy_dir')
         assert os.path.isfile(tmp_path / 'copy_dir' / 'file')
         assert not os.path.islink(tmp_path / 'copy_dir' / 'file')
+
+    def test_apply_index(self, tmp_path):
+        (tmp_path / 'file').write_text('hello world')
+        (tmp_path / 'delete').write_text('hello world')
+        (tmp_path / 'replace').write_text('old')
+
+        index = Index()
+        digest = index.hash(tmp_path / 'file')
+        index.hash(tmp_path / 'delete')
+        index.hash(tmp_path / 'replace')
+
+        fop = FileOps(tmp_path, index)
+        fop.copy('file', 'copy')
+        fop.move('copy', 'moved')
+        fop.remove('delete')
+        fop.remove('replace')
+        fop.link('file', 'replace')
+        fop.apply()
+
+        assert index.lookup(tmp_path / 'moved') == digest
+        assert str(tmp_path / 'copy') not in index.entries
+        assert str(tmp_path / 'delete') not in index.entries
+        assert str(tmp_path / 'replace') not in index.entries
+
+    def test_apply_touch(self, tmp_path):
+        (tmp_path / 'file').write_text('hello world')
+        (tmp_path / 'delete').write_text('hello world')
+
+        index = Index(root=tmp_path)
+        fop = FileOps(tmp_path, index)
+        fop.copy('file', 'copy')
+        fop.move('copy', 'moved')
+        fop.remove('delete')
+        fop.link('file', 'dir/link')
+        fop.apply()
+
+        assert index.touched_paths() == ['copy', 'delete',
+                                         os.path.join('dir', 'link'), 'moved']
+
+    def test_dependencies(self, tmp_path):
+        os.makedirs(tmp_path / 'dir')
+        fop = FileOps(tmp_path)
+
+        fop.mkdir('dir')
+        fop.copy('file', os.path.join('dir', 'file'))
+        fop.copy('file', 'file2')
+        fop.remove('file3')
+        fop.link('file', 'file3')
+        fop.move('file4', 'file5')
+        fop.remove('dir')
+
+        ops = [fop.resolve_op(op) for op in fop.ops]
+        assert fop.dependencies(ops) == [set(), {0}, set(), set(), {3}, set(),
+                                         {0, 1}]
+
+    def test_apply_parallel(self, tmp_path, caplog):
+        caplog.set_level(logging.INFO)
+
+        os.makedirs(tmp_path / 'dir1')
+        (tmp_path / 'dir1' / 'file1').write_text('hello world')
+        (tmp_path / 'replace').touch()
+
+        fop = FileOps(tmp_path)
+        for i in range(20):
+            fop.copy(os.path.join('dir1', 'file1'),
+                     os.path.join('dir2', f'file{i}'))
+        fop.remove('replace')
+        fop.link(tmp_path / 'dir1' / 'file1', 'replace')
+        fop.move(os.path.join('dir2', 'file0'), 'moved')
+        expected = str(fop).split('\n')
+
+        fop.apply(jobs=4)
+
+        for i in range(1, 20):
+            assert (tmp_path / 'dir2' / f'file{i}').read_text() == \
+                'hello world'
+        assert (tmp_path / 'replace').is_symlink()
+        assert not (tmp_path / 'dir2' / 'file0').exists()
+        assert (tmp_path / 'moved').read_text() == 'hello world'
+
+        # ops should be logged in plan order
+        assert caplog.messages == expected
+
+    def test_apply_parallel_error(self, tmp_path):
+        (tmp_path / 'file').touch()
+
+        fop = FileOps(tmp_path)
+        fop.remove('nonexistent')
+        fop.copy('file', 'copy')
+        fop.link('file', 'copy')
+
+        with pytest.raises(FileNotFoundError):
+            fop.apply(jobs=2)
+
+        # ops depending on a failed op should never run
+        assert not (tmp_path / 'copy').is_symlink()
+
+    def test_apply_batch(self, tmp_path):
+        (tmp_path / 'remove').touch()
+
+        class Plugin:
+            def __init__(self):
+                self.calls = []
+
+            def apply(self, source, dest):
+                self.calls.append([(source, dest)])
+
+            def apply_many(self, pairs):
+                self.calls.append(pairs)
+
+            def batch(self, op):
+                return self.apply_many if op == self.apply else None
+
+            def strify(self, op):
+                return 'Plugin.apply'
+
+        plugin = Plugin()
+        fop = FileOps(tmp_path)
+        fop.plugin(plugin.apply, 'a', 'b')
+        fop.plugin(plugin.apply, 'c', 'd')
+        # reads the output of the first op so can't be in its batch
+        fop.plugin(plugin.apply, 'b', 'e')
+        fop.plugin(plugin.apply, 'f', 'g')
+        fop.remove('remove')
+        fop.plugin(plugin.apply, 'h', 'i')
+
+        ops = [fop.resolve_op(op) for op in fop.ops]
+        assert fop.batches(ops) == [[0, 1], [2, 3], [4], [5]]
+
+        fop.apply()
+
+        def pair(source, dest):
+            return (str(tmp_path / source), str(tmp_path / dest))
+
+        assert plugin.calls == [[pair('a', 'b'), pair('c', 'd')],
+                                [pair('b', 'e'), pair('f', 'g')],
+                                [pair('h', 'i')]]
+        assert not (tmp_path / 'remove').exists()
+
+    def test_move_to_trash(self, tmp_path, monkeypatch):
+        (tmp_path / 'file').write_text('file')
+        (tmp_path / 'dir').mkdir()
+        (tmp_path / 'dir' / 'file').write_text('file')
+        os.symlink('file', tmp_path / 'link')
+
+        # the trash is on another filesystem so the files can't be renamed
+        rename = os.rename
+
+        def cross_device(source, dest):
+            if not str(source).endswith('.part'):
+                raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+            return rename(source, dest)
+        monkeypatch.setattr('os.rename', cross_device)
+
+        for i, name in enumerate(['file', 'dir', 'link']):
+            move_to_trash(str(tmp_path / name), str(tmp_path / f'trash{i}'))
+            assert not os.path.lexists(tmp_path / name)
+            assert not os.path.lexists(tmp_path / f'trash{i}.part')
+
+        assert (tmp_path / 'trash0').read_text() == 'file'
+        assert (tmp_path / 'trash1' / 'file').read_text() == 'file'
+        assert os.readlink(tmp_path / 'trash2') == 'file'
@@ -2,7 +2,7 @@ import os
 import pytest
 import socket
 
-from dotgit.flists import Filelist
+from dotgit.flists import Filelist, Manifest
 
 class TestFilelist:
     def write_flist(self, tmp_path, content):
@@ -121,6 +121,24 @@ class TestFilelist:
         with pytest.raises(RuntimeError):
             flist.activate(['cat2'])
 
+    def test_activate_multiple(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'file2:cat2\nfile:cat1,cat2\n'
+                                 'file3:cat1\nfile4:cat3')
+
+        flist = Filelist(fname)
+        files = flist.activate(['cat1', 'cat2'])
+        # files should be in the order of the filelist
+        assert list(files) == ['file2', 'file', 'file3']
+        assert files['file'] == {'categories': ['cat1', 'cat2'],
+                                 'plugin': 'plain'}
+
+    def test_activate_duplicate_categories(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'file:cat1,cat2\nfile:cat3\n')
+
+        flist = Filelist(fname)
+        with pytest.raises(RuntimeError):
+            flist.activate(['cat1', 'cat3'])
+
     def test_manifest(self, tmp_path):
         fname = self.write_flist(tmp_path,
                                  'group=cat1,cat2\ncfile\nnfile:cat1,cat2\n'
@@ -139,3 +157,150 @@ class TestFilelist:
 
         assert sorted(manifest['encrypt']) == sorted(['cat1/pfile',
                                                       'cat2/pfile'])
+
+        assert type(manifest['plain']) is Manifest
+        assert manifest['plain'].has_dir('cat1')
+        assert not manifest['plain'].has_dir('cat3')
+
+    def test_cache(self, tmp_path, monkeypatch):
+        fname = self.write_flist(tmp_path, 'group=cat1,cat2\nfile:cat1\n'
+                                 'file2:group|encrypt')
+        cache = str(tmp_path / 'data' / 'filelist')
+
+        flist = Filelist(fname, cache=cache)
+        assert os.path.isfile(cache)
+        assert 'filelist' in (tmp_path / 'data' / '.gitignore').read_text()
+
+        # the cached filelist should be used without parsing the filelist
+        # again
+        def parse(self, fname):
+            raise AssertionError('filelist parsed')
+        monkeypatch.setattr(Filelist, 'parse', parse)
+
+        cached = Filelist(fname, cache=cache)
+        assert cached.groups == flist.groups
+        assert cached.files == flist.files
+        assert cached.activate(['cat1']) == flist.activate(['cat1'])
+        assert cached.manifest() == flist.manifest()
+        assert cached.manifest()['encrypt'].has_dir('cat2')
+
+        # touching the filelist without changing it should not cause it to
+        # be parsed again
+        os.utime(fname, ns=(0, 0))
+        Filelist(fname, cache=cache)
+
+    def test_cache_changed(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'file:cat1')
+        cache = str(tmp_path / 'filelist.cache')
+        Filelist(fname, cache=cache)
+
+        with open(fname, 'a') as f:
+            f.write('\nfile2:cat1')
+        assert list(Filelist(fname, cache=cache).activate(['cat1'])) == [
+            'file', 'file2']
+
+    def test_cache_corrupt(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'file:cat1')
+        cache = tmp_path / 'filelist.cache'
+        cache.write_bytes(b'corrupt')
+
+        assert list(Filelist(fname, cache=str(cache)).activate(['cat1'])) == [
+            'file']
+
+    def test_cache_hostname(self, tmp_path, monkeypatch):
+        fname = self.write_flist(tmp_path, 'host=cat1\nfile:cat1')
+        cache = str(tmp_path / 'filelist.cache')
+
+        monkeypatch.setattr('dotgit.info.hostname', 'host')
+        assert Filelist(fname, cache=cache).groups == {'host': ['cat1',
+                                                                'host']}
+        monkeypatch.setattr('dotgit.info.hostname', 'other')
+        assert Filelist(fname, cache=cache).groups == {'host': ['cat1']}
+
+    def test_cache_python(self, tmp_path, monkeypatch):
+        fname = self.write_flist(tmp_path, 'file:cat1')
+        cache = str(tmp_path / 'filelist.cache')
+        Filelist(fname, cache=cache)
+
+        parse = Filelist.parse
+        calls = []
+
+        def count(self, fname):
+            calls.append(fname)
+            return parse(self, fname)
+        monkeypatch.setattr(Filelist, 'parse', count)
+
+        Filelist(fname, cache=cache)
+        assert calls == []
+        # a cache written by another python version is parsed again
+        monkeypatch.setattr(Filelist, 'python_version', [2, 7, 2])
+        assert list(Filelist(fname, cache=cache).activate(['cat1'])) == [
+            'file']
+        assert calls == [fname]
+
+    def test_expand(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'group=cat1,cat2\n'
+                                 '.config/nvim/:cat1,cat2\n'
+                                 '.config/nvim/init.vim:cat3\n'
+                                 '*.conf|encrypt')
+        home, repo = tmp_path / 'home', tmp_path / 'repo'
+        for path in [home / '.config' / 'nvim' / 'init.vim',
+                     home / '.config' / 'nvim' / 'lua' / 'plugins.lua',
+                     repo / 'plain' / 'cat2' / '.config' / 'nvim' / 'old.vim',
+                     repo / 'encrypt' / 'common' / 'a.conf',
+                     home / 'b.conf']:
+            os.makedirs(path.parent, exist_ok=True)
+            path.write_text('file')
+
+        flist = Filelist(fname)
+        assert flist.files == {'.config/nvim/init.vim': [{
+            'categories': ['cat3'], 'plugin': 'plain'}]}
+        flist.expand(str(home), str(repo))
+
+        assert flist.activate(['group']) == {
+            '.config/nvim/lua/plugins.lua': {'categories': ['cat1', 'cat2'],
+                                             'plugin': 'plain'},
+            '.config/nvim/old.vim': {'categories': ['cat1', 'cat2'],
+                                     'plugin': 'plain'}}
+        assert list(flist.activate(['common'])) == ['a.conf', 'b.conf']
+        assert sorted(flist.manifest()['plain']) == [
+            'cat1/.config/nvim/lua/plugins.lua', 'cat1/.config/nvim/old.vim',
+            'cat2/.config/nvim/lua/plugins.lua', 'cat2/.config/nvim/old.vim',
+            'cat3/.config/nvim/init.vim']
+
+    def test_escaped(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'file\\[1\\].conf\nwhat\\?:cat1')
+        flist = Filelist(fname)
+        assert flist.patterns == []
+        assert flist.files == {
+            'file[1].conf': [{'categories': ['common'], 'plugin': 'plain'}],
+            'what?': [{'categories': ['cat1'], 'plugin': 'plain'}]}
+
+    def test_expand_cache(self, tmp_path):
+        fname = self.write_flist(tmp_path, 'dir/')
+        cache = str(tmp_path / 'filelist.cache')
+        os.makedirs(tmp_path / 'home' / 'dir')
+        (tmp_path / 'home' / 'dir' / 'file').write_text('file')
+
+        Filelist(fname, cache=cache)
+        flist = Filelist(fname, cache=cache)
+        flist.expand(str(tmp_path / 'home'), str(tmp_path / 'repo'))
+        assert list(flist.activate(['common'])) == ['dir/file']
+
+
+class TestManifest:
+    def test_contains(self):
+        manifest = Manifest(['common/file', 'common/dir/file'])
+        assert 'common/file' in manifest
+        assert 'common/dir/file' in manifest
+        assert 'common/dir' not in manifest
+        assert sorted(manifest) == ['common/dir/file', 'common/file']
+
+    def test_has_dir(self):
+        manifest = Manifest(['common/.config/nvim/init.vim'])
+        assert manifest.has_dir('common')
+        assert manifest.has_dir('common/.config')
+        assert manifest.has_dir('common/.config/nvim/')
+        assert not manifest.has_dir('common/.config/nvim/init.vim')
+        assert not manifest.has_dir('common/.config/other')
+        assert not manifest.has_dir('cat1')
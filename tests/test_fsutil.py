@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+from dotgit.fsutil import write_atomic
+
+
+class TestFsutil:
+    def test_write_atomic(self, tmp_path):
+        write_atomic(str(tmp_path / 'file'), 'text')
+        assert (tmp_path / 'file').read_text() == 'text'
+        write_atomic(str(tmp_path / 'file'), b'bytes')
+        assert (tmp_path / 'file').read_bytes() == b'bytes'
+        assert os.listdir(tmp_path) == ['file']
+
+    def test_write_atomic_fail(self, tmp_path, monkeypatch):
+        (tmp_path / 'file').write_text('old')
+
+        def replace(src, dest):
+            raise OSError('no space left on device')
+        monkeypatch.setattr('os.replace', replace)
+
+        with pytest.raises(OSError):
+            write_atomic(str(tmp_path / 'file'), 'new')
+        # the file is untouched and the temporary file is removed
+        assert (tmp_path / 'file').read_text() == 'old'
+        assert os.listdir(tmp_path) == ['file']
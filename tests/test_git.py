@@ -3,6 +3,7 @@ import subprocess
 
 import pytest
 
+import dotgit.git
 from dotgit.git import Git, FileState
 
 class TestGit:
@@ -153,3 +154,205 @@ class TestGit:
     def test_diff_no_changes(self, tmp_path):
         git, repo = self.setup_git(tmp_path)
         assert git.diff() == ['no changes']
+
+    def test_parse_status(self):
+        records = [
+            '1 .M N... 100644 100644 100644 abc abc mod file',
+            '2 R. N... 100644 100644 100644 abc abc R100 new name',
+            'old name',
+            'u UU N... 100644 100644 100644 100644 abc abc abc conflict',
+            'u AA N... 000000 100644 100644 100644 abc abc abc both added',
+            'u DU N... 100644 000000 100644 100644 abc abc abc we deleted',
+            '? untracked file',
+            '! ignored',
+        ]
+        assert list(Git.parse_status(records)) == [
+            ('.', 'M', 'mod file', None),
+            ('R', '.', 'new name', 'old name'),
+            ('U', 'U', 'conflict', None),
+            ('A', 'A', 'both added', None),
+            ('D', 'U', 'we deleted', None),
+            ('?', '?', 'untracked file', None),
+        ]
+
+    def test_status_spaces(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        os.makedirs(os.path.join(repo, 'some dir'))
+        self.touch(repo, os.path.join('some dir', 'file name'))
+        assert git.status() == [(FileState.UNTRACKED, 'some dir/file name')]
+
+    def test_status_typechange(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        self.touch(repo, 'file')
+        self.touch(repo, 'target')
+        git.add()
+        git.commit()
+        os.remove(os.path.join(repo, 'file'))
+        os.symlink('target', os.path.join(repo, 'file'))
+        assert git.status(staged=False) == [(FileState.TYPECHANGED, 'file')]
+
+    def test_diff_readonly(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        for f in ['modified', 'deleted', 'renamed']:
+            with open(os.path.join(repo, f), 'w') as fh:
+                fh.write(f'{f} content\n')
+        git.add()
+        git.commit()
+
+        with open(os.path.join(repo, 'modified'), 'a') as f:
+            f.write('more\n')
+        os.remove(os.path.join(repo, 'deleted'))
+        os.rename(os.path.join(repo, 'renamed'), os.path.join(repo, 'new'))
+        git.add(os.path.join('renamed'))
+        git.add(os.path.join('new'))
+        self.touch(repo, 'added')
+        self.touch(repo, 'staged')
+        git.add('staged')
+        os.remove(os.path.join(repo, 'staged'))
+
+        before = git.status()
+        assert git.diff() == ['added added', 'deleted deleted',
+                              'modified modified',
+                              'renamed renamed -> new']
+        # diff should not change git's index
+        assert git.status() == before
+
+    def test_has_changes_untracked_dir(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        os.makedirs(os.path.join(repo, 'dir'))
+        for i in range(100):
+            self.touch(os.path.join(repo, 'dir'), f'file{i}')
+        assert git.has_changes()
+
+    def test_status_cache(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        git = Git(repo, cache=True)
+
+        self.touch(repo, 'file')
+        assert git.status() == [(FileState.UNTRACKED, 'file')]
+        calls = len(git.calls)
+
+        # the status should only be read once
+        self.touch(repo, 'file2')
+        assert git.has_changes()
+        assert git.status() == [(FileState.UNTRACKED, 'file')]
+        assert git.diff() == ['added file']
+        assert len(git.calls) == calls
+
+        # mutating commands should invalidate the cache
+        git.add()
+        assert git.status() == [(FileState.ADDED, f) for f in ['file',
+                                                               'file2']]
+        git.commit()
+        assert not git.has_changes()
+
+    def test_calls(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        git.calls = []
+
+        self.touch(repo, 'file')
+        git.add('file')
+        git.has_changes()
+
+        assert [cmd for cmd, duration in git.calls] == [
+            ['git', 'add', 'file'],
+            ['git', 'status', '--porcelain=v2', '-z', '--untracked-files=all']]
+        assert all(duration >= 0 for cmd, duration in git.calls)
+
+        summary = git.summary().split('\n')
+        assert summary[0].startswith('ran 2 git commands in')
+        assert summary[1].endswith('git add file')
+
+    def test_add_paths(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        self.touch(repo, 'file')
+        self.touch(repo, 'delete')
+        git.add()
+        git.commit()
+
+        os.makedirs(os.path.join(repo, 'dir'))
+        with open(os.path.join(repo, 'dir', 'new'), 'w') as f:
+            f.write('new file\n')
+        self.touch(repo, 'other')
+        self.touch(repo, 'ignored')
+        with open(os.path.join(repo, '.gitignore'), 'w') as f:
+            f.write('ignored\n')
+        os.remove(os.path.join(repo, 'delete'))
+
+        git.add_paths(['dir/new', 'delete', 'gone', 'ignored'])
+        assert git.staged() == [(FileState.ADDED, 'dir/new')]
+        git.add_tracked()
+        assert git.staged() == [(FileState.DELETED, 'delete'),
+                                (FileState.ADDED, 'dir/new')]
+        assert (FileState.UNTRACKED, 'other') in git.status()
+
+    def test_add_tracked(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        self.touch(repo, 'file')
+        git.add()
+        git.commit()
+
+        with open(os.path.join(repo, 'file'), 'w') as f:
+            f.write('changed')
+        self.touch(repo, 'untracked')
+
+        git.add_tracked()
+        assert git.staged() == [(FileState.MODIFIED, 'file')]
+        assert git.status(staged=False) == [(FileState.UNTRACKED,
+                                             'untracked')]
+
+    def test_version(self, monkeypatch):
+        monkeypatch.setattr(dotgit.git, 'version', None)
+        version = dotgit.git.get_version()
+        assert len(version) == 3 and version >= (1, 0, 0)
+
+        def run(*args, **kwargs):
+            raise AssertionError('git should only be run once')
+        monkeypatch.setattr('subprocess.run', run)
+        assert dotgit.git.get_version() == version
+
+    def test_chunks(self):
+        paths = [str(i) * 3 for i in range(10)]
+        chunks = list(dotgit.git.chunks(paths, size=10))
+        assert chunks == [paths[i:i + 2] for i in range(0, 10, 2)]
+        assert list(dotgit.git.chunks(['long' * 10], size=10)) == [
+            ['long' * 10]]
+
+    def test_add_paths_old_git(self, tmp_path, monkeypatch):
+        git, repo = self.setup_git(tmp_path)
+        for fname in ['file', 'delete']:
+            self.touch(repo, fname)
+        git.add()
+        git.commit()
+
+        monkeypatch.setattr(dotgit.git, 'version', (2, 24, 3))
+        monkeypatch.setattr(dotgit.git, 'chunks',
+                            lambda paths: [[p] for p in paths])
+        for fname in ['new', 'new2']:
+            with open(os.path.join(repo, fname), 'w') as f:
+                f.write(fname)
+        os.remove(os.path.join(repo, 'delete'))
+        git.calls = []
+
+        git.add_paths(['new', 'new2'])
+        git.add_tracked()
+        assert git.staged() == [(FileState.DELETED, 'delete'),
+                                (FileState.ADDED, 'new'),
+                                (FileState.ADDED, 'new2')]
+        cmds = [cmd for cmd, duration in git.calls]
+        assert ['git', 'add', '--all', '--', 'new'] in cmds
+        assert ['git', 'add', '--all', '--', 'new2'] in cmds
+        assert not any('--pathspec-from-file=-' in cmd for cmd in cmds)
+
+    def test_staged_renamed(self, tmp_path):
+        git, repo = self.setup_git(tmp_path)
+        with open(os.path.join(repo, 'rename'), 'w') as f:
+            f.write('file content\n')
+        git.add()
+        assert git.staged() == [(FileState.ADDED, 'rename')]
+        git.commit()
+
+        os.rename(os.path.join(repo, 'rename'), os.path.join(repo, 'renamed'))
+        git.add()
+        assert git.staged() == [(FileState.RENAMED, 'rename -> renamed')]
+        assert git.gen_commit_message() == 'Renamed rename -> renamed'
@@ -0,0 +1,105 @@
+import os
+
+from dotgit.globs import (is_pattern, unescape, compile_pattern,
+                          pattern_base, pattern_depth, scan, GlobCache)
+
+
+class TestPatterns:
+    def test_is_pattern(self):
+        assert is_pattern('.config/nvim/')
+        assert is_pattern('.config/*.conf')
+        assert is_pattern('file?')
+        assert is_pattern('file[12]')
+        assert not is_pattern('.config/nvim/init.vim')
+
+    def test_escape(self):
+        assert not is_pattern('file\\[1].conf')
+        assert not is_pattern('what\\?')
+        assert is_pattern('what\\?/*')
+        assert unescape('file\\[1].conf') == 'file[1].conf'
+        assert unescape('dir\\file') == 'dir\\file'
+        assert compile_pattern('a\\*/*').match('a*/b')
+        assert not compile_pattern('a\\*/*').match('ab/b')
+        assert pattern_base('a\\*/*') == 'a*'
+
+    def test_compile(self):
+        assert compile_pattern('*.conf').match('a.conf')
+        assert not compile_pattern('*.conf').match('dir/a.conf')
+        assert compile_pattern('dir/**/*.lua').match('dir/a.lua')
+        assert compile_pattern('dir/**/*.lua').match('dir/a/b/c.lua')
+        assert not compile_pattern('dir/**/*.lua').match('other/a.lua')
+        assert compile_pattern('dir/').match('dir/a/b')
+        assert not compile_pattern('dir/').match('dir2/a')
+        assert compile_pattern('file[!1]').match('file2')
+        assert not compile_pattern('file[!1]').match('file1')
+        assert compile_pattern('a.b?').match('a.bc')
+        assert not compile_pattern('a.b?').match('aabc')
+
+    def test_base_depth(self):
+        assert pattern_base('*.conf') == ''
+        assert pattern_depth('*.conf') == 0
+        assert pattern_base('.config/*/init.vim') == '.config'
+        assert pattern_depth('.config/*/init.vim') == 1
+        assert pattern_base('.config/nvim/') == '.config/nvim'
+        assert pattern_depth('.config/nvim/') is None
+        assert pattern_depth('.config/**/*.lua') is None
+
+
+class TestGlobCache:
+    def setup_tree(self, tmp_path):
+        for path in ['dir/a', 'dir/sub/b', 'dir/sub/deep/c', 'other/d']:
+            os.makedirs(os.path.dirname(tmp_path / path), exist_ok=True)
+            (tmp_path / path).write_text(path)
+        os.symlink(tmp_path / 'other', tmp_path / 'dir' / 'link')
+
+    def test_scan(self, tmp_path):
+        self.setup_tree(tmp_path)
+        files, dirs = scan(str(tmp_path), 'dir')
+        assert sorted(files) == ['dir/a', 'dir/sub/b', 'dir/sub/deep/c']
+        assert sorted(dirs) == ['dir', 'dir/sub', 'dir/sub/deep']
+
+        files, dirs = scan(str(tmp_path), 'dir', depth=1)
+        assert sorted(files) == ['dir/a', 'dir/sub/b']
+
+        files, dirs = scan(str(tmp_path), 'missing')
+        assert files == [] and dirs == {'missing': None}
+
+    def test_expand(self, tmp_path):
+        self.setup_tree(tmp_path)
+        cache = GlobCache()
+        assert cache.expand(str(tmp_path), 'dir/') == [
+            'dir/a', 'dir/sub/b', 'dir/sub/deep/c']
+        assert cache.expand(str(tmp_path), 'dir/*/?') == ['dir/sub/b']
+        assert cache.expand(str(tmp_path), 'dir/**/c') == ['dir/sub/deep/c']
+
+    def test_cache(self, tmp_path, monkeypatch):
+        self.setup_tree(tmp_path)
+        fname = str(tmp_path / 'data' / 'globs')
+        root = str(tmp_path)
+
+        # age the directories so that the cache can trust them
+        for d in ['dir', 'dir/sub', 'dir/sub/deep']:
+            os.utime(tmp_path / d, ns=(0, 0))
+
+        cache = GlobCache(fname)
+        assert cache.expand(root, 'dir/') == ['dir/a', 'dir/sub/b',
+                                              'dir/sub/deep/c']
+        cache.save()
+        assert 'globs' in (tmp_path / 'data' / '.gitignore').read_text()
+
+        # unchanged directories should not be scanned again
+        monkeypatch.setattr('dotgit.globs.scan', lambda *a: ([], {}))
+        assert GlobCache(fname).expand(root, 'dir/') == [
+            'dir/a', 'dir/sub/b', 'dir/sub/deep/c']
+
+        # adding a file changes its directory's mtime
+        monkeypatch.undo()
+        (tmp_path / 'dir' / 'sub' / 'new').write_text('new')
+        assert 'dir/sub/new' in GlobCache(fname).expand(root, 'dir/')
+
+    def test_cache_created(self, tmp_path):
+        cache = GlobCache()
+        assert cache.expand(str(tmp_path), 'dir/') == []
+        os.makedirs(tmp_path / 'dir')
+        (tmp_path / 'dir' / 'file').write_text('file')
+        assert cache.expand(str(tmp_path), 'dir/') == ['dir/file']
@@ -0,0 +1,39 @@
+import hashlib
+
+from dotgit.hashing import (hash_file, hash_files, tag, algorithm_of, LEGACY,
+                            DEFAULT, CHUNK_SIZE)
+
+
+class TestHashing:
+    def test_hash(self, tmp_path):
+        f = tmp_path / 'file'
+        f.write_text('hello world')
+        assert (hash_file(str(f)) == 'b94d27b9934d3e08a52e52d7da7dabfac484efe3'
+                '7a5380ee9088f7ace2efcde9')
+
+    def test_hash_blake2b(self, tmp_path):
+        f = tmp_path / 'file'
+        f.write_text('hello world')
+        digest = hashlib.blake2b(b'hello world').hexdigest()
+        assert hash_file(str(f), 'blake2b') == f'blake2b:{digest}'
+
+    def test_hash_large(self, tmp_path):
+        data = b'0123456789' * CHUNK_SIZE
+        f = tmp_path / 'file'
+        f.write_bytes(data)
+        assert hash_file(str(f), DEFAULT) == tag(
+            DEFAULT, hashlib.new(DEFAULT, data).hexdigest())
+
+    def test_tag(self):
+        assert tag(LEGACY, 'abc') == 'abc'
+        assert tag('blake2b', 'abc') == 'blake2b:abc'
+        assert algorithm_of('abc') == LEGACY
+        assert algorithm_of('blake2b:abc') == 'blake2b'
+
+    def test_hash_files(self, tmp_path):
+        paths = []
+        for i in range(10):
+            (tmp_path / f'file{i}').write_text(f'file {i}')
+            paths.append(str(tmp_path / f'file{i}'))
+
+        assert hash_files(paths, workers=3) == [hash_file(p) for p in paths]
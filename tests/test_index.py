@@ -0,0 +1,168 @@
+import os
+import json
+
+from dotgit.index import Index, gitignore
+from dotgit.hashing import hash_file
+
+
+class TestGitignore:
+    def test_gitignore(self, tmp_path):
+        gitignore(str(tmp_path / 'index'))
+        gitignore(str(tmp_path / 'index'))
+        gitignore(str(tmp_path / 'other'))
+        assert (tmp_path / '.gitignore').read_text() == 'index\nother\n'
+
+
+class TestIndex:
+    def age(self, path, seconds=10):
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 10**9))
+
+    def test_hash(self, tmp_path, monkeypatch):
+        f = tmp_path / 'file'
+        f.write_text('hello world')
+
+        index = Index()
+        assert index.lookup(f) is None
+        digest = hash_file(str(f), 'blake2b')
+        assert index.hash(f) == digest
+        assert index.lookup(f) == digest
+        assert index.lookup(f, 'blake2b') == digest
+        assert index.lookup(f, 'sha256') is None
+
+        # an unchanged file should not be read again
+        monkeypatch.setattr('dotgit.index.hash_file', lambda p, a: 'read')
+        assert index.hash(f) != 'read'
+
+        # a changed file should be re-hashed
+        f.write_text('hello world!')
+        assert index.lookup(f) is None
+        assert index.hash(f) == 'read'
+
+    def test_hash_many(self, tmp_path):
+        paths = []
+        for i in range(4):
+            (tmp_path / f'file{i}').write_text(f'file {i}')
+            paths.append(str(tmp_path / f'file{i}'))
+
+        index = Index()
+        index.hash(paths[0], 'sha256')
+        index.hash_many(paths, 'sha256')
+
+        for path in paths:
+            assert index.lookup(path) == hash_file(path)
+
+    def test_nonexistent(self, tmp_path):
+        index = Index()
+        assert index.lookup(tmp_path / 'file') is None
+        index.record(tmp_path / 'file', 'abc')
+        assert index.entries == {}
+
+    def test_save_load(self, tmp_path):
+        f = tmp_path / 'file'
+        f.write_text('hello world')
+        self.age(f)
+
+        fname = str(tmp_path / 'data' / 'index')
+        index = Index(fname)
+        digest = index.hash(f)
+        index.save()
+
+        assert os.path.isfile(fname)
+        assert 'index' in (tmp_path / 'data' / '.gitignore').read_text()
+        assert Index(fname).lookup(f) == digest
+
+    def test_save_clean(self, tmp_path):
+        fname = str(tmp_path / 'index')
+        Index(fname).save()
+        assert not os.path.exists(fname)
+
+    def test_load_racy(self, tmp_path):
+        f = tmp_path / 'file'
+        f.write_text('hello world')
+
+        fname = str(tmp_path / 'index')
+        index = Index(fname)
+        index.hash(f)
+        index.save()
+
+        # a file modified at the same time the index was written can't be
+        # trusted
+        st = os.stat(fname)
+        os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns))
+        assert Index(fname).lookup(f) is None
+
+    def test_load_corrupt(self, tmp_path, caplog):
+        fname = tmp_path / 'index'
+        fname.write_text('{')
+        assert Index(str(fname)).entries == {}
+        assert 'corrupt index' in caplog.text
+
+    def test_forget_dir(self, tmp_path):
+        (tmp_path / 'dir').mkdir()
+        (tmp_path / 'dir' / 'file').write_text('hello world')
+        (tmp_path / 'file').write_text('hello world')
+
+        index = Index()
+        index.hash(tmp_path / 'dir' / 'file')
+        index.hash(tmp_path / 'file')
+        index.forget(tmp_path / 'dir')
+
+        assert list(index.entries) == [str(tmp_path / 'file')]
+
+    def test_copy_move(self, tmp_path):
+        (tmp_path / 'source').write_text('hello world')
+        (tmp_path / 'dest').write_text('hello world')
+
+        index = Index()
+        digest = index.hash(tmp_path / 'source')
+        index.copy(tmp_path / 'source', tmp_path / 'dest')
+        assert index.lookup(tmp_path / 'dest') == digest
+
+        os.rename(tmp_path / 'dest', tmp_path / 'moved')
+        index.move(tmp_path / 'dest', tmp_path / 'moved')
+        assert index.lookup(tmp_path / 'moved') == digest
+        assert str(tmp_path / 'dest') not in index.entries
+
+    def test_format(self, tmp_path):
+        f = tmp_path / 'file'
+        f.write_text('hello world')
+        self.age(f)
+
+        fname = tmp_path / 'index'
+        index = Index(str(fname))
+        index.hash(f)
+        index.save()
+
+        st = os.stat(f)
+        entries = json.loads(fname.read_text())
+        assert entries == {str(f): [st.st_dev, st.st_ino, st.st_size,
+                                    st.st_mtime_ns,
+                                    hash_file(str(f), 'blake2b')]}
+
+    def test_touch(self, tmp_path):
+        fname = str(tmp_path / 'repo' / '.plugins' / 'index')
+        index = Index(fname, root=tmp_path / 'repo')
+        assert index.touched_paths() is None
+
+        index.touch(tmp_path / 'repo' / 'dir' / 'file')
+        index.touch(tmp_path / 'repo' / 'dir' / 'file')
+        index.touch(tmp_path / 'outside')
+        assert index.touched_paths() is None
+        assert 'touched' in (tmp_path / 'repo' / '.plugins' /
+                             '.gitignore').read_text()
+
+        # the journal is only complete once it was cleared
+        index.clear_touched()
+        assert index.touched_paths() == []
+        index.touch(tmp_path / 'repo' / 'file')
+        index.touch(tmp_path / 'repo' / 'dir' / 'file')
+
+        index = Index(fname, root=tmp_path / 'repo')
+        assert index.touched_paths() == [os.path.join('dir', 'file'), 'file']
+
+    def test_touch_no_root(self, tmp_path):
+        index = Index(str(tmp_path / 'index'))
+        index.touch(tmp_path / 'file')
+        assert index.touched_paths() == []
+        assert not (tmp_path / 'touched').exists()
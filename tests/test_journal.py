@@ -0,0 +1,162 @@
+import os
+
+import pytest
+
+from dotgit.journal import Journal
+from dotgit.file_ops import FileOps
+from dotgit.index import Index
+from dotgit.plugins.plain import PlainPlugin
+
+
+class TestJournal:
+    def setup_journal(self, tmp_path):
+        home, repo = tmp_path / 'home', tmp_path / 'repo'
+        os.makedirs(home)
+        os.makedirs(repo / '.plugins')
+        plugins = {'plain': PlainPlugin(str(tmp_path / 'data'))}
+        journal = Journal(str(repo / '.plugins'), home, repo, plugins,
+                          Index(), {'hard': False})
+        return journal, home, repo, plugins
+
+    # a restore-like set of ops: the file in home is replaced by a link to
+    # the repo and a new directory is linked as well
+    def setup_ops(self, home, repo, plugins):
+        (repo / 'file').write_text('repo')
+        (repo / 'file2').write_text('repo2')
+        (home / 'file').write_text('home')
+
+        fops = FileOps(repo)
+        fops.remove(str(home / 'file'))
+        fops.plugin(plugins['plain'].remove, str(repo / 'file'),
+                    str(home / 'file'))
+        fops.plugin(plugins['plain'].remove, str(repo / 'file2'),
+                    str(home / 'dir' / 'file2'))
+        fops.move(str(repo / 'file2'), str(repo / 'moved'))
+        return fops
+
+    # makes the op at index fail
+    def fail_at(self, monkeypatch, fail):
+        execute_op = FileOps.execute_op
+        calls = []
+
+        def wrapper(self, op, path, trash=None):
+            calls.append(op)
+            if len(calls) == fail + 1:
+                raise OSError('no space left on device')
+            return execute_op(self, op, path, trash)
+
+        monkeypatch.setattr(FileOps, 'execute_op', wrapper)
+
+    def test_commit(self, tmp_path):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+
+        fops.apply(journal=journal)
+        assert not journal.exists()
+        assert not os.path.exists(journal.trash_dir)
+        assert (home / 'file').is_symlink()
+        assert (home / 'dir' / 'file2').is_symlink()
+        assert (repo / 'moved').read_text() == 'repo2'
+
+        # the journal and the trash are never committed
+        ignored = (repo / '.plugins' / '.gitignore').read_text().split()
+        assert 'journal' in ignored and 'trash' in ignored
+
+    def test_begin(self, tmp_path, monkeypatch):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+        self.fail_at(monkeypatch, 2)
+
+        with pytest.raises(OSError):
+            fops.apply(journal=journal)
+        assert journal.exists()
+
+        other = Journal(str(repo / '.plugins'), home, repo, plugins)
+        assert other.load() == {'hard': False}
+        assert other.started == {0, 1, 2}
+        assert other.done == {0, 1}
+        # the removed file is in the trash
+        assert (repo / '.plugins' / 'trash' / '0').read_text() == 'home'
+
+    def test_rollback(self, tmp_path, monkeypatch):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+        self.fail_at(monkeypatch, 4)
+
+        with pytest.raises(OSError):
+            fops.apply(journal=journal)
+        assert (home / 'dir' / 'file2').is_symlink()
+
+        journal.load()
+        journal.rollback()
+        assert not journal.exists()
+        assert not (home / 'file').is_symlink()
+        assert (home / 'file').read_text() == 'home'
+        assert not (home / 'dir').exists()
+        assert (repo / 'file2').read_text() == 'repo2'
+
+    def test_rollback_move(self, tmp_path, monkeypatch):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+        fops.remove(str(repo / 'file'))
+        self.fail_at(monkeypatch, 5)
+
+        with pytest.raises(OSError):
+            fops.apply(journal=journal)
+        assert (repo / 'moved').exists()
+
+        journal.load()
+        journal.rollback()
+        assert (repo / 'file2').read_text() == 'repo2'
+        assert not (repo / 'moved').exists()
+        assert (repo / 'file').read_text() == 'repo'
+
+    def test_resume(self, tmp_path, monkeypatch):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+        self.fail_at(monkeypatch, 3)
+
+        with pytest.raises(OSError):
+            fops.apply(journal=journal)
+        monkeypatch.undo()
+
+        # a half-written file from the failed op is replaced
+        (home / 'dir' / 'file2').write_text('partial')
+
+        journal.load()
+        journal.resume()
+        assert not journal.exists()
+        assert (home / 'file').is_symlink()
+        assert (home / 'dir' / 'file2').is_symlink()
+        assert (repo / 'moved').read_text() == 'repo2'
+
+    def test_resume_completed(self, tmp_path):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+        journal.begin(fops)
+
+        # dotgit was killed after the file was moved into the trash but
+        # before the op was recorded as done
+        ops = [fops.resolve_op(op) for op in fops.ops]
+        journal.record('start', 0)
+        fops.run_op(*ops[0], trash=journal.trash(0))
+        journal.close()
+
+        journal.load()
+        assert journal.completed(0, *ops[0])
+        journal.resume()
+        assert (home / 'file').is_symlink()
+        assert (repo / 'moved').read_text() == 'repo2'
+
+    def test_load_truncated(self, tmp_path):
+        journal, home, repo, plugins = self.setup_journal(tmp_path)
+        fops = self.setup_ops(home, repo, plugins)
+        journal.begin(fops)
+        journal.record('start', 0)
+        journal.record('done', 0)
+        os.write(journal.fd, b'sta')
+        journal.close()
+
+        journal.load()
+        assert journal.started == {0}
+        assert journal.done == {0}
@@ -1,6 +1,13 @@
 import os
+import sys
+import json
+import socket
+import subprocess
+
+import pytest
+
 from dotgit.__main__ import main
-from dotgit.git import Git
+from dotgit.git import Git, FileState
 
 
 class TestMain:
@@ -36,6 +43,11 @@ class TestMain:
         assert (repo / '.git').is_dir()
         assert (repo / 'filelist').is_file()
         assert git.last_commit() == 'Added filelist'
+        # the files dotgit keeps in .plugins are never committed
+        ignored = (repo / '.plugins' / '.gitignore').read_text().split()
+        assert sorted(ignored) == ['filelist', 'globs', 'index', 'journal',
+                                   'touched', 'trash']
+        assert not git.has_changes()
 
         assert 'existing git repo' not in caplog.text
         assert 'existing filelist' not in caplog.text
@@ -129,6 +141,116 @@ class TestMain:
         assert not (home / 'file').is_symlink()
         assert (home / 'file').read_text() == data
 
+    def test_hard_symlinks(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('data')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        assert (home / 'file').is_symlink()
+
+        # cleaning in hard mode leaves symlinks alone, restoring turns them
+        # into copies
+        assert main(args=['--hard', 'clean'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert (home / 'file').is_symlink()
+        assert main(args=['--hard', 'restore'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert not (home / 'file').is_symlink()
+        assert (home / 'file').read_text() == 'data'
+
+    def test_restore_hardlink(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('data')
+
+        assert main(args=['--link-mode=hard', 'update'],
+                    cwd=str(repo), home=str(home)) == 0
+        assert not (home / 'file').is_symlink()
+        repo_file = repo / 'dotfiles' / 'plain' / 'common' / 'file'
+        assert (home / 'file').samefile(repo_file)
+
+        os.remove(home / 'file')
+        assert main(args=['--link-mode=hard', 'restore'],
+                    cwd=str(repo), home=str(home)) == 0
+        assert (home / 'file').samefile(repo_file)
+
+        # a copy (e.g. after a git checkout) is turned back into a hardlink
+        os.remove(repo_file)
+        repo_file.write_text('data')
+        assert main(args=['--link-mode=hard', 'update'],
+                    cwd=str(repo), home=str(home)) == 0
+        assert (home / 'file').samefile(repo_file)
+
+        assert main(args=['--link-mode=hard', 'clean'],
+                    cwd=str(repo), home=str(home)) == 0
+        assert not (home / 'file').exists()
+        assert repo_file.read_text() == 'data'
+
+    def test_update_broken_hardlink(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('data')
+        assert main(args=['--link-mode=hard', 'update'],
+                    cwd=str(repo), home=str(home)) == 0
+
+        # a pull replaced the file in the repo with a newer version
+        repo_file = repo / 'dotfiles' / 'plain' / 'common' / 'file'
+        os.remove(repo_file)
+        repo_file.write_text('pulled')
+
+        assert main(args=['--link-mode=hard', '--conflict=fail', 'update'],
+                    cwd=str(repo), home=str(home)) == 1
+        assert repo_file.read_text() == 'pulled'
+        assert (home / 'file').read_text() == 'data'
+
+        assert main(args=['--link-mode=hard', '--conflict=fail', 'restore'],
+                    cwd=str(repo), home=str(home)) == 1
+        assert (home / 'file').read_text() == 'data'
+
+        assert main(args=['--link-mode=hard', '--conflict=repo', 'update'],
+                    cwd=str(repo), home=str(home)) == 0
+        assert repo_file.read_text() == 'pulled'
+        assert (home / 'file').samefile(repo_file)
+
+    def setup_plugin_conflicts(self, tmp_path, monkeypatch):
+        home, repo = self.setup_repo(tmp_path, 'file\nsecret|encrypt')
+        monkeypatch.setattr('getpass.getpass', lambda prompt: 'password')
+        (home / 'file').write_text('file')
+        (home / 'secret').write_text('secret')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        return home, repo
+
+    def test_conflict_fail_second_plugin(self, tmp_path, monkeypatch):
+        home, repo = self.setup_plugin_conflicts(tmp_path, monkeypatch)
+
+        # only the encrypted file conflicts
+        os.remove(home / 'file')
+        (home / 'secret').write_text('changed')
+
+        assert main(args=['--conflict=fail', 'restore'], cwd=str(repo),
+                    home=str(home)) == 1
+        # nothing should be changed, not even the files of the plain plugin
+        assert not (home / 'file').exists()
+        assert (home / 'secret').read_text() == 'changed'
+
+    def test_conflict_batch_plugins(self, tmp_path, monkeypatch):
+        home, repo = self.setup_plugin_conflicts(tmp_path, monkeypatch)
+
+        os.remove(home / 'file')
+        (home / 'file').write_text('changed')
+        (home / 'secret').write_text('changed')
+
+        answers = []
+
+        def ask(prompt):
+            answers.append(prompt)
+            return 'repo'
+        monkeypatch.setattr('builtins.input', ask)
+
+        assert main(args=['--conflict=batch', 'restore'], cwd=str(repo),
+                    home=str(home)) == 0
+        # the conflicts of both plugins are asked about at once
+        assert len(answers) == 1
+        assert (home / 'file').read_text() == 'file'
+        assert (home / 'secret').read_text() == 'secret'
+
     def test_clean(self, tmp_path):
         home, repo = self.setup_repo(tmp_path, 'file')
         open(home / 'file', 'w').close()
@@ -167,7 +289,6 @@ class TestMain:
         home, repo = self.setup_repo(tmp_path, 'file')
         git = Git(str(repo))
         open(home / 'file', 'w').close()
-        os.makedirs(repo / '.plugins')
         open(repo / '.plugins' / 'plugf', 'w').close()
 
         assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
@@ -176,6 +297,64 @@ class TestMain:
         assert 'filelist' in git.last_commit()
         assert 'plugf' not in git.last_commit()
 
+    def test_commit_symlinked(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file\nother')
+        git = Git(str(repo))
+        (home / 'file').write_text('file')
+        (home / 'other').write_text('other')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+
+        # the files are changed through their symlinks, dotgit doesn't touch
+        # them
+        (home / 'file').write_text('changed')
+        os.remove(repo / 'dotfiles' / 'plain' / 'common' / 'other')
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+        assert git.last_commit() == ('Modified dotfiles/plain/common/file, '
+                                     'deleted dotfiles/plain/common/other')
+        assert not git.has_changes()
+
+    def test_commit_tracked(self, tmp_path, caplog):
+        home, repo = self.setup_repo(tmp_path, '')
+        git = Git(str(repo))
+        (repo / 'README').write_text('readme')
+        git.add('README')
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+        assert (repo / '.plugins' / 'touched').read_text() == ''
+
+        # files edited by hand aren't touched by dotgit
+        (repo / 'README').write_text('changed')
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+        assert 'no changes detected' not in caplog.text
+        assert git.last_commit() == 'Modified readme'
+        assert not git.has_changes()
+
+    def test_commit_plugin_data(self, tmp_path, caplog):
+        home, repo = self.setup_repo(tmp_path, '')
+        git = Git(str(repo))
+        open(repo / '.plugins' / 'plugf', 'w').close()
+
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+        assert 'no changes detected' not in caplog.text
+        assert git.last_commit() == 'Updated plugin data'
+        assert not git.staged()
+
+    def test_commit_touched(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file\nfile2')
+        git = Git(str(repo))
+        (home / 'file').write_text('file')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+        assert (repo / '.plugins' / 'touched').read_text() == ''
+
+        # only the files changed by dotgit (and tracked files) are staged
+        (home / 'file2').write_text('file2')
+        (repo / 'stray').write_text('stray')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        assert main(args=['commit'], cwd=str(repo), home=str(home)) == 0
+        assert 'file2' in git.last_commit()
+        assert git.status() == [(FileState.UNTRACKED, 'stray')]
+
     def test_diff(self, tmp_path, capsys):
         home, repo = self.setup_repo(tmp_path, 'file\nfile2')
         (home / 'file').touch()
@@ -220,3 +399,335 @@ class TestMain:
 
         assert main(args=['passwd'], cwd=str(repo), home=str(home)) == 0
         assert repo_file.read_text() != txt
+
+    def test_index(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('hello world')
+
+        assert main(args=['update', '--hard'],
+                    cwd=str(repo), home=str(home)) == 0
+        # the files are only hashed once they are compared
+        assert main(args=['update', '--hard'],
+                    cwd=str(repo), home=str(home)) == 0
+        assert (repo / '.plugins' / 'index').is_file()
+        assert 'index' in (repo / '.plugins' / '.gitignore').read_text()
+
+    def test_glob(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, '.config/app/\n*.conf')
+        os.makedirs(home / '.config' / 'app' / 'sub')
+        (home / '.config' / 'app' / 'config').write_text('config')
+        (home / '.config' / 'app' / 'sub' / 'file').write_text('file')
+        (home / 'a.conf').write_text('conf')
+
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        for path in ['.config/app/config', '.config/app/sub/file', 'a.conf']:
+            assert (home / path).is_symlink()
+            assert (repo / 'dotfiles' / 'plain' / 'common' / path).is_file()
+        assert (repo / '.plugins' / 'globs').is_file()
+
+        # new files are picked up on the next run
+        (home / '.config' / 'app' / 'new').write_text('new')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        assert (home / '.config' / 'app' / 'new').is_symlink()
+
+        # the files are restored from the repo
+        for path in ['.config/app/config', '.config/app/sub/file', 'a.conf']:
+            (home / path).unlink()
+        assert main(args=['restore'], cwd=str(repo), home=str(home)) == 0
+        assert (home / '.config' / 'app' / 'config').read_text() == 'config'
+        assert (home / 'a.conf').is_symlink()
+
+    def test_jobs(self, tmp_path):
+        files = [f'dir/file{i}' for i in range(10)]
+        home, repo = self.setup_repo(tmp_path, '\n'.join(files))
+        (home / 'dir').mkdir()
+        for f in files:
+            (home / f).write_text(f)
+
+        assert main(args=['update', '-j', '4'],
+                    cwd=str(repo), home=str(home)) == 0
+        for f in files:
+            assert (home / f).is_symlink()
+            assert (home / f).read_text() == f
+
+    @pytest.mark.skipif(sys.platform != 'linux',
+                        reason='inotify is only available on Linux')
+    def test_watch(self, tmp_path, monkeypatch):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        git = Git(str(repo))
+        (home / 'file').write_text('file')
+
+        def changes():
+            # a new file is added to the filelist
+            (repo / 'filelist').write_text('file\nfile2')
+            (home / 'file2').write_text('file2')
+            yield {str(repo / 'filelist')}
+            # a file is changed in the repo
+            (repo / 'dotfiles' / 'plain' / 'common' / 'file2').write_text(
+                'changed')
+            yield {'file2'}
+            raise KeyboardInterrupt
+
+        waits = changes()
+        monkeypatch.setattr('dotgit.watch.Watcher.wait',
+                            lambda self: next(waits))
+
+        assert main(args=['--auto-commit', 'watch'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert (home / 'file').is_symlink()
+        assert (home / 'file2').is_symlink()
+        assert (home / 'file2').read_text() == 'changed'
+        assert 'file2' in git.last_commit()
+        assert not git.has_changes()
+
+    @pytest.mark.skipif(sys.platform != 'linux',
+                        reason='inotify is only available on Linux')
+    def test_watch_encrypt(self, tmp_path, monkeypatch):
+        home, repo = self.setup_repo(tmp_path, 'file|encrypt')
+        git = Git(str(repo))
+        monkeypatch.setattr('getpass.getpass', lambda prompt: 'password')
+        (home / 'file').write_text('file')
+
+        def changes():
+            (home / 'file').write_text('changed')
+            yield {'file'}
+            raise KeyboardInterrupt
+
+        waits = changes()
+        monkeypatch.setattr('dotgit.watch.Watcher.wait',
+                            lambda self: next(waits))
+
+        assert main(args=['--auto-commit', 'watch'], cwd=str(repo),
+                    home=str(home)) == 0
+
+        # the plugin's data should be committed along with the changed file
+        data = repo / '.plugins' / 'encrypt'
+        assert not (data / 'pending').exists()
+        hashes = git.run(['git', 'show', 'HEAD:.plugins/encrypt/hashes'])
+        assert json.loads(hashes) == json.loads((data / 'hashes').read_text())
+        assert not git.has_changes()
+
+        assert main(args=['restore'], cwd=str(repo), home=str(home)) == 0
+        assert (home / 'file').read_text() == 'changed'
+
+    def test_profile(self, tmp_path, capsys):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('file')
+
+        assert main(args=['--profile', 'update'], cwd=str(repo),
+                    home=str(home)) == 0
+        err = capsys.readouterr().err
+        assert 'plan' in err and 'apply (plain)' in err
+
+        assert main(args=['--profile-json', 'profile.json', 'commit'],
+                    cwd=str(repo), home=str(home)) == 0
+        report = json.loads((repo / 'profile.json').read_text())
+        assert 'git' in report['phases']
+        assert report['counts']['subprocess git'] > 0
+
+    def test_trace(self, tmp_path):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('file')
+
+        assert main(args=['--trace', 'trace.json', '--hard', 'update'],
+                    cwd=str(repo), home=str(home)) == 0
+        events = json.loads((repo / 'trace.json').read_text())['traceEvents']
+        cats = set(e.get('cat') for e in events)
+        assert {'dotgit', 'phase', 'calc_ops', 'file_ops'} <= cats
+
+        plans = [e for e in events if e.get('cat') == 'calc_ops']
+        assert [e['name'] for e in plans] == ['file']
+        ops = {e['args']['op']: e['args'] for e in events if
+               e.get('cat') == 'file_ops'}
+        assert ops['MKDIR']['path'] == str(repo / 'dotfiles' / 'plain' /
+                                           'common')
+        assert ops['PlainPlugin.apply']['bytes'] == len('file')
+
+        assert main(args=['--trace', 'trace.json', 'commit'], cwd=str(repo),
+                    home=str(home)) == 0
+        events = json.loads((repo / 'trace.json').read_text())['traceEvents']
+        assert 'git commit' in [e['name'] for e in events if
+                                e.get('cat') == 'git']
+
+    def test_lazy_imports(self):
+        # trivial runs should only import what is needed to parse the
+        # arguments
+        code = ('import sys, dotgit.__main__; '
+                'print(" ".join(sorted(sys.modules)))')
+        modules = subprocess.run([sys.executable, '-c', code], check=True,
+                                 stdout=subprocess.PIPE).stdout.decode()
+        modules = modules.split()
+
+        for module in ['subprocess', 'socket', 'hashlib', 'json', 'tempfile',
+                       'ctypes', 'dotgit.flists', 'dotgit.git',
+                       'dotgit.plugins.plain', 'dotgit.plugins.encrypt']:
+            assert module not in modules
+
+    def test_hostname(self):
+        import dotgit.info as info
+        assert info.get_hostname() == socket.gethostname()
+        assert info.hostname == socket.gethostname()
+
+    # runs an update that fails halfway
+    def interrupted_update(self, tmp_path, monkeypatch):
+        from dotgit.file_ops import FileOps
+
+        home, repo = self.setup_repo(tmp_path, 'file\nfile2\nfile3')
+        for name in ['file', 'file2', 'file3']:
+            (home / name).write_text(name)
+
+        execute_op = FileOps.execute_op
+        calls = []
+
+        def fail(self, op, path, trash=None):
+            calls.append(op)
+            if len(calls) == 6:
+                raise OSError('no space left on device')
+            return execute_op(self, op, path, trash)
+        monkeypatch.setattr(FileOps, 'execute_op', fail)
+
+        with pytest.raises(OSError):
+            main(args=['update'], cwd=str(repo), home=str(home))
+        monkeypatch.undo()
+        assert (repo / '.plugins' / 'journal').is_file()
+
+        return home, repo
+
+    def test_recover_rollback(self, tmp_path, monkeypatch, caplog):
+        home, repo = self.interrupted_update(tmp_path, monkeypatch)
+
+        # nothing else can be changed until the run is recovered
+        assert main(args=['restore'], cwd=str(repo), home=str(home)) == 1
+        assert 'dotgit recover' in caplog.text
+
+        assert main(args=['recover', 'rollback'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert not (repo / '.plugins' / 'journal').exists()
+        for name in ['file', 'file2', 'file3']:
+            assert not (home / name).is_symlink()
+            assert (home / name).read_text() == name
+        assert not (repo / 'dotfiles' / 'plain' / 'common').exists()
+
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        assert (home / 'file3').is_symlink()
+
+    def test_recover_resume(self, tmp_path, monkeypatch):
+        home, repo = self.interrupted_update(tmp_path, monkeypatch)
+
+        assert main(args=['recover', 'resume'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert not (repo / '.plugins' / 'journal').exists()
+        assert not (repo / '.plugins' / 'trash').exists()
+        for name in ['file', 'file2', 'file3']:
+            assert (home / name).is_symlink()
+            assert (home / name).read_text() == name
+
+        # there is nothing left to recover
+        assert main(args=['recover', 'resume'], cwd=str(repo),
+                    home=str(home)) == 0
+
+    # runs an update of an encrypted file that fails at op fail
+    def interrupted_encrypt(self, tmp_path, monkeypatch, fail):
+        from dotgit.file_ops import FileOps
+
+        home, repo = self.setup_repo(tmp_path, 'secret|encrypt')
+        monkeypatch.setattr('getpass.getpass', lambda prompt: 'password')
+        (home / 'secret').write_text('secret')
+
+        execute_op = FileOps.execute_op
+        calls = []
+
+        def fail_op(self, op, path, trash=None):
+            calls.append(op)
+            if len(calls) == fail + 1:
+                raise OSError('no space left on device')
+            return execute_op(self, op, path, trash)
+        monkeypatch.setattr(FileOps, 'execute_op', fail_op)
+
+        with pytest.raises(OSError):
+            main(args=['update'], cwd=str(repo), home=str(home))
+        monkeypatch.setattr(FileOps, 'execute_op', execute_op)
+        return home, repo
+
+    def test_recover_rollback_encrypt(self, tmp_path, monkeypatch):
+        # fails while decrypting the file after it was encrypted
+        home, repo = self.interrupted_encrypt(tmp_path, monkeypatch, 3)
+        data = repo / '.plugins' / 'encrypt'
+        assert 'common/secret' in (data / 'pending').read_text()
+
+        assert main(args=['recover', 'rollback'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert (home / 'secret').read_text() == 'secret'
+        assert not (repo / 'dotfiles' / 'encrypt' / 'common').exists()
+        assert json.loads((data / 'hashes').read_text()) == {}
+        assert json.loads((data / 'modes').read_text()) == {}
+        assert not (data / 'pending').exists()
+
+    def test_recover_resume_encrypt(self, tmp_path, monkeypatch):
+        # fails before the file is encrypted
+        home, repo = self.interrupted_encrypt(tmp_path, monkeypatch, 1)
+        data = repo / '.plugins' / 'encrypt'
+
+        assert main(args=['recover', 'resume'], cwd=str(repo),
+                    home=str(home)) == 0
+        assert (home / 'secret').read_text() == 'secret'
+        assert list(json.loads((data / 'hashes').read_text())) == [
+            'common/secret']
+        assert not (data / 'pending').exists()
+        assert main(args=['restore'], cwd=str(repo), home=str(home)) == 0
+
+    def test_plan_apply(self, tmp_path, capsys):
+        home, repo = self.setup_repo(tmp_path, 'file\ndir/file2')
+        (home / 'file').write_text('file')
+        (home / 'dir').mkdir()
+        (home / 'dir' / 'file2').write_text('file2')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+
+        # plan the restore for a fresh home
+        fresh = tmp_path / 'fresh'
+        fresh.mkdir()
+        assert main(args=['plan', '-o', 'plan.json'], cwd=str(repo),
+                    home=str(fresh)) == 0
+        assert (repo / 'plan.json').is_file()
+        assert not (fresh / 'file').exists()
+
+        assert main(args=['apply', 'plan.json'], cwd=str(repo),
+                    home=str(fresh)) == 0
+        assert (fresh / 'file').is_symlink()
+        assert (fresh / 'file').read_text() == 'file'
+        assert (fresh / 'dir' / 'file2').read_text() == 'file2'
+
+    def test_plan_stale(self, tmp_path, caplog):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('file')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+
+        fresh = tmp_path / 'fresh'
+        fresh.mkdir()
+        assert main(args=['plan', '--hard', '-o', 'plan.json'],
+                    cwd=str(repo), home=str(fresh)) == 0
+
+        # the plan should be rejected if any of its files changed
+        (fresh / 'file').write_text('changed')
+        assert main(args=['apply', 'plan.json'], cwd=str(repo),
+                    home=str(fresh)) == 1
+        assert 'changed since the plan was made' in caplog.text
+        assert (fresh / 'file').read_text() == 'changed'
+
+        (fresh / 'file').unlink()
+        assert main(args=['apply', 'plan.json'], cwd=str(repo),
+                    home=str(fresh)) == 0
+        # the plan's settings are used
+        assert not (fresh / 'file').is_symlink()
+        assert (fresh / 'file').read_text() == 'file'
+
+    def test_plan_stdout(self, tmp_path, capsys):
+        home, repo = self.setup_repo(tmp_path, 'file')
+        (home / 'file').write_text('file')
+        assert main(args=['update'], cwd=str(repo), home=str(home)) == 0
+        capsys.readouterr()
+
+        assert main(args=['plan'], cwd=str(repo), home=str(home)) == 0
+        plan = json.loads(capsys.readouterr().out)
+        # the file is already linked so there is nothing to do
+        assert plan['ops'] == []
@@ -0,0 +1,132 @@
+import os
+import json
+
+import pytest
+
+from dotgit.plan import Plan
+from dotgit.file_ops import FileOps, Op
+from dotgit.index import Index
+from dotgit.plugins.plain import PlainPlugin
+
+
+class TestPlan:
+    def setup_plan(self, tmp_path, home='home'):
+        home, repo = tmp_path / home, tmp_path / 'repo'
+        os.makedirs(home, exist_ok=True)
+        os.makedirs(repo, exist_ok=True)
+        plugins = {'plain': PlainPlugin(str(tmp_path / 'data'))}
+        return Plan(home, repo, plugins, Index()), home, repo, plugins
+
+    def test_encode(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        assert plan.encode(home / 'file') == ['home', 'file']
+        assert plan.encode(repo / 'dir' / 'file') == ['repo', 'dir/file']
+        assert plan.encode('/etc/file') == ['abs', '/etc/file']
+        assert plan.decode(['home', 'file']) == str(home / 'file')
+
+    def test_decode_outside(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        assert plan.decode(['repo', 'dir/../file']) == str(repo / 'file')
+        for path in [['abs', '/etc/file'], ['home', '../file'],
+                     ['repo', '../repo2/file'], ['home', '/etc/file'],
+                     ['other', 'file']]:
+            with pytest.raises(RuntimeError):
+                plan.decode(path)
+
+    def test_fingerprint(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        (repo / 'file').write_text('file')
+        os.symlink(repo / 'file', home / 'link')
+
+        assert plan.fingerprint(home / 'missing') is None
+        assert plan.fingerprint(home) == ['dir']
+        assert plan.fingerprint(home / 'link') == ['link', 'repo', 'file']
+        assert plan.fingerprint(repo / 'file') == [
+            'file', 4, plan.index.hash(repo / 'file')]
+
+    def test_roundtrip(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        (repo / 'file').write_text('file')
+
+        fops = FileOps(str(repo))
+        fops.plugin(plugins['plain'].remove, 'file', str(home / 'file'))
+        fops.link('file', str(home / 'dir' / 'link'))
+        plan.add(fops)
+        content = plan.dump(hard=False)
+
+        # the plan can be applied to a different home
+        other, home, repo, plugins = self.setup_plan(tmp_path, 'other')
+        assert other.load(content) == {'hard': False}
+        fops = other.fileops()
+        assert fops.ops == [
+            (plugins['plain'].remove, (str(repo / 'file'),
+                                       str(home / 'file'))),
+            (Op.MKDIR, str(home / 'dir')),
+            (Op.LINK, (str(repo / 'file'), str(home / 'dir' / 'link')))]
+
+        fops.apply()
+        assert (home / 'file').is_symlink()
+        assert (home / 'dir' / 'link').read_text() == 'file'
+
+    def test_stale(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        (repo / 'file').write_text('file')
+
+        fops = FileOps(str(repo))
+        fops.link('file', str(home / 'link'))
+        fops.remove(str(home / 'link'))
+        plan.add(fops)
+        # only the first use of a path is checked
+        assert [op['pre'] for op in plan.ops] == [
+            [[0, plan.fingerprint(repo / 'file')], [1, None]], []]
+        assert plan.stale() == []
+
+        (repo / 'file').write_text('changed')
+        assert plan.stale() == [str(repo / 'file')]
+        with pytest.raises(RuntimeError):
+            plan.fileops()
+
+    def test_load_invalid(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        with pytest.raises(RuntimeError):
+            plan.load('{')
+        with pytest.raises(RuntimeError):
+            plan.load('{"version": 0}')
+
+        fops = FileOps(str(repo))
+        fops.remove(str(home / 'file'))
+        plan.add(fops)
+        content = json.loads(plan.dump(hard=False))
+        op = content['ops'][0]
+        invalid = [{'version': content['version'], 'settings': {}},
+                   {'version': content['version'], 'ops': []}]
+        for data in [{'settings': []}, {'ops': [{}]},
+                     {'ops': [dict(op, paths=[['abs', '/']])]},
+                     {'ops': [dict(op, paths=[['home', '../..']])]},
+                     {'ops': [dict(op, pre=[[1, None]])]},
+                     {'ops': [dict(op, op=1)]}, {'ops': [dict(op, op='x')]}]:
+            invalid.append(dict(content, **data))
+        for data in invalid:
+            with pytest.raises(RuntimeError):
+                plan.load(json.dumps(data))
+        assert plan.load(json.dumps(content)) == {'hard': False}
+
+    def test_invalid_op(self, tmp_path):
+        plan, home, repo, plugins = self.setup_plan(tmp_path)
+        fops = FileOps(str(repo))
+        fops.plugin(plugins['plain'].remove, 'file', str(home / 'file'))
+        plan.add(fops, fingerprint=False)
+
+        plan.ops[0]['plugin'] = ['plain', 'samefile']
+        with pytest.raises(RuntimeError):
+            plan.fileops()
+        plan.ops[0]['plugin'] = ['other', 'remove']
+        with pytest.raises(RuntimeError):
+            plan.fileops()
+        plan.ops[0]['op'] = 'chmod'
+        with pytest.raises(RuntimeError):
+            plan.fileops()
+
+        plan.ops[0]['op'] = 'plugin'
+        plan.ops[0]['plugin'] = ['plain', 'apply']
+        assert plan.fileops().ops[0][0] == plugins['plain'].apply
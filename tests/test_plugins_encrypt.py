@@ -1,4 +1,12 @@
-from dotgit.plugins.encrypt import GPG, hash_file, EncryptPlugin
+import time
+import threading
+import subprocess
+
+import pytest
+
+from dotgit.hashing import hash_file
+from dotgit.file_ops import FileOps
+from dotgit.plugins.encrypt import GPG, EncryptPlugin
 
 
 class TestGPG:
@@ -39,6 +47,12 @@ class TestEncryptPlugin:
         plugin = EncryptPlugin(data_dir=str(tmp_path))
 
         assert plugin.hashes == {'foo': 'abcde'}
+        # existing repos should keep using their hash algorithm
+        assert plugin.algorithm == 'sha256'
+
+    def test_setup_new(self, tmp_path):
+        plugin = EncryptPlugin(data_dir=str(tmp_path))
+        assert plugin.algorithm == 'blake2b'
 
     def test_apply(self, tmp_path, monkeypatch):
         sfile = tmp_path / 'source'
@@ -64,9 +78,60 @@ class TestEncryptPlugin:
 
         assert tfile.read_text() == txt
         assert rel_path in plugin.hashes
-        assert plugin.hashes[rel_path] == hash_file(str(sfile))
+        assert plugin.hashes[rel_path] == hash_file(str(sfile),
+                                                    plugin.algorithm)
         assert plugin.modes[rel_path] == 0o600
+        assert (tmp_path / "pending").read_text()
+
+        plugin.save_data()
         assert (tmp_path / "hashes").read_text()
+        assert not (tmp_path / "pending").exists()
+
+    def test_pending(self, tmp_path, monkeypatch):
+        sfile = tmp_path / 'source'
+        sfile.write_text('hello world')
+
+        monkeypatch.setattr('getpass.getpass', lambda prompt: 'password123')
+        plugin = EncryptPlugin(data_dir=str(tmp_path), repo_dir=str(tmp_path))
+        plugin.apply(str(sfile), str(tmp_path / 'dest'))
+        plugin.apply(str(sfile), str(tmp_path / 'dest2'))
+        assert not (tmp_path / 'hashes').exists()
+
+        # simulate a crash while writing the pending changes
+        with open(tmp_path / 'pending', 'a') as f:
+            f.write('["dest3", "ab')
+
+        # pending changes should be recovered when the data is loaded
+        plugin = EncryptPlugin(data_dir=str(tmp_path), repo_dir=str(tmp_path))
+        assert set(plugin.hashes) == {'dest', 'dest2'}
+        assert set(plugin.modes) == {'dest', 'dest2'}
+        assert (tmp_path / 'hashes').exists()
+        assert not (tmp_path / 'pending').exists()
+        assert 'pending' in (tmp_path / '.gitignore').read_text()
+
+    def test_checkpoint(self, tmp_path, monkeypatch):
+        sfile = tmp_path / 'source'
+        sfile.write_text('hello world')
+
+        monkeypatch.setattr('getpass.getpass', lambda prompt: 'password123')
+        plugin = EncryptPlugin(data_dir=str(tmp_path), repo_dir=str(tmp_path))
+        plugin.checkpoint = 2
+
+        plugin.apply(str(sfile), str(tmp_path / 'dest'))
+        assert not (tmp_path / 'hashes').exists()
+        plugin.apply(str(sfile), str(tmp_path / 'dest2'))
+        assert 'dest2' in (tmp_path / 'hashes').read_text()
+        assert not (tmp_path / 'pending').exists()
+
+    def test_remove_unknown_mode(self, tmp_path, monkeypatch):
+        password = 'password123'
+        (tmp_path / 'source').write_text('hello world')
+        GPG(password).encrypt(str(tmp_path / 'source'), str(tmp_path / 'enc'))
+
+        monkeypatch.setattr('getpass.getpass', lambda prompt: password)
+        plugin = EncryptPlugin(data_dir=str(tmp_path), repo_dir=str(tmp_path))
+        plugin.remove(str(tmp_path / 'enc'), str(tmp_path / 'dest'))
+        assert (tmp_path / 'dest').read_text() == 'hello world'
 
     def test_remove(self, tmp_path, monkeypatch):
         txt = 'hello world'
@@ -177,3 +242,116 @@ class TestEncryptPlugin:
 
         assert rel_path not in (tmp_path / 'hashes').read_text()
         assert rel_path not in (tmp_path / 'modes').read_text()
+
+
+class TestGPGPool:
+    def test_run_many(self, tmp_path):
+        gpg = GPG('password123', workers=2)
+
+        files = []
+        for i in range(5):
+            (tmp_path / f'input{i}').write_text(f'file {i}')
+            files.append((str(tmp_path / f'input{i}'),
+                          str(tmp_path / f'output{i}')))
+
+        gpg.encrypt_many(files)
+        gpg.decrypt_many([(o, i + '.dec') for i, o in files])
+
+        for i in range(5):
+            assert (tmp_path / f'input{i}.dec').read_text() == f'file {i}'
+
+    def test_workers(self, monkeypatch):
+        gpg = GPG('password123', workers=2)
+
+        lock = threading.Lock()
+        active = []
+        peak = []
+
+        def run(cmd, **kwargs):
+            with lock:
+                active.append(cmd)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.remove(cmd)
+            return subprocess.CompletedProcess(cmd, 0, stdout=b'out')
+
+        monkeypatch.setattr('subprocess.run', run)
+
+        cmds = [['gpg', str(i)] for i in range(6)]
+        assert gpg.run_many(cmds) == ['out'] * 6
+        assert max(peak) == 2
+
+    def test_run_many_error(self):
+        gpg = GPG('password123')
+        with pytest.raises(subprocess.CalledProcessError):
+            gpg.run_many([['gpg', '--decrypt', '/non/existent/file']])
+
+    def test_samefile_cache(self, tmp_path, monkeypatch):
+        password = 'password123'
+
+        sfile = tmp_path / 'source'
+        dfile = tmp_path / 'dest'
+        rfile = tmp_path / 'restored'
+        sfile.write_text('hello world')
+
+        monkeypatch.setattr('getpass.getpass', lambda prompt: password)
+        plugin = EncryptPlugin(data_dir=str(tmp_path), repo_dir=str(tmp_path))
+        plugin.apply(str(sfile), str(dfile))
+        plugin.remove(str(dfile), str(rfile))
+
+        reads = []
+        monkeypatch.setattr('dotgit.index.hash_file',
+                            lambda p, a: reads.append(p) or 'read')
+
+        # neither the encrypted nor the decrypted file should be read again
+        assert plugin.samefile(str(dfile), str(sfile))
+        assert plugin.samefile(str(dfile), str(rfile))
+        assert reads == []
+
+        # a changed file should be read again
+        rfile.write_text('hello world!')
+        assert not plugin.samefile(str(dfile), str(rfile))
+        assert reads == [str(rfile)]
+
+    def test_batch(self, tmp_path, monkeypatch):
+        password = 'password123'
+        monkeypatch.setattr('getpass.getpass', lambda prompt: password)
+
+        home, repo = tmp_path / 'home', tmp_path / 'repo'
+        home.mkdir()
+        repo.mkdir()
+        for i in range(5):
+            (home / f'file{i}').write_text(f'file {i}')
+            (home / f'file{i}').chmod(0o600)
+
+        plugin = EncryptPlugin(data_dir=str(tmp_path / 'data'),
+                               repo_dir=str(repo))
+
+        batches = []
+        run_many = GPG.run_many
+
+        def record(self, cmds):
+            batches.append(len(cmds))
+            return run_many(self, cmds)
+
+        monkeypatch.setattr(GPG, 'run_many', record)
+
+        fop = FileOps(str(tmp_path))
+        for i in range(5):
+            fop.plugin(plugin.apply, f'home/file{i}', f'repo/file{i}')
+        fop.apply()
+
+        fop = FileOps(str(tmp_path))
+        for i in range(5):
+            (home / f'file{i}').unlink()
+            fop.plugin(plugin.remove, f'repo/file{i}', f'home/file{i}')
+        fop.apply()
+
+        # all the files should be encrypted and decrypted in one batch each
+        assert batches == [5, 5]
+        for i in range(5):
+            assert (home / f'file{i}').read_text() == f'file {i}'
+            assert (home / f'file{i}').stat().st_mode & 0o777 == 0o600
+            assert plugin.hashes[f'file{i}'] == hash_file(
+                str(home / f'file{i}'), plugin.algorithm)
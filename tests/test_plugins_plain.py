@@ -1,4 +1,5 @@
 import os
+import errno
 
 from dotgit.plugins.plain import PlainPlugin
 
@@ -61,3 +62,90 @@ class TestPlainPlugin:
         assert not (tmp_path / 'file').is_symlink()
         assert not (tmp_path / 'file2').is_symlink()
         assert not (tmp_path / 'file').samefile(tmp_path / 'file2')
+
+    def test_hard_samefile(self, tmp_path, monkeypatch):
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True)
+
+        (tmp_path / 'file').write_text('hello world')
+        (tmp_path / 'file2').write_text('hello world')
+        (tmp_path / 'file3').write_text('hello there')
+
+        assert plugin.samefile(tmp_path / 'file', tmp_path / 'file2')
+        assert not plugin.samefile(tmp_path / 'file', tmp_path / 'file3')
+
+        # unchanged files should not be read again
+        monkeypatch.setattr('dotgit.index.hash_file', lambda p, a: p)
+        assert plugin.samefile(tmp_path / 'file', tmp_path / 'file2')
+
+    def test_hard_samefile_symlink(self, tmp_path):
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True)
+
+        (tmp_path / 'file').write_text('hello world')
+        os.symlink(tmp_path / 'file', tmp_path / 'link')
+
+        assert not plugin.samefile(tmp_path / 'file', tmp_path / 'link')
+        assert not plugin.samecontent(tmp_path / 'file', tmp_path / 'link')
+
+    def test_hardlink_mode(self, tmp_path):
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True, hardlink=True)
+
+        (tmp_path / 'file').write_text('hello world')
+        plugin.remove(tmp_path / 'file', tmp_path / 'file2')
+        plugin.apply(tmp_path / 'file', tmp_path / 'file3')
+
+        for name in ['file2', 'file3']:
+            assert not (tmp_path / name).is_symlink()
+            assert (tmp_path / 'file').samefile(tmp_path / name)
+        assert (tmp_path / 'file').stat().st_nlink == 3
+
+    def test_hardlink_samefile(self, tmp_path, monkeypatch):
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True, hardlink=True)
+
+        (tmp_path / 'file').write_text('hello world')
+        (tmp_path / 'copy').write_text('hello world')
+        os.link(tmp_path / 'file', tmp_path / 'link')
+        os.symlink(tmp_path / 'file', tmp_path / 'symlink')
+
+        # the files should never be read
+        monkeypatch.setattr('dotgit.index.hash_file', None)
+
+        assert plugin.samefile(tmp_path / 'file', tmp_path / 'link')
+        assert not plugin.samefile(tmp_path / 'file', tmp_path / 'copy')
+        assert not plugin.samefile(tmp_path / 'file', tmp_path / 'symlink')
+        assert not plugin.samefile(tmp_path / 'file', tmp_path / 'nofile')
+        assert not plugin.samefile(tmp_path / 'nofile', tmp_path / 'file')
+
+    def test_broken_link(self, tmp_path):
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True, hardlink=True)
+
+        (tmp_path / 'file').write_text('hello world')
+        (tmp_path / 'copy').write_text('hello world')
+        (tmp_path / 'other').write_text('hello there')
+        os.link(tmp_path / 'file', tmp_path / 'link')
+        os.symlink(tmp_path / 'file', tmp_path / 'symlink')
+
+        assert plugin.broken_link(tmp_path / 'file', tmp_path / 'copy')
+        assert plugin.samecontent(tmp_path / 'file', tmp_path / 'copy')
+        assert plugin.broken_link(tmp_path / 'file', tmp_path / 'other')
+        assert not plugin.samecontent(tmp_path / 'file', tmp_path / 'other')
+        assert not plugin.broken_link(tmp_path / 'file', tmp_path / 'link')
+        assert not plugin.broken_link(tmp_path / 'file', tmp_path / 'symlink')
+        assert not plugin.broken_link(tmp_path / 'file', tmp_path / 'nofile')
+
+        # copies are never linked in the other modes
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True)
+        assert not plugin.broken_link(tmp_path / 'file', tmp_path / 'copy')
+
+    def test_hardlink_fallback(self, tmp_path, monkeypatch, caplog):
+        plugin = PlainPlugin(str(tmp_path / 'data'), hard=True, hardlink=True)
+
+        def link(source, dest):
+            raise OSError(errno.EXDEV, os.strerror(errno.EXDEV))
+        monkeypatch.setattr('os.link', link)
+
+        (tmp_path / 'file').write_text('hello world')
+        plugin.remove(tmp_path / 'file', tmp_path / 'file2')
+
+        assert not (tmp_path / 'file').samefile(tmp_path / 'file2')
+        assert (tmp_path / 'file2').read_text() == 'hello world'
+        assert 'copying it instead' in caplog.text
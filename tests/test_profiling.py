@@ -0,0 +1,60 @@
+import os
+import subprocess
+
+import dotgit.profiling as profiling
+from dotgit.profiling import Profiler, phase
+from dotgit.hashing import hash_file
+import dotgit.index
+import dotgit.tracing
+
+
+class TestProfiler:
+    def test_disabled(self):
+        assert profiling.active is None
+        assert phase('phase') is dotgit.tracing.NULL_SPAN
+
+    def test_phases(self):
+        profiler = Profiler()
+        profiler.install()
+        try:
+            with phase('outer'):
+                with phase('inner'):
+                    pass
+                with phase('inner'):
+                    pass
+        finally:
+            profiler.uninstall()
+
+        report = profiler.report()
+        assert list(report['phases']) == ['inner', 'outer']
+        assert report['phases']['inner']['calls'] == 2
+        assert report['phases']['outer']['wall'] >= \
+            report['phases']['inner']['wall']
+        assert 'inner' in profiler.table()
+
+    def test_counts(self, tmp_path):
+        (tmp_path / 'file').write_text('hello world')
+        stat, popen = os.stat, subprocess.Popen
+
+        profiler = Profiler()
+        profiler.install()
+        try:
+            os.path.isfile(tmp_path / 'file')
+            os.path.realpath(tmp_path / 'file')
+            dotgit.index.hash_file(str(tmp_path / 'file'))
+            subprocess.run(['true'])
+        finally:
+            profiler.uninstall()
+
+        counts = profiler.report()['counts']
+        assert counts['stat'] >= 1
+        assert counts['realpath'] == 1
+        assert counts['hash'] == 1
+        assert counts['subprocess true'] == 1
+        assert counts['subprocess true seconds'] > 0
+
+        # everything is restored once profiling stops
+        assert os.stat is stat
+        assert subprocess.Popen is popen
+        assert dotgit.index.hash_file is hash_file
+        assert profiling.active is None
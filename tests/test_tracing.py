@@ -0,0 +1,86 @@
+import json
+import threading
+
+import dotgit.tracing as tracing
+from dotgit.tracing import Tracer, span, event
+from dotgit.plugins.encrypt import GPG
+
+
+class TestTracer:
+    def trace(self, func):
+        tracer = Tracer()
+        tracer.install()
+        try:
+            func()
+        finally:
+            tracer.uninstall()
+        return json.loads(tracer.json())['traceEvents']
+
+    def test_disabled(self):
+        assert tracing.active is None
+        assert span('span', 'cat') is tracing.NULL_SPAN
+        with span('span', 'cat') as value:
+            assert value is None
+
+    # python versions before 3.8 don't have native thread ids
+    def test_thread_ident(self, monkeypatch):
+        monkeypatch.setattr(tracing, 'get_thread_id', threading.get_ident)
+
+        def func():
+            with span('span', 'cat'):
+                pass
+
+        events = self.trace(func)
+        assert [e['tid'] for e in events] == [threading.get_ident()] * 2
+
+    def test_spans(self):
+        def func():
+            with span('outer', 'cat', path='file', bytes=None):
+                with span('inner', 'cat'):
+                    pass
+            event('event', 'other', tracing.active.start, size=3)
+
+        events = self.trace(func)
+        spans = {e['name']: e for e in events if e['ph'] == 'X'}
+        assert set(spans) == {'outer', 'inner', 'event'}
+
+        outer, inner = spans['outer'], spans['inner']
+        assert outer['args'] == {'path': 'file'}
+        assert outer['ts'] <= inner['ts']
+        assert inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+        assert spans['event']['args'] == {'size': 3}
+
+        # the thread of the spans is named
+        meta = [e for e in events if e['ph'] == 'M']
+        assert meta == [{'name': 'thread_name', 'ph': 'M',
+                         'pid': outer['pid'], 'tid': outer['tid'],
+                         'args': {'name': 'MainThread'}}]
+
+    def test_threads(self):
+        def work():
+            with span('span', 'cat'):
+                pass
+
+        def func():
+            threads = [threading.Thread(target=work) for _ in range(2)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        events = self.trace(func)
+        assert len([e for e in events if e['ph'] == 'X']) == 2
+        assert len([e for e in events if e['ph'] == 'M']) == 2
+
+    def test_gpg(self, tmp_path):
+        (tmp_path / 'file').write_text('hello world')
+
+        def func():
+            GPG('password').encrypt(str(tmp_path / 'file'),
+                                    str(tmp_path / 'file.gpg'))
+
+        events = self.trace(func)
+        gpg = [e for e in events if e.get('cat') == 'gpg']
+        assert len(gpg) == 1
+        assert gpg[0]['name'] == 'gpg --symmetric'
+        assert gpg[0]['args']['bytes'] == len('hello world')
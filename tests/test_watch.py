@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+from dotgit.watch import Watcher
+
+# the watcher uses inotify which is only available on Linux
+pytestmark = pytest.mark.skipif(sys.platform != 'linux',
+                                reason='inotify is only available on Linux')
+
+
+class TestWatcher:
+    def test_file(self, tmp_path):
+        (tmp_path / 'dir').mkdir()
+        watcher = Watcher({str(tmp_path / 'dir' / 'file'): 'file',
+                           str(tmp_path / 'other'): 'other'})
+
+        (tmp_path / 'dir' / 'file').write_text('file')
+        (tmp_path / 'dir' / 'unwatched').write_text('unwatched')
+        assert watcher.wait(delay=0.01) == {'file'}
+
+        (tmp_path / 'other').write_text('other')
+        os.remove(tmp_path / 'dir' / 'file')
+        assert watcher.wait(delay=0.01) == {'file', 'other'}
+        watcher.close()
+
+    def test_replace(self, tmp_path):
+        (tmp_path / 'file').write_text('file')
+        watcher = Watcher({str(tmp_path / 'file'): 'file'})
+
+        # editors often save by renaming a new file over the old one
+        (tmp_path / 'new').write_text('new')
+        os.rename(tmp_path / 'new', tmp_path / 'file')
+        assert watcher.wait(delay=0.01) == {'file'}
+        watcher.close()
+
+    def test_missing_dir(self, tmp_path):
+        watcher = Watcher({str(tmp_path / 'dir' / 'sub' / 'file'): 'file'})
+
+        # the directories are created after the watch was started
+        os.makedirs(tmp_path / 'dir' / 'sub')
+        assert watcher.wait(delay=0.01) == {'file'}
+
+        (tmp_path / 'dir' / 'sub' / 'file').write_text('file')
+        assert watcher.wait(delay=0.01) == {'file'}
+        watcher.close()
+
+    def test_update(self, tmp_path):
+        watcher = Watcher({str(tmp_path / 'file'): 'file'})
+        watcher.update({str(tmp_path / 'other'): 'other'})
+
+        (tmp_path / 'file').write_text('file')
+        (tmp_path / 'other').write_text('other')
+        assert watcher.wait(delay=0.01) == {'other'}
+        watcher.close()